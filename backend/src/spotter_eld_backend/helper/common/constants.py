@@ -38,3 +38,47 @@ class LocationType:
     TRIP_END = "TRIP_END"
     BREAK_REST = "BREAK_REST"
     FUELING = "FUELING"
+
+
+class DutyStatus:
+    OFF_DUTY = "Off Duty"
+    SLEEPER_BERTH = "Sleeper Berth"
+    DRIVING = "Driving"
+    ON_DUTY = "On Duty"
+
+
+class TransitionOutcome:
+    DONE = "DONE"
+    NOT_FOUND = "NOT_FOUND"
+    NOT_ONGOING = "NOT_ONGOING"
+    ALREADY_DONE = "ALREADY_DONE"
+    OUT_OF_ORDER = "OUT_OF_ORDER"
+
+
+class DutyEventType:
+    TRIP_START = "TRIP_START"
+    PICKUP_START = "PICKUP_START"
+    PICKUP_END = "PICKUP_END"
+    DROP_OFF_START = "DROP_OFF_START"
+    DROP_OFF_END = "DROP_OFF_END"
+    TRIP_END = "TRIP_END"
+    REST_BREAK_START = "REST_BREAK_START"
+    REST_BREAK_END = "REST_BREAK_END"
+    FUELING = "FUELING"
+    DUTY_STATUS = "DUTY_STATUS"
+
+
+class SyncEventType:
+    START_PICKUP = "START_PICKUP"
+    END_PICKUP = "END_PICKUP"
+    START_DROP_OFF = "START_DROP_OFF"
+    END_DROP_OFF = "END_DROP_OFF"
+    START_REST_BREAK = "START_REST_BREAK"
+    END_REST_BREAK = "END_REST_BREAK"
+    FUELING = "FUELING"
+
+
+class SyncEventStatus:
+    APPLIED = "APPLIED"
+    DUPLICATE = "DUPLICATE"
+    REJECTED = "REJECTED"
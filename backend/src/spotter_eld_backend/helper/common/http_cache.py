@@ -0,0 +1,37 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def build_etag(*parts):
+    """
+    Builds a strong ETag out of the given parts (versions, timestamps, ids, ...)
+    """
+    digest = hashlib.md5("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return '"%s"' % digest
+
+
+def get_not_modified_response(request, etag, last_modified):
+    """
+    Evaluates the If-None-Match / If-Modified-Since headers of the request
+    @param etag: current ETag of the resource
+    @param last_modified: epoch seconds of the last change of the resource
+    @return: a 304 response if the client copy is still valid, None otherwise
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if response is not None:
+        set_validators(response, etag, last_modified)
+
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    """
+    Adds the ETag / Last-Modified headers and forces clients to revalidate before using their copy
+    """
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(int(last_modified))
+    patch_cache_control(response, private=True, no_cache=True)
+
+    return response
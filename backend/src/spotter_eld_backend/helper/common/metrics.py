@@ -0,0 +1,238 @@
+"""
+Per-request performance metrics (see helper.middleware.metrics_middleware).
+
+A sampled request gets a RequestStats in a context variable: the database execute wrapper and the redis connection
+classes of helper.redis.redis_tools add their calls and time to it, the threads of the async ORM inherit the context.
+Outside a sampled request they only read the context variable.
+
+The stats of the finished requests are aggregated per view into in-process histograms. Every process pushes a
+snapshot of its histograms to redis (see helper.redis.metrics_dao) so that /metrics renders the sum of the workers in
+the Prometheus text format. The histograms only count the sampled requests.
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+
+import redis
+import redis.asyncio.connection
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+PREFIX = "spotter_"
+
+
+class RequestStats:
+    __slots__ = ("db_queries", "db_seconds", "redis_calls", "redis_seconds")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.redis_calls = 0
+        self.redis_seconds = 0.0
+
+
+_current = ContextVar("request_stats", default=None)
+
+
+def start():
+    """
+    @return: (RequestStats of the request, token to pass to stop)
+    """
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+# ===============================================================================
+# Database and redis accounting
+# ===============================================================================
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def install_db_wrapper(connection, **kwargs):
+    """
+    connection_created receiver, the connections of a thread keep their wrappers when they reconnect
+    """
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+class RedisConnection(redis.Connection):
+    """
+    Counts a call per command or pipeline sent, the time is spent sending it and reading the replies
+    """
+
+    def send_packed_command(self, command, check_health=True):
+        stats = _current.get()
+        if stats is None:
+            return super().send_packed_command(command, check_health)
+
+        started = time.perf_counter()
+        try:
+            return super().send_packed_command(command, check_health)
+        finally:
+            stats.redis_calls += 1
+            stats.redis_seconds += time.perf_counter() - started
+
+    def read_response(self, *args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return super().read_response(*args, **kwargs)
+
+        started = time.perf_counter()
+        try:
+            return super().read_response(*args, **kwargs)
+        finally:
+            stats.redis_seconds += time.perf_counter() - started
+
+
+class AsyncRedisConnection(redis.asyncio.connection.Connection):
+    """
+    RedisConnection of the asyncio client
+    """
+
+    async def send_packed_command(self, command, check_health=True):
+        stats = _current.get()
+        if stats is None:
+            return await super().send_packed_command(command, check_health)
+
+        started = time.perf_counter()
+        try:
+            return await super().send_packed_command(command, check_health)
+        finally:
+            stats.redis_calls += 1
+            stats.redis_seconds += time.perf_counter() - started
+
+    async def read_response(self, *args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return await super().read_response(*args, **kwargs)
+
+        started = time.perf_counter()
+        try:
+            return await super().read_response(*args, **kwargs)
+        finally:
+            stats.redis_seconds += time.perf_counter() - started
+
+
+# ===============================================================================
+# Histograms
+# ===============================================================================
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, label_names):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.label_names = label_names
+        # label values -> [count per bucket, the last one is +Inf], sum
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+
+_VIEW = ("view",)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Wall time of the view and the middlewares, until the response is returned.",
+    DURATION_BUCKETS, ("view", "method", "status"),
+)
+DB_QUERIES = Histogram("http_request_db_queries", "Database queries of a request.", COUNT_BUCKETS, _VIEW)
+DB_DURATION = Histogram("http_request_db_seconds", "Time spent in the database queries of a request.",
+                        DURATION_BUCKETS, _VIEW)
+REDIS_CALLS = Histogram("http_request_redis_calls", "Redis commands and pipelines sent by a request.",
+                        COUNT_BUCKETS, _VIEW)
+REDIS_DURATION = Histogram("http_request_redis_seconds", "Time spent in the redis calls of a request.",
+                           DURATION_BUCKETS, _VIEW)
+RESPONSE_SIZE = Histogram("http_response_size_bytes", "Body size of the responses, the streams are not counted.",
+                          SIZE_BUCKETS, _VIEW)
+HISTOGRAMS = (REQUEST_DURATION, DB_QUERIES, DB_DURATION, REDIS_CALLS, REDIS_DURATION, RESPONSE_SIZE)
+
+_lock = threading.Lock()
+
+
+def record(view, method, status_code, duration, stats, response_size):
+    """
+    @param response_size: body size in bytes, None for a streaming response
+    """
+    with _lock:
+        REQUEST_DURATION.observe((view, method, str(status_code)), duration)
+        DB_QUERIES.observe((view,), stats.db_queries)
+        DB_DURATION.observe((view,), stats.db_seconds)
+        REDIS_CALLS.observe((view,), stats.redis_calls)
+        REDIS_DURATION.observe((view,), stats.redis_seconds)
+        if response_size is not None:
+            RESPONSE_SIZE.observe((view,), response_size)
+
+
+def snapshot():
+    """
+    @return: JSON serializable copy of the histograms {name: [[label values, counts, sum], ...]}
+    """
+    with _lock:
+        return {
+            histogram.name: [[list(labels), list(counts), total] for labels, (counts, total) in histogram.series.items()]
+            for histogram in HISTOGRAMS
+        }
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(snapshots, sample_rate):
+    """
+    @param snapshots: snapshot() of every process
+    @param sample_rate: fraction of the requests recorded
+    @return: Prometheus text exposition of the sum of the snapshots
+    """
+    lines = [
+        f"# HELP {PREFIX}metrics_sample_rate Fraction of the requests recorded in the histograms.",
+        f"# TYPE {PREFIX}metrics_sample_rate gauge",
+        f"{PREFIX}metrics_sample_rate {sample_rate}",
+    ]
+
+    for histogram in HISTOGRAMS:
+        merged = {}
+        for process_snapshot in snapshots:
+            for labels, counts, total in process_snapshot.get(histogram.name, ()):
+                series = merged.setdefault(tuple(labels), [[0] * len(counts), 0])
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+
+        lines.append(f"# HELP {histogram.name} {histogram.documentation}")
+        lines.append(f"# TYPE {histogram.name} histogram")
+        bounds = [str(bucket) for bucket in histogram.buckets] + ["+Inf"]
+        for labels, (counts, total) in sorted(merged.items()):
+            label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(histogram.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f'{histogram.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f"{histogram.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{histogram.name}_count{{{label_text}}} {cumulative}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,123 @@
+"""
+Keyset (cursor) pagination of the list endpoints on (created_dt, id), newest first.
+
+The body of the list endpoints stays a list, the cursor of the next page is returned in the X-Next-Cursor header and
+as a Link: <url>; rel="next" header, the client passes it back as ?cursor=. The page size is ?page_size= (bounded by
+API_MAX_PAGE_SIZE). A page costs the same index range scan whatever its depth.
+"""
+import base64
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+DEFAULT_PAGE_SIZE = getattr(settings, "API_PAGE_SIZE", 100)
+MAX_PAGE_SIZE = getattr(settings, "API_MAX_PAGE_SIZE", 500)
+
+ORDERING = ['-created_dt', '-id']
+
+
+class InvalidPageError(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = "Invalid cursor or page_size."
+    default_code = "invalid_page"
+
+    def __init__(self, detail=None):
+        # same body as the errors returned by the views
+        super().__init__({"error": detail or self.default_detail})
+
+
+def encode_cursor(created_dt, obj_id):
+    return base64.urlsafe_b64encode(f"{created_dt.isoformat()}|{obj_id}".encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    @return: tuple (created_dt, id) of the last object of the previous page
+    """
+    try:
+        created_dt, obj_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        created_dt = parse_datetime(created_dt)
+        obj_id = int(obj_id)
+    except (ValueError, UnicodeError):
+        raise InvalidPageError("Invalid cursor.")
+
+    if created_dt is None:
+        raise InvalidPageError("Invalid cursor.")
+
+    return created_dt, obj_id
+
+
+def get_page_size(request):
+    page_size = request.GET.get("page_size")
+    if not page_size:
+        return DEFAULT_PAGE_SIZE
+
+    try:
+        page_size = int(page_size)
+    except ValueError:
+        raise InvalidPageError("page_size must be a number.")
+
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def paginate(request, queryset):
+    """
+    Selects the page requested by the 'cursor' and 'page_size' query parameters.
+    The keys of the page are read first (an index only range scan), the page is then loaded by primary key.
+    @param queryset: filtered queryset of a model having a created_dt field
+    @return: tuple (queryset of the page ordered newest first, cursor of the next page or None)
+    """
+    page_size = get_page_size(request)
+    queryset = _after_cursor(request, queryset)
+    keys = list(queryset.order_by(*ORDERING).values_list('created_dt', 'id')[:page_size + 1])
+
+    return _select_page(queryset, keys, page_size)
+
+
+async def apaginate(request, queryset):
+    """
+    paginate for the async views, the keys are read with the async ORM (the page queryset is not evaluated)
+    """
+    page_size = get_page_size(request)
+    queryset = _after_cursor(request, queryset)
+    keys = [key async for key in queryset.order_by(*ORDERING).values_list('created_dt', 'id')[:page_size + 1]]
+
+    return _select_page(queryset, keys, page_size)
+
+
+def _after_cursor(request, queryset):
+    cursor = request.GET.get("cursor")
+    if cursor:
+        created_dt, obj_id = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_dt__lt=created_dt) | Q(created_dt=created_dt, id__lt=obj_id))
+
+    return queryset
+
+
+def _select_page(queryset, keys, page_size):
+    next_cursor = None
+    if len(keys) > page_size:
+        keys = keys[:page_size]
+        next_cursor = encode_cursor(*keys[-1])
+
+    page = queryset.filter(pk__in=[obj_id for _, obj_id in keys]).order_by(*ORDERING)
+
+    return page, next_cursor
+
+
+def set_next_cursor(request, response, next_cursor):
+    """
+    Adds the X-Next-Cursor / Link headers when there is a next page
+    """
+    if next_cursor:
+        params = request.GET.copy()
+        params["cursor"] = next_cursor
+        next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+        response["X-Next-Cursor"] = next_cursor
+        response["Link"] = f'<{next_url}>; rel="next"'
+
+    return response
@@ -1,8 +1,45 @@
-
-
+import asyncio
+import hashlib
+import json
+import logging
+import pickle
+import time
+import weakref
 from functools import wraps
+
+from django.http import JsonResponse
+from redis import RedisError
+from rest_framework.exceptions import APIException
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
+
+from helper.redis import redis_keys, redis_tools
+from spotter_eld_api.authentication import DriverTokenAuthentication, aget_driver_profile
+
+log = logging.getLogger(__name__)
+
+# how long a response is replayed for the retries of a request
+IDEMPOTENCY_TIMEOUT = 60 * 60 * 24
+# lifetime of the in flight marker, well above the longest request: a marker expiring before its request completes
+# lets a retry run the view a second time
+IDEMPOTENCY_IN_FLIGHT_TIMEOUT = 60 * 10
+# how long a retry waits for the request it duplicates to complete before being told to come back later, a waiting
+# retry holds a worker
+IDEMPOTENCY_WAIT_TIMEOUT = 3
+IDEMPOTENCY_WAIT_STEP = 0.1
+# seconds sent in the Retry-After header of the 409 responses
+IDEMPOTENCY_RETRY_AFTER = 2
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# async views of one event loop running at once: Django's async ORM runs the queries of each request in a thread of
+# its own, with its own database connection, the other requests wait on the loop without holding any
+ASYNC_VIEW_CONCURRENCY = 32
+
+redis_con = redis_tools.get_connection()
+
+# event loop -> semaphore of its async views
+_async_view_slots = weakref.WeakKeyDictionary()
 
 
 def driver_profile_required(view_func):
@@ -16,3 +53,163 @@ def driver_profile_required(view_func):
         return view_func(request, *args, **kwargs)
 
     return wrapper
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    """
+    Response of the async views, rendered as DRF's JSONRenderer does (same encoder, compact, unicode kept)
+    """
+    return JsonResponse(
+        data, status=status, safe=False, encoder=JSONEncoder,
+        json_dumps_params={"ensure_ascii": False, "separators": (",", ":")},
+    )
+
+
+def _get_async_view_slots():
+    loop = asyncio.get_running_loop()
+    if loop not in _async_view_slots:
+        _async_view_slots[loop] = asyncio.Semaphore(ASYNC_VIEW_CONCURRENCY)
+    return _async_view_slots[loop]
+
+
+def async_api_view(methods, require_driver=True):
+    """
+    Async counterpart of @api_view(methods) + @permission_classes([IsAuthenticated]) (+ @driver_profile_required) for
+    the plain async Django views served under ASGI (DRF has no async views): the JWT is checked without leaving the
+    event loop, the driver profile is set as request.driver (None when not required and missing) and the DRF
+    exceptions raised by the view are returned as their {"error": ...} / {"detail": ...} bodies. At most
+    ASYNC_VIEW_CONCURRENCY views run at once per event loop.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return json_response({"detail": f'Method "{request.method}" not allowed.'},
+                                     status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+            try:
+                result = await DriverTokenAuthentication().aauthenticate(request)
+                if result is None:
+                    return json_response({"detail": "Authentication credentials were not provided."},
+                                         status=status.HTTP_401_UNAUTHORIZED)
+
+                request.user = result[0]
+                request.driver = await aget_driver_profile(request.user)
+                if request.driver is None and require_driver:
+                    return json_response({"error": "Authenticated user is not associated with a driver profile"},
+                                         status=status.HTTP_403_FORBIDDEN)
+
+                async with _get_async_view_slots():
+                    return await view_func(request, *args, **kwargs)
+            except APIException as e:
+                detail = e.detail if isinstance(e.detail, dict) else {"detail": e.detail}
+                return json_response(detail, status=e.status_code)
+
+        return wrapper
+
+    return decorator
+
+
+def _get_fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.md5(f"{request.method}|{body}".encode("utf-8")).hexdigest()
+
+
+def _replay(entry):
+    response = Response(entry["data"], status=entry["status_code"])
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _wait_for_response(key):
+    """
+    @return: the stored response of the request holding the key, None if it did not complete in time (or failed)
+    """
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(IDEMPOTENCY_WAIT_STEP)
+        raw = redis_con.get(key)
+        if raw is None:
+            return None
+
+        entry = pickle.loads(raw)
+        if entry.get("status_code") is not None:
+            return entry
+
+    return None
+
+
+def idempotent(view_func):
+    """
+    Makes a mutating view safe to retry: the response of a request carrying an 'Idempotency-Key' header is stored per
+    user and path, and returned again (with an 'Idempotent-Replayed' header) to the retries using the same key instead
+    of running the view twice. A retry arriving while the request is still running waits a few seconds for its
+    response, then gets a 409 with a Retry-After header, also when redis fails once the key is found held.
+    Requests without the header, and all requests when the key can not be set in redis, run as usual. Server errors
+    are not stored so that they can be retried.
+    Must be placed below @api_view / @permission_classes, the request is authenticated.
+    """
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if not idempotency_key:
+            return view_func(request, *args, **kwargs)
+
+        if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response(
+                {"error": f"Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        key = redis_keys.get_idempotency_key(request.user.id, request.path, idempotency_key)
+        fingerprint = _get_fingerprint(request)
+
+        try:
+            acquired = redis_con.set(
+                key, pickle.dumps({"fingerprint": fingerprint, "status_code": None}, protocol=pickle.HIGHEST_PROTOCOL),
+                nx=True, ex=IDEMPOTENCY_IN_FLIGHT_TIMEOUT
+            )
+        except RedisError:
+            log.error("Could not check the Idempotency-Key %s", key, exc_info=True)
+            return view_func(request, *args, **kwargs)
+
+        if not acquired:
+            try:
+                raw = redis_con.get(key)
+                entry = pickle.loads(raw) if raw is not None else None
+                if entry and entry["fingerprint"] != fingerprint:
+                    return Response(
+                        {"error": "Idempotency-Key was already used for a different request."},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                if entry and entry["status_code"] is None:
+                    entry = _wait_for_response(key)
+            except RedisError:
+                # the key is held: the request may still be running, it must not run twice
+                log.error("Could not read the Idempotency-Key %s", key, exc_info=True)
+                entry = None
+            if entry:
+                return _replay(entry)
+
+            return Response(
+                {"error": "A request with this Idempotency-Key is still in progress, retry later."},
+                status=status.HTTP_409_CONFLICT, headers={"Retry-After": str(IDEMPOTENCY_RETRY_AFTER)}
+            )
+
+        response = None
+        try:
+            response = view_func(request, *args, **kwargs)
+        finally:
+            try:
+                if response is not None and response.status_code < 500:
+                    entry = {"fingerprint": fingerprint, "status_code": response.status_code, "data": response.data}
+                    redis_con.set(key, pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL), ex=IDEMPOTENCY_TIMEOUT)
+                else:
+                    redis_con.delete(key)
+            except RedisError:
+                log.error("Could not store the response of the Idempotency-Key %s", key, exc_info=True)
+
+        return response
+
+    return wrapper
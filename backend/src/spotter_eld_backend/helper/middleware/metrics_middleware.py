@@ -0,0 +1,99 @@
+"""
+Records the wall time, the database and redis calls and the response size of a sample of the requests, per view (see
+helper.common.metrics). First in MIDDLEWARE so that the time of the other middlewares is counted.
+
+METRICS_SAMPLE_RATE 0 removes the middleware, a request not sampled costs one random number.
+"""
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from helper.common import metrics
+from helper.redis import metrics_dao
+
+log = logging.getLogger(__name__)
+
+
+def get_view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+
+    # the class of the class based views and of DRF's function views
+    view = getattr(match.func, "view_class", match.func)
+    return "%s.%s" % (view.__module__, view.__name__)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_SAMPLE_RATE:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+        self.sample_rate = settings.METRICS_SAMPLE_RATE
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+        # the connections opened before the middleware was loaded and the ones of the other threads
+        for connection in connections.all():
+            metrics.install_db_wrapper(connection)
+        connection_created.connect(metrics.install_db_wrapper)
+
+    def _is_sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self._is_sampled():
+            return self.get_response(request)
+
+        stats, token = metrics.start()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.stop(token)
+
+        self._record(request, response, time.perf_counter() - started, stats)
+        if metrics_dao.is_push_due():
+            metrics_dao.push_snapshot(metrics.snapshot())
+        return response
+
+    async def __acall__(self, request):
+        if not self._is_sampled():
+            return await self.get_response(request)
+
+        stats, token = metrics.start()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.stop(token)
+
+        self._record(request, response, time.perf_counter() - started, stats)
+        if metrics_dao.is_push_due():
+            await sync_to_async(metrics_dao.push_snapshot, thread_sensitive=False)(metrics.snapshot())
+        return response
+
+    def _record(self, request, response, duration, stats):
+        view = get_view_name(request)
+        response_size = None if response.streaming else len(response.content)
+        metrics.record(view, request.method, response.status_code, duration, stats, response_size)
+
+        if duration >= settings.METRICS_SLOW_REQUEST_SECONDS:
+            log.warning(
+                "Slow request %s %s (%s): %.3fs, %s queries in %.3fs, %s redis calls in %.3fs, %s bytes",
+                request.method, request.path, view, duration, stats.db_queries, stats.db_seconds,
+                stats.redis_calls, stats.redis_seconds, response_size,
+            )
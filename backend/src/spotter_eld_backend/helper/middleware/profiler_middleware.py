@@ -0,0 +1,150 @@
+"""
+Runs a single request under cProfile on demand, to capture the slow cases that do not reproduce locally. Last in
+MIDDLEWARE so that the profile covers the view.
+
+A request is profiled when it carries a valid X-Profile-Token header (a signed token given on the admin page, see
+spotter_eld_api.views.profiles) or, from a staff user, the ?profile=1 query parameter. The profile is stored in redis
+(see helper.redis.profile_dao) under the id returned in the X-Profile-Id response header. The other requests only
+pay for the two lookups telling that they are not profiled.
+
+The profile of an async view is the one of the event loop thread while the view runs: it includes the other requests
+served by the loop meanwhile and not the queries run by the async ORM in its threads.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework import exceptions
+
+from helper.middleware.metrics_middleware import get_view_name
+from helper.redis import profile_dao
+from spotter_eld_api.authentication import DriverTokenAuthentication
+
+PROFILE_PARAM = "profile"
+PROFILE_TOKEN_META = "HTTP_X_PROFILE_TOKEN"
+PROFILE_TOKEN_SALT = "helper.middleware.profiler_middleware"
+# functions listed in the text summary of a capture
+SUMMARY_LINES = 80
+
+# a thread runs one profiler at a time: an async request asking for a profile while another one of the loop is
+# profiled is served without
+_async_profiling = False
+
+
+def make_profile_token():
+    return signing.TimestampSigner(salt=PROFILE_TOKEN_SALT).sign("profile")
+
+
+def _is_token_valid(token):
+    try:
+        signing.TimestampSigner(salt=PROFILE_TOKEN_SALT).unsign(token, max_age=settings.PROFILER_TOKEN_MAX_AGE)
+        return True
+    except signing.BadSignature:
+        return False
+
+
+def _get_staff_user(request):
+    """
+    @return: the staff user of the session or of the access token, None otherwise
+    """
+    if request.user.is_authenticated:
+        return request.user if request.user.is_staff else None
+
+    try:
+        result = DriverTokenAuthentication().authenticate(request)
+    except exceptions.AuthenticationFailed:
+        return None
+    return result[0] if result is not None and result[0].is_staff else None
+
+
+def _get_profiled_user_id(request):
+    """
+    @return: (True if the request is profiled, id of the user asking for it)
+    """
+    token = request.META.get(PROFILE_TOKEN_META)
+    if token is not None:
+        return _is_token_valid(token), None
+
+    user = _get_staff_user(request)
+    return user is not None, user.id if user is not None else None
+
+
+def _store(request, response, profiler, duration, user_id):
+    request_id = uuid.uuid4().hex
+    summary = io.StringIO()
+    # takes the stats of the profiler
+    stats = pstats.Stats(profiler, stream=summary)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(SUMMARY_LINES)
+
+    query = request.GET.copy()
+    query.pop(PROFILE_PARAM, None)
+    query.pop("access_token", None)
+    profile_dao.store_profile(request_id, {
+        "request_id": request_id,
+        "ts": time.time(),
+        "method": request.method,
+        "path": request.path + ("?" + query.urlencode() if query else ""),
+        "view": get_view_name(request),
+        "status": response.status_code,
+        "duration": round(duration, 4),
+        "user_id": user_id,
+    }, marshal.dumps(stats.stats), summary.getvalue())
+
+    response["X-Profile-Id"] = request_id
+    return response
+
+
+class ProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILER_ENABLED:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if PROFILE_TOKEN_META not in request.META and PROFILE_PARAM not in request.GET:
+            return self.get_response(request)
+
+        is_profiled, user_id = _get_profiled_user_id(request)
+        if not is_profiled:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        response = profiler.runcall(self.get_response, request)
+        return _store(request, response, profiler, time.perf_counter() - started, user_id)
+
+    async def __acall__(self, request):
+        global _async_profiling
+        if PROFILE_TOKEN_META not in request.META and PROFILE_PARAM not in request.GET:
+            return await self.get_response(request)
+
+        is_profiled, user_id = await sync_to_async(_get_profiled_user_id)(request)
+        if not is_profiled or _async_profiling:
+            return await self.get_response(request)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        _async_profiling = True
+        profiler.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+            _async_profiling = False
+        return await sync_to_async(_store)(request, response, profiler, time.perf_counter() - started, user_id)
@@ -0,0 +1,79 @@
+"""
+Redis stream buffering the GPS breadcrumbs between the ingestion endpoint and the drain_breadcrumbs workers.
+
+An entry holds one uploaded batch of samples of a vehicle, so that an upload costs a single XADD. The workers read
+the stream through a consumer group: an entry is acknowledged and deleted once its samples are inserted, the entries
+left pending by a worker that died are claimed by the others after CLAIM_IDLE_MS.
+"""
+import json
+
+from redis import ResponseError
+
+from helper.redis import redis_keys, redis_tools
+
+GROUP = "breadcrumb-writers"
+CLAIM_IDLE_MS = 60 * 1000
+# safety cap on the entries waiting in the stream (approximate trimming), bounds the redis memory if no worker runs
+STREAM_MAX_LEN = 1000000
+
+redis_con = redis_tools.get_connection()
+
+
+def publish(vehicle_id, driver_id, samples):
+    """
+    @param samples: list of [ts (epoch seconds), latitude, longitude, speed, odometer]
+    """
+    redis_con.xadd(
+        redis_keys.get_breadcrumb_stream_key(),
+        {"vehicle_id": vehicle_id, "driver_id": driver_id, "samples": json.dumps(samples)},
+        maxlen=STREAM_MAX_LEN, approximate=True,
+    )
+
+
+def ensure_group():
+    try:
+        redis_con.xgroup_create(redis_keys.get_breadcrumb_stream_key(), GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def _decode(entries):
+    """
+    @return: list of (entry id, vehicle id, driver id, samples)
+    """
+    return [
+        (entry_id, int(fields[b"vehicle_id"]), int(fields[b"driver_id"]), json.loads(fields[b"samples"]))
+        for entry_id, fields in entries if fields
+    ]
+
+
+def claim_stale(consumer, count):
+    """
+    Takes over the entries left pending by other consumers for more than CLAIM_IDLE_MS
+    """
+    response = redis_con.xautoclaim(
+        redis_keys.get_breadcrumb_stream_key(), GROUP, consumer, CLAIM_IDLE_MS, start_id="0-0", count=count
+    )
+    return _decode(response[1])
+
+
+def read(consumer, count, block_ms):
+    """
+    @return: up to 'count' new entries, waiting at most block_ms for the first one
+    """
+    response = redis_con.xreadgroup(
+        GROUP, consumer, {redis_keys.get_breadcrumb_stream_key(): ">"}, count=count, block=block_ms
+    )
+    return _decode(response[0][1]) if response else []
+
+
+def ack(entry_ids):
+    if not entry_ids:
+        return
+
+    key = redis_keys.get_breadcrumb_stream_key()
+    pipe = redis_con.pipeline(transaction=False)
+    pipe.xack(key, GROUP, *entry_ids)
+    pipe.xdel(key, *entry_ids)
+    pipe.execute()
@@ -1,8 +1,6 @@
 import logging
 import pickle
 
-from django.core import serializers
-
 from helper.redis import redis_tools
 
 log = logging.getLogger(__name__)
@@ -28,55 +26,47 @@ def get_from_map(key, cache_map, fnIfNotFound):
     return rt
 
 
+def _get_and_touch(key, timeout_sec):
+    """
+    Reads 'key' and resets its timeout in a single round trip
+    @return: the raw value, None if not found
+    """
+    pipe = redis_con.pipeline(transaction=False)
+    pipe.get(key)
+    pipe.expire(key, timeout_sec)
+    return pipe.execute()[0]
+
+
 def get_model_from_redis_only(key):
     """
     @param key: the key to get the model from
-    @param redis_conn: the redis connection to use
-    @return: the deserialized object from redis
+    @return: the list of django.db.Model instances stored in redis, empty if not found
     """
-    rt = []
     obj = redis_con.get(key)
-    if obj:
-        dObj = serializers.deserialize('json', obj)
-        if dObj:
-            for d in dObj:
-                rt.append(d.object)
-
-    return rt
+    return pickle.loads(obj) if obj else []
 
 
 def get_model_from_redis(key, fnIfNotFound, timeout_sec):
     """
      Returns the value associated with 'key' in the redis DB. The returned/stored in redis objects are django model objects.
-     For JSON serializable objects use get_from_redis.
-     It calls the fnIfNotFound, get the object or list, serialize to JSON and store it in a record like {'is_list':True, 'payload':<serialized data>}.
-     it uses the is_list while deserializing from the cache to return it to the same type returned from fnIfNotFound
+     For other picklable objects use get_from_redis.
+     It calls the fnIfNotFound, evaluates the QuerySet or iterable into a list and stores it pickled, which keeps the
+     instances (and their select_related objects) as they were loaded.
 
-     On each call, it resets the timeout to 'timeout_sec'
+     On each call, it resets the timeout to 'timeout_sec' (pipelined with the read)
 
      @param key: string key for the cached object. better to follow redis key structure e.g. cache:model:employee:<emp id>
      @param fnIfNotFound: function to be called without parameters if key not found. it should return either a QuerySet or an iterable object of type [django.db.Model]
      @param timeout_sec: timeout seconds
-     @param redis_con: redis connection to be used
      @return: list of django.db.Model instances
     """
 
-    obj = redis_con.get(key)
-    if obj is None or not use_cache:
-        obj = fnIfNotFound()
-
-        dObj = serializers.serialize('json', obj)
-        redis_con.set(key, dObj, ex=timeout_sec)
-
-        # reread from redis in order to always return the same type
-        obj = redis_con.get(key)
+    obj = _get_and_touch(key, timeout_sec) if use_cache else None
+    if obj is not None:
+        return pickle.loads(obj)
 
-    redis_con.expire(key, timeout_sec)
-
-    dObj = serializers.deserialize('json', obj)
-    rt = []
-    for d in dObj:
-        rt.append(d.object)
+    rt = list(fnIfNotFound())
+    redis_con.set(key, pickle.dumps(rt, protocol=pickle.HIGHEST_PROTOCOL), ex=timeout_sec)
 
     return rt
 
@@ -84,28 +74,21 @@ def get_model_from_redis(key, fnIfNotFound, timeout_sec):
 def get_from_redis(key, fnIfNotFound, timeout_sec):
     """
     Returns the value associated with 'key' in the redis DB.
-    The return result of fnIfNotFound should serializable via json.dumps. To cache django.Models then use get_model_from_redis.
-    On each call, it resets the timeout to 'timeout_sec'
+    The return result of fnIfNotFound should be picklable. To cache django.Models then use get_model_from_redis.
+    On each call, it resets the timeout to 'timeout_sec' (pipelined with the read)
 
      @param key: string key for the cached object. better to follow redis key structure e.g. cache:store:<store_code>:data_name
-     @param fnIfNotFound: function to be called without parameters if key not found. it should return either a QuerySet or an iterable object of type [django.db.Model]
+     @param fnIfNotFound: function to be called without parameters if key not found
      @param timeout_sec: timeout seconds
-     @param redis_con: redis connection to be used
      @return: deserialized object as returned by fnIfNotFound
     """
 
-    obj = redis_con.get(key)
-    if obj is None or not use_cache:
-        obj = fnIfNotFound()
-
-        dObj = pickle.dumps(obj)
-        redis_con.set(key, dObj, ex=timeout_sec)
-
-        # reread from redis in order to always return the same type
-        obj = redis_con.get(key)
+    obj = _get_and_touch(key, timeout_sec) if use_cache else None
+    if obj is not None:
+        return pickle.loads(obj)
 
-    redis_con.expire(key, timeout_sec)
-    rt = pickle.loads(obj)
+    rt = fnIfNotFound()
+    redis_con.set(key, pickle.dumps(rt, protocol=pickle.HIGHEST_PROTOCOL), ex=timeout_sec)
 
     return rt
 
@@ -0,0 +1,61 @@
+"""
+Duty-status detector state of each vehicle (see spotter_eld_api.logic.duty_status_logic), one small JSON string per
+vehicle so that a drain batch reads the states of all its vehicles with one MGET.
+
+Breadcrumb entries of one vehicle may be drained by two workers at the same time: a state is only replaced if it is
+still the one that was read (compare and set), the loser reads it again and runs its samples on the new state.
+"""
+import json
+
+from helper.redis import redis_keys, redis_tools
+
+# a vehicle that sent nothing for that long starts again from Off Duty
+STATE_TIMEOUT = 24 * 60 * 60
+
+# KEYS[1] state, ARGV[1] state read ('' when there was none), ARGV[2] new state, ARGV[3] timeout
+_SAVE_SCRIPT = """
+local current = redis.call('GET', KEYS[1]) or ''
+if current ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+redis_con = redis_tools.get_connection()
+_save_script = redis_con.register_script(_SAVE_SCRIPT)
+
+
+def get_states(vehicle_ids):
+    """
+    @return: dict {vehicle id: raw state (bytes) or None}, the raw state is passed back to save_states
+    """
+    vehicle_ids = list(vehicle_ids)
+    if not vehicle_ids:
+        return {}
+
+    raw_states = redis_con.mget([redis_keys.get_vehicle_duty_status_key(vehicle_id) for vehicle_id in vehicle_ids])
+    return dict(zip(vehicle_ids, raw_states))
+
+
+def decode(raw_state):
+    return json.loads(raw_state) if raw_state else None
+
+
+def save_states(states):
+    """
+    @param states: dict {vehicle id: (raw state read, new state dict)}
+    @return: set of the vehicle ids whose state was changed in the meantime and not saved
+    """
+    if not states:
+        return set()
+
+    pipe = redis_con.pipeline(transaction=False)
+    for vehicle_id, (raw_state, state) in states.items():
+        _save_script(
+            keys=[redis_keys.get_vehicle_duty_status_key(vehicle_id)],
+            args=[raw_state or "", json.dumps(state), STATE_TIMEOUT],
+            client=pipe,
+        )
+
+    return {vehicle_id for vehicle_id, saved in zip(states, pipe.execute()) if not saved}
@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCache:
+    """
+    Process local LRU cache with a timeout per entry, used in front of redis for the objects read on every request.
+    Entries of other processes are not invalidated, keep the timeout short.
+    """
+
+    def __init__(self, max_size=1024, timeout_sec=30):
+        """
+        @param max_size: number of entries kept, the least recently used entry is evicted beyond it
+        @param timeout_sec: default time to live of the entries
+        """
+        self.max_size = max_size
+        self.timeout_sec = timeout_sec
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        @return: tuple (found, value), value can be None when None was cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def set(self, key, value, timeout_sec=None):
+        expires_at = time.monotonic() + (timeout_sec or self.timeout_sec)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,65 @@
+"""
+Snapshots of the request histograms of every process (see helper.common.metrics), so that /metrics reports the whole
+deployment whatever the worker answering the scrape.
+
+A process pushes its snapshot at most every SNAPSHOT_INTERVAL seconds, at the end of a sampled request, and registers
+itself in a sorted set scored by the time of the push. The snapshots of the processes that stopped pushing expire:
+their requests leave the sums, which Prometheus reads as a counter reset.
+"""
+import json
+import logging
+import os
+import socket
+import time
+
+from redis import RedisError
+
+from helper.redis import redis_keys, redis_tools
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_INTERVAL = 10
+SNAPSHOT_TTL = 60
+
+WORKER_ID = "%s:%s" % (socket.gethostname(), os.getpid())
+
+redis_con = redis_tools.get_connection()
+
+_last_push = 0
+
+
+def is_push_due():
+    return time.monotonic() - _last_push >= SNAPSHOT_INTERVAL
+
+
+def push_snapshot(snapshot):
+    global _last_push
+    _last_push = time.monotonic()
+
+    now = time.time()
+    pipe = redis_con.pipeline(transaction=False)
+    pipe.set(redis_keys.get_metrics_snapshot_key(WORKER_ID), json.dumps(snapshot), ex=SNAPSHOT_TTL)
+    pipe.zadd(redis_keys.get_metrics_workers_key(), {WORKER_ID: now})
+    pipe.zremrangebyscore(redis_keys.get_metrics_workers_key(), 0, now - SNAPSHOT_TTL)
+    pipe.expire(redis_keys.get_metrics_workers_key(), SNAPSHOT_TTL)
+    try:
+        pipe.execute()
+    except RedisError:
+        log.error("Could not push the metrics snapshot of %s", WORKER_ID, exc_info=True)
+
+
+def get_other_snapshots():
+    """
+    @return: snapshots of the other live processes, none when redis is not reachable
+    """
+    try:
+        worker_ids = redis_con.zrangebyscore(redis_keys.get_metrics_workers_key(), time.time() - SNAPSHOT_TTL, "+inf")
+        worker_ids = [worker_id.decode("utf-8") for worker_id in worker_ids if worker_id.decode("utf-8") != WORKER_ID]
+        if not worker_ids:
+            return []
+        snapshots = redis_con.mget([redis_keys.get_metrics_snapshot_key(worker_id) for worker_id in worker_ids])
+    except RedisError:
+        log.error("Could not read the metrics snapshots", exc_info=True)
+        return []
+
+    return [json.loads(snapshot) for snapshot in snapshots if snapshot]
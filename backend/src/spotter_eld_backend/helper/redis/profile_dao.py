@@ -0,0 +1,60 @@
+"""
+Profiles captured by helper.middleware.profiler_middleware: a hash per request holding its description, the pstats dump
+and a text summary, indexed by a sorted set scored by the capture time. The captures expire after PROFILE_TTL, the
+index keeps the last MAX_PROFILES.
+"""
+import json
+import logging
+import time
+
+from redis import RedisError
+
+from helper.redis import redis_keys, redis_tools
+
+log = logging.getLogger(__name__)
+
+PROFILE_TTL = 60 * 60 * 24 * 7
+MAX_PROFILES = 200
+
+redis_con = redis_tools.get_connection()
+
+
+def store_profile(request_id, meta, stats, summary):
+    """
+    @param meta: dict describing the request
+    @param stats: marshal dump of the profiler stats, the format of pstats.Stats.dump_stats
+    @param summary: text of the functions sorted by cumulative time
+    """
+    pipe = redis_con.pipeline(transaction=False)
+    pipe.hset(redis_keys.get_profile_key(request_id), mapping={
+        "meta": json.dumps(meta), "stats": stats, "summary": summary
+    })
+    pipe.expire(redis_keys.get_profile_key(request_id), PROFILE_TTL)
+    pipe.zadd(redis_keys.get_profiles_key(), {request_id: time.time()})
+    pipe.zremrangebyscore(redis_keys.get_profiles_key(), 0, time.time() - PROFILE_TTL)
+    pipe.zremrangebyrank(redis_keys.get_profiles_key(), 0, -MAX_PROFILES - 1)
+    try:
+        pipe.execute()
+    except RedisError:
+        log.error("Could not store the profile of request %s", request_id, exc_info=True)
+
+
+def get_profiles():
+    """
+    @return: meta of the captures, the most recent first
+    @raise RedisError
+    """
+    request_ids = redis_con.zrevrange(redis_keys.get_profiles_key(), 0, -1)
+    pipe = redis_con.pipeline(transaction=False)
+    for request_id in request_ids:
+        pipe.hget(redis_keys.get_profile_key(request_id.decode("utf-8")), "meta")
+    return [json.loads(meta) for meta in pipe.execute() if meta]
+
+
+def get_profile(request_id, field):
+    """
+    @param field: "stats" or "summary"
+    @return: bytes or None when the capture expired
+    @raise RedisError
+    """
+    return redis_con.hget(redis_keys.get_profile_key(request_id), field)
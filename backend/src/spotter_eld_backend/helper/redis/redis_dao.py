@@ -1,175 +1,72 @@
-from ads_platform.models import Operator, ServiceOperator, Service, HostUrl, PageConfig, PageServiceOperator
-from helper.redis import cache_tools, redis_tools
+"""
+Cached lookups of the models read by id on the request path: drivers, vehicles, locations and trips.
 
+Reads go through a process local LRU, then redis (pickled instances), then the database, see TwoTierCache.
+Both tiers of every process are purged when the object is saved or deleted, see spotter_eld_api.signals, and when
+the cycle of a driver is rolled with an update (see cycle_logic).
+"""
+from helper.redis import redis_keys
+from helper.redis.two_tier_cache import TwoTierCache
+from spotter_eld.models import Driver, Location, Trip, Vehicle
 
-def get_service_operator_by_token(auth_token):
-    service_op = None
+MODEL_CACHE_TIMEOUT = 60 * 60 * 6
+LOCAL_CACHE_TIMEOUT = 30
 
-    def _get_obj():
-        return ServiceOperator.objects.filter(auth_token=auth_token)
-
-    redis_key = "cache:service_op:%s" % auth_token
-    cache_result = cache_tools.get_model_from_redis(redis_key, _get_obj, 60 * 60 * 6)
-
-    if cache_result:
-        service_op = cache_result[0]
-
-    return service_op
-
-
-def get_service_by_id(service_id):
-    service_obj = None
-
-    def _get_obj():
-        return Service.objects.filter(id=service_id)
-
-    redis_key = "cache:service:id:%s" % service_id
-    cache_result = cache_tools.get_model_from_redis(redis_key, _get_obj, 60 * 60 * 6)
-
-    if cache_result:
-        service_obj = cache_result[0]
-
-    return service_obj
-
-
-def get_service_by_slug(service_slug):
-    service_obj = None
+model_cache = TwoTierCache(MODEL_CACHE_TIMEOUT, local_timeout_sec=LOCAL_CACHE_TIMEOUT, max_size=4096)
 
-    def _get_obj():
-        return Service.objects.filter(slug=service_slug)
-
-    redis_key = "cache:service:slug:%s" % service_slug
-    cache_result = cache_tools.get_model_from_redis(redis_key, _get_obj, 60 * 60 * 6)
-
-    if cache_result:
-        service_obj = cache_result[0]
-
-    return service_obj
-
-
-def get_operator_by_token(auth_token):
-    operator_obj = None
 
+def _get_model(model, obj_id):
+    """
+    @return: the instance of 'model' with the primary key 'obj_id', None if it does not exist
+    """
     def _get_obj():
-        return Operator.objects.filter(auth_token=auth_token)
+        return model.objects.filter(pk=obj_id).first()
 
-    redis_key = "cache:operator:%s" % auth_token
-    cache_result = cache_tools.get_model_from_redis(redis_key, _get_obj, 60 * 60 * 6)
+    return model_cache.get(redis_keys.get_model_cache_key(model._meta.model_name, obj_id), _get_obj)
 
-    if cache_result:
-        operator_obj = cache_result[0]
 
-    return operator_obj
+async def _aget_model(model, obj_id):
+    async def _get_obj():
+        return await model.objects.filter(pk=obj_id).afirst()
 
+    return await model_cache.aget(redis_keys.get_model_cache_key(model._meta.model_name, obj_id), _get_obj)
 
-def get_operator_by_id(operator_id):
-    operator_obj = None
 
-    def _get_obj():
-        return Operator.objects.filter(id=operator_id)
+def get_driver(driver_id):
+    return _get_model(Driver, driver_id)
 
-    redis_key = "cache:operator:id:%s" % operator_id
-    cache_result = cache_tools.get_model_from_redis(redis_key, _get_obj, 60 * 60 * 6)
-
-    if cache_result:
-        operator_obj = cache_result[0]
-
-    return operator_obj
-
-
-def get_operator_by_code(operator_code):
-    operator_obj = None
-
-    def _get_obj():
-        return Operator.objects.filter(operator_code=operator_code)
 
-    redis_key = "cache:operator:code:%s" % operator_code
-    cache_result = cache_tools.get_model_from_redis(redis_key, _get_obj, 60 * 60 * 6)
+def get_vehicle(vehicle_id):
+    return _get_model(Vehicle, vehicle_id)
 
-    if cache_result:
-        operator_obj = cache_result[0]
 
-    return operator_obj
+def get_location(location_id):
+    return _get_model(Location, location_id)
 
 
-def get_host_url_by_url(url):
-    host_url_objs = None
+def get_trip(trip_id):
+    return _get_model(Trip, trip_id)
 
-    def _get_objs():
-        return HostUrl.objects.filter(url=url)
 
-    redis_key = "cache:host_url:%s" % url
-    cache_result = cache_tools.get_model_from_redis(redis_key, _get_objs, 60 * 60)
+async def aget_driver(driver_id):
+    return await _aget_model(Driver, driver_id)
 
-    if cache_result:
-        host_url_objs = cache_result[0]
 
-    return host_url_objs
+async def aget_vehicle(vehicle_id):
+    return await _aget_model(Vehicle, vehicle_id)
 
 
-def get_page_configs_by_host_url_and_slug(host_url_obj, slug):
-    page_configs_list = None
-
-    def _get_obj():
-        return list(PageConfig.objects.select_related('campaign').filter(
-            host_url=host_url_obj, slug=slug, is_active=True
-        ))
-
-    redis_key = "cache:page_configs:%s:%s" % (host_url_obj.id, slug)
-    cache_result = cache_tools.get_model_from_redis(redis_key, _get_obj, 15 * 60)
-
-    if cache_result:
-        page_configs_list = cache_result
-
-    return page_configs_list
-
-
-def get_page_config_by_id(page_config_id):
-    page_config_obj = None
-
-    def _get_obj():
-        return PageConfig.objects.filter(public_id=page_config_id).select_related('host_url')
-
-    redis_key = f"cache:page_config:{page_config_id}"
-    cache_result = cache_tools.get_model_from_redis(redis_key, _get_obj, 60 * 60)
-
-    if cache_result:
-        page_config_obj = cache_result[0]
-
-    return page_config_obj
-
-
-def get_page_service_operators_by_page_config_id(page_config_id, operator_code):
-    page_service_operators_list = None
-
-    def _get_obj():
-        obj = list(PageServiceOperator.objects.select_related('page_config', 'service_operator__service')
-                                       .filter(page_config__public_id=page_config_id, service_operator__operator__code=operator_code))
-
-
-        return obj
-
-
-    redis_key = f"cache:page_service_operators:{page_config_id}"
-    cache_result = cache_tools.get_model_from_redis(redis_key, _get_obj, 60 * 60)
-    if cache_result:
-        page_service_operators_list = cache_result
-
-    return page_service_operators_list
-
-
-def get_page_service_operator(page_service_operator_id):
-    page_service_operator_obj = None
-
-    def _get_obj():
-        return (PageServiceOperator.objects.select_related('page_config', 'service_operator__service')
-                .filter(id=page_service_operator_id))
+async def aget_location(location_id):
+    return await _aget_model(Location, location_id)
 
-    redis_key = f"cache:page_service_operator:{page_service_operator_id}"
-    cache_result = cache_tools.get_model_from_redis(redis_key, _get_obj, 60 * 60)
 
-    if cache_result:
-        page_service_operator_obj = cache_result[0]
+async def aget_trip(trip_id):
+    return await _aget_model(Trip, trip_id)
 
-    return page_service_operator_obj
 
+def invalidate(model, obj_id):
+    """
+    Purges the cached instance from redis and from the local tier of every process
+    @param model: one of the cached model classes
+    """
+    model_cache.invalidate(redis_keys.get_model_cache_key(model._meta.model_name, obj_id))
@@ -26,3 +26,75 @@ def get_charging_attempt_key(operator, charging_attempt_id):
 
 def get_supervisord_key(operator):
     return "charging_process_supervisord:%s" % operator
+
+
+def get_form_locations_key(location_type):
+    return "cache:form_data:locations:%s" % location_type
+
+
+def get_form_unallocated_vehicles_key():
+    return "cache:form_data:vehicles:unallocated"
+
+
+def get_driver_trip_state_key(driver_id):
+    return "trip_state:driver:%s" % driver_id
+
+
+def get_model_cache_key(model_name, obj_id):
+    return "cache:model:%s:%s" % (model_name, obj_id)
+
+
+def get_cache_lock_key(key):
+    return "lock:%s" % key
+
+
+def get_idempotency_key(user_id, path, idempotency_key):
+    return "idempotency:%s:%s:%s" % (user_id, path, idempotency_key)
+
+
+def get_breadcrumb_stream_key():
+    return "stream:breadcrumbs"
+
+
+def get_vehicle_duty_status_key(vehicle_id):
+    return "duty_status:vehicle:%s" % vehicle_id
+
+
+def get_user_tokens_revoked_key(user_id):
+    return "auth:tokens_revoked:user:%s" % user_id
+
+
+def get_blacklisted_token_key(jti):
+    return "auth:blacklist:jti:%s" % jti
+
+
+def get_token_log_key():
+    return "auth:token_log"
+
+
+def get_driver_events_channel(driver_id):
+    return "events:driver:%s" % driver_id
+
+
+def get_vehicle_events_channel(vehicle_id):
+    return "events:vehicle:%s" % vehicle_id
+
+
+def get_fleet_events_channel():
+    return "events:fleet"
+
+
+def get_metrics_workers_key():
+    return "metrics:workers"
+
+
+def get_metrics_snapshot_key(worker_id):
+    return "metrics:snapshot:%s" % worker_id
+
+
+def get_profiles_key():
+    return "profiler:captures"
+
+
+def get_profile_key(request_id):
+    return "profiler:capture:%s" % request_id
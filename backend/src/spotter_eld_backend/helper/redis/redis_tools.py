@@ -1,12 +1,27 @@
+import asyncio
 import logging
+import weakref
 from functools import wraps
 
 import redis
+import redis.asyncio
 from django.conf import settings
 
+from helper.common import metrics
+
 log = logging.getLogger(__name__)
 
-_pool = redis.ConnectionPool(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB, password=settings.REDIS_PASSWORD)
+# the connections count the calls of the sampled requests, see helper.common.metrics
+_pool = redis.ConnectionPool(
+    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB, password=settings.REDIS_PASSWORD,
+    connection_class=metrics.RedisConnection,
+)
+
+# connections of the asyncio client of an event loop
+ASYNC_MAX_CONNECTIONS = 32
+
+# event loop -> asyncio client
+_async_clients = weakref.WeakKeyDictionary()
 
 
 def get_connection():
@@ -17,6 +32,23 @@ def get_connection():
     return redis.Redis(connection_pool=_pool)
 
 
+def get_async_connection():
+    """
+    Returns the asyncio redis client of the running event loop, its connections can not be used from another loop so
+    each loop gets its own pool
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        # the requests of the loop wait for a free connection instead of opening one each
+        pool = redis.asyncio.BlockingConnectionPool(
+            host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB, password=settings.REDIS_PASSWORD,
+            max_connections=ASYNC_MAX_CONNECTIONS, connection_class=metrics.AsyncRedisConnection,
+        )
+        _async_clients[loop] = redis.asyncio.Redis(connection_pool=pool)
+
+    return _async_clients[loop]
+
+
 def redis_decoder(fn_to_wrap):
     """
     Decorator that decode values returned as dict or string
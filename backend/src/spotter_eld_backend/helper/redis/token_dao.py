@@ -0,0 +1,126 @@
+"""
+JWT revocation and blacklist checks, kept in redis so that neither an authenticated request nor a token refresh reads
+the database (see spotter_eld_api.authentication).
+
+Revoking the tokens of a user stores the time of the revocation: the tokens of a login (auth_time claim) that happened
+before it are rejected. The key lives as long as a refresh token: by then every token of an older login has either been
+refused at its next refresh or expired.
+
+A refresh token is blacklisted when it is rotated, by a key named after its jti that expires with it. The database
+tables of the token_blacklist app remain the durable record: the rotations are queued in a redis list and written in
+bulk by the persist_token_blacklist command, which also reloads the blacklist into redis after a redis data loss.
+"""
+import json
+import logging
+import time
+
+from redis import RedisError
+from rest_framework_simplejwt.settings import api_settings
+
+from helper.redis import redis_keys, redis_tools
+
+log = logging.getLogger(__name__)
+
+# KEYS[1] revocation of the user, KEYS[2] blacklist key of the rotated token, KEYS[3] token log
+# ARGV[1] auth_time, ARGV[2] seconds until the rotated token expires, ARGV[3] log entry
+_ROTATE_SCRIPT = """
+local revoked_at = redis.call('GET', KEYS[1])
+if revoked_at and tonumber(ARGV[1]) < tonumber(revoked_at) then
+    return 'revoked'
+end
+if not redis.call('SET', KEYS[2], 1, 'NX', 'EX', ARGV[2]) then
+    return 'blacklisted'
+end
+redis.call('RPUSH', KEYS[3], ARGV[3])
+return 'rotated'
+"""
+
+ROTATED = "rotated"
+REVOKED = "revoked"
+BLACKLISTED = "blacklisted"
+
+redis_con = redis_tools.get_connection()
+_rotate_script = redis_con.register_script(_ROTATE_SCRIPT)
+
+
+def revoke_user_tokens(user_id):
+    try:
+        redis_con.set(
+            redis_keys.get_user_tokens_revoked_key(user_id), time.time(),
+            ex=int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()),
+        )
+    except RedisError:
+        log.error("Could not revoke the tokens of user %s", user_id, exc_info=True)
+
+
+def is_revoked(user_id, auth_time):
+    """
+    @param auth_time: epoch seconds of the login the token comes from
+    @return: True if the tokens of the user were revoked after that login. The tokens are accepted when redis is not
+    reachable: they are signed, the revocation only cuts their lifetime short
+    """
+    try:
+        revoked_at = redis_con.get(redis_keys.get_user_tokens_revoked_key(user_id))
+    except RedisError:
+        log.error("Could not check the token revocation of user %s", user_id, exc_info=True)
+        return False
+
+    return revoked_at is not None and auth_time < float(revoked_at)
+
+
+async def ais_revoked(user_id, auth_time):
+    """
+    is_revoked for the async views, with the asyncio client of the running event loop
+    """
+    try:
+        revoked_at = await redis_tools.get_async_connection().get(redis_keys.get_user_tokens_revoked_key(user_id))
+    except RedisError:
+        log.error("Could not check the token revocation of user %s", user_id, exc_info=True)
+        return False
+
+    return revoked_at is not None and auth_time < float(revoked_at)
+
+
+def _ttl(exp):
+    return max(1, int(exp - time.time()))
+
+
+def rotate_refresh_token(user_id, auth_time, jti, exp, new_token):
+    """
+    Checks the revocation of the refresh token being rotated, blacklists it and queues the durable record of the
+    rotation, in one round trip. A token can only be rotated once, a concurrent second use is refused.
+    @param new_token: dict {jti, user_id, iat, exp, token} of the refresh token replacing it
+    @return: ROTATED, REVOKED or BLACKLISTED
+    @raise RedisError
+    """
+    return _rotate_script(
+        keys=[
+            redis_keys.get_user_tokens_revoked_key(user_id), redis_keys.get_blacklisted_token_key(jti),
+            redis_keys.get_token_log_key(),
+        ],
+        args=[auth_time, _ttl(exp), json.dumps({"blacklisted": jti, "outstanding": new_token})],
+    ).decode("utf-8")
+
+
+def blacklist(tokens):
+    """
+    @param tokens: list of (jti, exp)
+    """
+    pipe = redis_con.pipeline(transaction=False)
+    for jti, exp in tokens:
+        pipe.set(redis_keys.get_blacklisted_token_key(jti), 1, ex=_ttl(exp))
+    pipe.execute()
+
+
+def get_token_log(count):
+    """
+    @return: list of the oldest queued rotations, dict {blacklisted: jti, outstanding: {jti, user_id, iat, exp, token}}
+    """
+    return [json.loads(entry) for entry in redis_con.lrange(redis_keys.get_token_log_key(), 0, count - 1)]
+
+
+def trim_token_log(count):
+    """
+    Drops the 'count' oldest rotations once they are persisted
+    """
+    redis_con.ltrim(redis_keys.get_token_log_key(), count, -1)
@@ -0,0 +1,164 @@
+"""
+Push of the trip activity to the dispatch screens through redis pub/sub.
+
+Every duty event appended to the log (trip start and phases, rest breaks, fuelings, detected duty statuses) is
+published after its transaction commits, as a compact JSON message, on the channel of its driver, of its vehicle and
+of the fleet. The server-sent event streams (see spotter_eld_api.views.events) of one process share a single pub/sub
+connection: the hub subscribes a channel once whatever the number of streams listening to it and dispatches the
+messages to their queues.
+
+Delivery is best effort: a stream that falls behind or loses the redis connection receives a resync message and ends,
+the client reloads the trips through the REST endpoints and opens a new stream.
+"""
+import asyncio
+import json
+import logging
+import weakref
+
+from django.core.serializers.json import DjangoJSONEncoder
+from redis import RedisError
+
+from helper.redis import redis_keys, redis_tools
+
+log = logging.getLogger(__name__)
+
+# messages waiting to be sent to a stream before it is told to resync
+QUEUE_SIZE = 100
+READ_TIMEOUT = 1
+RECONNECT_DELAY = 1
+
+# put on the queue of a stream that missed messages
+RESYNC = b"resync"
+
+redis_con = redis_tools.get_connection()
+
+
+def publish(duty_events, vehicle_ids):
+    """
+    @param duty_events: DutyEvent list
+    @param vehicle_ids: dict {trip id: vehicle id}
+    """
+    pipe = redis_con.pipeline(transaction=False)
+    for event in duty_events:
+        vehicle_id = vehicle_ids.get(event.trip_id)
+        message = json.dumps({
+            "type": event.type, "ts": event.ts, "driver_id": event.driver_id, "vehicle_id": vehicle_id,
+            "trip_id": event.trip_id, "location_id": event.location_id, "odometer": event.odometer,
+            **event.data,
+        }, cls=DjangoJSONEncoder)
+
+        pipe.publish(redis_keys.get_driver_events_channel(event.driver_id), message)
+        if vehicle_id:
+            pipe.publish(redis_keys.get_vehicle_events_channel(vehicle_id), message)
+        pipe.publish(redis_keys.get_fleet_events_channel(), message)
+
+    try:
+        pipe.execute()
+    except RedisError:
+        log.error("Could not publish %s duty events", len(duty_events), exc_info=True)
+
+
+def _resync(queue):
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(RESYNC)
+
+
+class _Hub:
+    """
+    Subscriptions of the event streams of one event loop, multiplexed on one pub/sub connection
+    """
+
+    def __init__(self):
+        # channel -> queues of the streams listening to it
+        self.queues = {}
+        self.pubsub = None
+        self.reader = None
+
+    async def subscribe(self, channels):
+        """
+        @return: asyncio.Queue receiving the messages of the channels
+        @raise RedisError
+        """
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        new_channels = [channel for channel in channels if channel not in self.queues]
+        for channel in channels:
+            self.queues.setdefault(channel, set()).add(queue)
+
+        if new_channels:
+            try:
+                if self.pubsub is None:
+                    self.pubsub = redis_tools.get_async_connection().pubsub(ignore_subscribe_messages=True)
+                await self.pubsub.subscribe(*new_channels)
+            except RedisError:
+                await self.unsubscribe(channels, queue)
+                raise
+
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.create_task(self._read())
+
+        return queue
+
+    async def unsubscribe(self, channels, queue):
+        unused_channels = []
+        for channel in channels:
+            queues = self.queues.get(channel)
+            if queues is None:
+                continue
+            queues.discard(queue)
+            if not queues:
+                del self.queues[channel]
+                unused_channels.append(channel)
+
+        if unused_channels and self.pubsub is not None:
+            try:
+                await self.pubsub.unsubscribe(*unused_channels)
+            except RedisError:
+                log.error("Could not unsubscribe from %s", unused_channels, exc_info=True)
+
+    async def _read(self):
+        while True:
+            if self.pubsub is None or not self.pubsub.subscribed:
+                await asyncio.sleep(READ_TIMEOUT)
+                continue
+
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=READ_TIMEOUT)
+            except (RedisError, OSError):
+                log.error("Lost the pub/sub connection of the event streams", exc_info=True)
+                await self._reset()
+                continue
+
+            if message and message["type"] == "message":
+                for queue in self.queues.get(message["channel"].decode("utf-8"), ()):
+                    try:
+                        queue.put_nowait(message["data"])
+                    except asyncio.QueueFull:
+                        _resync(queue)
+
+    async def _reset(self):
+        """
+        Drops the connection and every subscription, the streams are told to resync
+        """
+        pubsub, self.pubsub = self.pubsub, None
+        for queues in self.queues.values():
+            for queue in queues:
+                _resync(queue)
+        self.queues.clear()
+
+        try:
+            await pubsub.aclose()
+        except (RedisError, OSError):
+            pass
+        await asyncio.sleep(RECONNECT_DELAY)
+
+
+# event loop -> hub
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    loop = asyncio.get_running_loop()
+    if loop not in _hubs:
+        _hubs[loop] = _Hub()
+    return _hubs[loop]
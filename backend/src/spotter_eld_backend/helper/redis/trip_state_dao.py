@@ -0,0 +1,165 @@
+"""
+Active trip state of each driver, kept in a redis hash so that the trip actions can validate a tap without reading
+the ongoing trip from the database.
+
+The hash is written through after every committed trip change (see spotter_eld_api.signals) and carries a version,
+the updated_dt of the trip in microseconds, so that a late write never replaces a newer state. A driver without an
+ongoing trip has a hash with an empty trip_id. A failed write-through deletes the hash, reads fall back to the
+database when the hash is missing or redis is not reachable.
+"""
+import logging
+from datetime import datetime
+
+from redis import RedisError
+
+from helper.common.constants import TripStatus
+from helper.redis import redis_keys, redis_tools
+
+log = logging.getLogger(__name__)
+
+# bounds the staleness if a write-through ever fails
+TRIP_STATE_TIMEOUT = 60 * 60
+
+PHASE_FIELDS = ['start_dt', 'pickup_start_dt', 'pickup_end_dt', 'drop_off_start_dt', 'drop_off_end_dt']
+
+# replaces the hash only when the stored version is not newer: KEYS[1] hash, ARGV[1] version, ARGV[2] timeout,
+# ARGV[3:] field/value pairs
+_WRITE_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'version') or '-1')
+if current > tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+redis_con = redis_tools.get_connection()
+_write_script = redis_con.register_script(_WRITE_SCRIPT)
+
+
+def get_version(updated_dt):
+    return int(updated_dt.timestamp() * 1000000) if updated_dt else 0
+
+
+def _encode(state, version):
+    fields = {"trip_id": "", "version": version}
+    if state:
+        fields.update({
+            "trip_id": state["trip_id"],
+            "vehicle_id": state["vehicle_id"],
+            "status": state["status"],
+        })
+        for field in PHASE_FIELDS:
+            fields[field] = state[field].isoformat() if state[field] else ""
+
+    return [item for pair in fields.items() for item in pair]
+
+
+def _decode(fields):
+    if not fields.get("trip_id"):
+        return None
+
+    state = {
+        "trip_id": int(fields["trip_id"]),
+        "vehicle_id": int(fields["vehicle_id"]),
+        "status": fields["status"],
+        "version": int(fields["version"]),
+    }
+    for field in PHASE_FIELDS:
+        state[field] = datetime.fromisoformat(fields[field]) if fields.get(field) else None
+
+    return state
+
+
+def _load_from_db(driver_id):
+    """
+    @return: tuple (state of the ongoing trip or None, version)
+    """
+    from spotter_eld.models import Trip
+
+    trip = (
+        Trip.objects.filter(driver_id=driver_id, status=TripStatus.ONGOING)
+        .values('id', 'vehicle_id', 'status', 'updated_dt', *PHASE_FIELDS)
+        .first()
+    )
+    if not trip:
+        # any committed transition has a newer version than this
+        return None, 0
+
+    state = {field: trip[field] for field in ['vehicle_id', 'status', *PHASE_FIELDS]}
+    state["trip_id"] = trip["id"]
+    state["version"] = get_version(trip["updated_dt"])
+
+    return state, state["version"]
+
+
+def _write(driver_id, state, version):
+    _write_script(
+        keys=[redis_keys.get_driver_trip_state_key(driver_id)],
+        args=[version, TRIP_STATE_TIMEOUT, *_encode(state, version)],
+    )
+
+
+def get_active_trip(driver_id):
+    """
+    @param driver_id: Driver id
+    @return: dict {trip_id, vehicle_id, status, version, start_dt, pickup_start_dt, ...} of the ongoing trip of the
+    driver, None if the driver has no ongoing trip
+    """
+    try:
+        fields = redis_tools.hgetall(redis_con, redis_keys.get_driver_trip_state_key(driver_id))
+    except RedisError:
+        log.error("Could not read the trip state of driver %s", driver_id, exc_info=True)
+        return _load_from_db(driver_id)[0]
+
+    if fields:
+        return _decode(fields)
+
+    state, version = _load_from_db(driver_id)
+    try:
+        _write(driver_id, state, version)
+    except RedisError:
+        log.error("Could not write the trip state of driver %s", driver_id, exc_info=True)
+
+    return state
+
+
+def get_driver_trip(driver_id, trip_id):
+    """
+    @return: the state of trip_id if it is the ongoing trip of the driver, None otherwise
+    """
+    state = get_active_trip(driver_id)
+    if state and str(state["trip_id"]) == str(trip_id):
+        return state
+    return None
+
+
+def save_trip(trip):
+    """
+    Writes through the state of the driver of a trip that was just saved (and committed)
+    @param trip: Trip
+    """
+    version = get_version(trip.updated_dt)
+    if trip.status == TripStatus.ONGOING:
+        state = {field: getattr(trip, field) for field in ['vehicle_id', 'status', *PHASE_FIELDS]}
+        state["trip_id"] = trip.id
+    else:
+        # the trip is not (or no more) the active one, the driver may still have another ongoing trip
+        state, loaded_version = _load_from_db(trip.driver_id)
+        version = max(version, loaded_version)
+
+    try:
+        _write(trip.driver_id, state, version)
+    except RedisError:
+        log.error("Could not write the trip state of driver %s", trip.driver_id, exc_info=True)
+        # the next read loads the state from the database instead of the old hash
+        purge(trip.driver_id)
+
+
+def purge(driver_id):
+    try:
+        redis_con.delete(redis_keys.get_driver_trip_state_key(driver_id))
+    except RedisError:
+        log.error("Could not purge the trip state of driver %s", driver_id, exc_info=True)
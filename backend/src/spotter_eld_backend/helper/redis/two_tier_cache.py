@@ -0,0 +1,236 @@
+"""
+Two-tier cache: a bounded LRU in each process in front of redis.
+
+- Stampede protection: when an entry is missing from redis, a single process (the one getting the redis lock) calls
+  fnIfNotFound, the others wait for its result. Entries are also recomputed a bit before they expire, with a
+  probability growing as the expiry gets closer and with the cost of the computation (XFetch), while the current
+  value keeps being served.
+- Invalidation: invalidate() deletes the redis entry and publishes the key, every process drops it from its local tier.
+
+aget() is the same read for the async views, with the asyncio redis client of the running event loop.
+"""
+import asyncio
+import logging
+import math
+import os
+import pickle
+import random
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from redis import RedisError
+
+from helper.redis import redis_keys, redis_tools
+from helper.redis.local_cache import LocalCache
+
+log = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# how long a process waits for another one computing the entry before computing it itself
+LOCK_TIMEOUT = 10
+WAIT_STEP = 0.05
+
+redis_con = redis_tools.get_connection()
+
+_caches = []
+_subscriber = {"pid": None, "thread": None}
+_subscriber_lock = threading.Lock()
+
+
+def _on_invalidation(message):
+    key = message["data"].decode("utf-8")
+    for cache in _caches:
+        cache.local.delete(key)
+
+
+def _ensure_subscribed():
+    """
+    Starts the invalidation listener of this process (once per process, after a fork the thread is gone)
+    """
+    if _subscriber["pid"] == os.getpid():
+        return
+
+    with _subscriber_lock:
+        if _subscriber["pid"] == os.getpid():
+            return
+        try:
+            pubsub = redis_con.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{INVALIDATION_CHANNEL: _on_invalidation})
+            _subscriber["thread"] = pubsub.run_in_thread(sleep_time=1, daemon=True)
+            _subscriber["pid"] = os.getpid()
+        except RedisError:
+            # retried on the next read, meanwhile the local entries expire on their own
+            log.error("Could not subscribe to %s", INVALIDATION_CHANNEL, exc_info=True)
+
+
+class TwoTierCache:
+
+    def __init__(self, timeout_sec, local_timeout_sec=30, max_size=1024, beta=1.0):
+        """
+        @param timeout_sec: time to live of the redis entries
+        @param local_timeout_sec: time to live of the local entries, bounds the staleness if an invalidation is missed
+        @param max_size: number of local entries
+        @param beta: > 1 favors earlier recomputation, 0 disables it
+        """
+        self.timeout_sec = timeout_sec
+        self.beta = beta
+        self.local = LocalCache(max_size=max_size, timeout_sec=local_timeout_sec)
+        _caches.append(self)
+
+    def get(self, key, fnIfNotFound):
+        """
+        @param key: redis key of the entry, see redis_keys
+        @param fnIfNotFound: function called without parameters to compute the value, its result must be picklable
+        @return: the cached or computed value
+        """
+        found, value = self.local.get(key)
+        if found:
+            return value
+
+        _ensure_subscribed()
+
+        try:
+            value = self._get_from_redis(key, fnIfNotFound)
+        except RedisError:
+            log.error("Could not read %s from redis", key, exc_info=True)
+            value = fnIfNotFound()
+
+        self.local.set(key, value)
+        return value
+
+    async def aget(self, key, afnIfNotFound):
+        """
+        @param afnIfNotFound: coroutine function called without parameters to compute the value
+        @return: the cached or computed value
+        """
+        found, value = self.local.get(key)
+        if found:
+            return value
+
+        if _subscriber["pid"] != os.getpid():
+            await sync_to_async(_ensure_subscribed, thread_sensitive=False)()
+
+        try:
+            value = await self._aget_from_redis(redis_tools.get_async_connection(), key, afnIfNotFound)
+        except RedisError:
+            log.error("Could not read %s from redis", key, exc_info=True)
+            value = await afnIfNotFound()
+
+        self.local.set(key, value)
+        return value
+
+    def invalidate(self, *keys):
+        """
+        Removes the entries from redis and from the local tier of every process
+        """
+        self.local.delete(*keys)
+        if not keys:
+            return
+
+        try:
+            pipe = redis_con.pipeline(transaction=False)
+            pipe.delete(*keys)
+            for key in keys:
+                pipe.publish(INVALIDATION_CHANNEL, key)
+            pipe.execute()
+        except RedisError:
+            log.error("Could not invalidate %s", keys, exc_info=True)
+
+    def _get_from_redis(self, key, fnIfNotFound):
+        entry = self._read(key)
+        if entry is not None and not self._should_refresh(entry):
+            return entry["value"]
+
+        lock = redis_con.lock(redis_keys.get_cache_lock_key(key), timeout=LOCK_TIMEOUT)
+        if lock.acquire(blocking=False):
+            try:
+                return self._compute(key, fnIfNotFound)
+            finally:
+                try:
+                    lock.release()
+                except RedisError:
+                    # expired while computing, another process may have taken it
+                    pass
+
+        if entry is not None:
+            # another process is refreshing it
+            return entry["value"]
+
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_STEP)
+            entry = self._read(key)
+            if entry is not None:
+                return entry["value"]
+
+        log.warning("Gave up waiting for %s, computing it", key)
+        return self._compute(key, fnIfNotFound)
+
+    async def _aget_from_redis(self, con, key, afnIfNotFound):
+        entry = self._decode(await con.get(key))
+        if entry is not None and not self._should_refresh(entry):
+            return entry["value"]
+
+        lock = con.lock(redis_keys.get_cache_lock_key(key), timeout=LOCK_TIMEOUT)
+        if await lock.acquire(blocking=False):
+            try:
+                return await self._acompute(con, key, afnIfNotFound)
+            finally:
+                try:
+                    await lock.release()
+                except RedisError:
+                    pass
+
+        if entry is not None:
+            return entry["value"]
+
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(WAIT_STEP)
+            entry = self._decode(await con.get(key))
+            if entry is not None:
+                return entry["value"]
+
+        log.warning("Gave up waiting for %s, computing it", key)
+        return await self._acompute(con, key, afnIfNotFound)
+
+    def _should_refresh(self, entry):
+        if not self.beta:
+            return False
+        return time.time() - entry["delta"] * self.beta * math.log(1 - random.random()) >= entry["expires_at"]
+
+    def _read(self, key):
+        return self._decode(redis_con.get(key))
+
+    @staticmethod
+    def _decode(raw):
+        if raw is None:
+            return None
+
+        entry = pickle.loads(raw)
+        # entries written by cache_tools.get_from_redis before the key moved to this cache
+        if not isinstance(entry, dict) or "expires_at" not in entry:
+            return None
+        return entry
+
+    def _compute(self, key, fnIfNotFound):
+        started = time.time()
+        value = fnIfNotFound()
+        now = time.time()
+
+        entry = {"value": value, "delta": now - started, "expires_at": now + self.timeout_sec}
+        redis_con.set(key, pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL), ex=self.timeout_sec)
+
+        return value
+
+    async def _acompute(self, con, key, afnIfNotFound):
+        started = time.time()
+        value = await afnIfNotFound()
+        now = time.time()
+
+        entry = {"value": value, "delta": now - started, "expires_at": now + self.timeout_sec}
+        await con.set(key, pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL), ex=self.timeout_sec)
+
+        return value
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Driver, Vehicle, Location, Trip, RestBreak, Fueling
+from .models import Driver, Vehicle, Location, Trip, RestBreak, Fueling, DailyLogSheet, DutyEvent
 
 # Register your models here.
 
@@ -57,4 +57,26 @@ class FuelingAdmin(admin.ModelAdmin):
     list_display = ('id', 'trip', 'location', 'amount', 'cost', 'mileage_at_fueling', 'created_dt', 'updated_dt')
     list_filter = ('created_dt', 'updated_dt')
     search_fields = ('trip__id', 'location__name')
-    ordering = ('trip__start_dt',)
\ No newline at end of file
+    ordering = ('trip__start_dt',)
+
+# DailyLogSheet Admin
+@admin.register(DailyLogSheet)
+class DailyLogSheetAdmin(admin.ModelAdmin):
+    list_display = ('id', 'driver', 'date', 'created_dt', 'updated_dt')
+    list_filter = ('date',)
+    search_fields = ('driver__name', 'driver__license_number')
+    ordering = ('-date',)
+
+# DutyEvent Admin, the log is append only
+@admin.register(DutyEvent)
+class DutyEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'driver', 'trip', 'type', 'ts', 'location', 'odometer', 'created_dt')
+    list_filter = ('type', 'ts')
+    search_fields = ('driver__name', 'trip__id')
+    ordering = ('-ts',)
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
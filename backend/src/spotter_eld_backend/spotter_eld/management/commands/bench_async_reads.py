@@ -0,0 +1,219 @@
+import asyncio
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from helper.common.constants import LocationType, TripStatus
+from spotter_eld.models import Driver, DutyEvent, Vehicle, Location, Trip
+from spotter_eld_api.logic import duty_event_logic
+from spotter_eld_api.views.serializers import DriverTokenObtainPairSerializer
+
+# endpoint -> query string
+ENDPOINTS = {
+    "get_trips": "page_size=20",
+    "get_trip_trace": "id={trip_id}",
+    "get_driver_log_sheet": "date={log_date}",
+    "get_trip_form_data": "",
+}
+
+READY_TIMEOUT = 30
+REQUEST_TIMEOUT = 30
+
+
+class Command(BaseCommand):
+    help = (
+        "Opens --connections simultaneous connections on the sync endpoints served by gunicorn sync workers (the WSGI "
+        "deployment) then on their async variants served by gunicorn uvicorn workers (spotter_eld.asgi), and "
+        "compares the throughput and latencies. The servers read the configured database and redis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="get_trips")
+        parser.add_argument("--connections", type=int, default=1000)
+        parser.add_argument("--seconds", type=int, default=20)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--trips", type=int, default=200)
+
+    def handle(self, *args, **options):
+        # each connection is a file descriptor of this process
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < options["connections"] + 100:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, options["connections"] + 100), hard))
+
+        # the servers are other processes: the fixture is committed and deleted at the end
+        user, trip = self._create_fixture(options["trips"])
+        try:
+            access = str(DriverTokenObtainPairSerializer.get_token(user).access_token)
+            query = ENDPOINTS[options["endpoint"]].format(trip_id=trip.id, log_date=timezone.localdate(trip.start_dt))
+
+            deployments = [
+                ("WSGI, sync workers", ["spotter_eld.wsgi"], f"/api/trips/{options['endpoint']}"),
+                ("ASGI, uvicorn workers", ["-k", "uvicorn.workers.UvicornWorker", "spotter_eld.asgi"],
+                 f"/api/async/trips/{options['endpoint']}"),
+            ]
+            for name, server_args, path in deployments:
+                with self._serve(server_args, options["workers"], options["port"]):
+                    results = asyncio.run(self._load(
+                        options["port"], f"{path}?{query}", access, options["connections"], options["seconds"]
+                    ))
+                self._report(name, options["connections"], options["seconds"], *results)
+        finally:
+            Trip.objects.filter(driver__user=user).delete()
+            Vehicle.objects.filter(vin=f"BENCH{user.id:012d}").delete()
+            Location.objects.filter(name__startswith=f"Bench {user.id} ").delete()
+            user.delete()
+
+    def _create_fixture(self, trip_count):
+        user = User.objects.create_user(username=f"bench-{time.time_ns()}")
+        driver = Driver.objects.create(user=user, name="Bench driver", license_number=f"BENCH-{user.id}")
+        vehicle = Vehicle.objects.create(name="Bench truck", model="B", year=2020, vin=f"BENCH{user.id:012d}")
+        locations = Location.objects.bulk_create([
+            Location(name=f"Bench {user.id} {i}", latitude=i, longitude=i, type=LocationType.TRIP_START)
+            for i in range(10)
+        ])
+
+        start = timezone.now() - timedelta(hours=trip_count * 3)
+        trips = []
+        for i in range(trip_count):
+            trip_start = start + timedelta(hours=i * 3)
+            trips.append(Trip(
+                driver=driver, vehicle=vehicle, distance=100,
+                start_location=locations[i % 10], end_location=locations[(i + 1) % 10],
+                start_dt=trip_start, pickup_start_dt=trip_start + timedelta(minutes=30),
+                pickup_end_dt=trip_start + timedelta(minutes=90), drop_off_start_dt=trip_start + timedelta(hours=2),
+                drop_off_end_dt=trip_start + timedelta(hours=2, minutes=30), end_dt=trip_start + timedelta(hours=2, minutes=30),
+                status=TripStatus.ENDED,
+            ))
+        trips = Trip.objects.bulk_create(trips)
+
+        trip = trips[-1]
+        DutyEvent.objects.bulk_create([
+            duty_event_logic.build_event(driver.id, trip.id, event_type, getattr(trip, column))
+            for event_type, column in duty_event_logic.PHASE_COLUMNS.items()
+        ])
+
+        return user, trip
+
+    @contextmanager
+    def _serve(self, server_args, workers, port):
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "--backlog", "4096",
+             "--log-level", "warning", *server_args],
+            cwd=settings.BASE_DIR, env={**os.environ, "DJANGO_SETTINGS_MODULE": "spotter_eld.settings"},
+        )
+        try:
+            deadline = time.monotonic() + READY_TIMEOUT
+            while True:
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                    break
+                except OSError:
+                    if process.poll() is not None or time.monotonic() > deadline:
+                        raise CommandError(f"gunicorn did not start: {' '.join(server_args)}")
+                    time.sleep(0.2)
+            # the other workers boot after the first one accepts
+            time.sleep(2)
+
+            yield
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    async def _load(self, port, path, access, connections, seconds):
+        """
+        Every connection sends its requests one after the other until the deadline, reconnecting when the server
+        closes it (the sync workers close every connection)
+        @return: (latencies of the 200 responses, number of errors by kind)
+        """
+        request = (
+            f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nAuthorization: Bearer {access}\r\n\r\n"
+        ).encode("ascii")
+        deadline = time.monotonic() + seconds
+        latencies = []
+        errors = {}
+
+        async def _client():
+            reader = writer = None
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.wait_for(
+                            asyncio.open_connection("127.0.0.1", port), REQUEST_TIMEOUT
+                        )
+                    writer.write(request)
+                    status_code, keep_alive = await asyncio.wait_for(_read_response(reader), REQUEST_TIMEOUT)
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                    status_code, keep_alive = None, False
+                else:
+                    if status_code == 200:
+                        latencies.append(time.perf_counter() - started)
+                    else:
+                        errors[f"HTTP {status_code}"] = errors.get(f"HTTP {status_code}", 0) + 1
+
+                if not keep_alive and writer is not None:
+                    writer.close()
+                    reader = writer = None
+
+            if writer is not None:
+                writer.close()
+
+        await asyncio.gather(*[_client() for _ in range(connections)])
+        return latencies, errors
+
+    def _report(self, name, connections, seconds, latencies, errors):
+        latencies.sort()
+        if not latencies:
+            self.stdout.write(f"{name}: no successful request, errors {errors}")
+            return
+
+        self.stdout.write(
+            f"{name}: {connections} connections, {len(latencies) / seconds:,.0f} requests/s, "
+            f"p50 {statistics.median(latencies) * 1000:.0f}ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.0f}ms, "
+            f"errors {errors or 0}"
+        )
+
+
+async def _read_response(reader):
+    """
+    @return: (status code, True if the connection can be reused), the body is read and dropped
+    """
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status_code = int(lines[0].split(" ")[1])
+
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip().lower()
+
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).strip(), 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.read()
+        return status_code, False
+
+    return status_code, headers.get("connection") != "close"
@@ -0,0 +1,99 @@
+import random
+import statistics
+import time
+
+from django.core import serializers
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from helper.redis import cache_tools, redis_dao, redis_keys
+from spotter_eld.models import Driver, Vehicle, Location, Trip
+
+MODELS = {
+    "driver": Driver,
+    "vehicle": Vehicle,
+    "location": Location,
+    "trip": Trip,
+}
+
+
+def _legacy_get_model_from_redis(key, fnIfNotFound, timeout_sec):
+    """
+    Previous cache_tools.get_model_from_redis: JSON serializer, re-read after a miss and a separate EXPIRE on hits
+    """
+    redis_con = cache_tools.redis_con
+
+    obj = redis_con.get(key)
+    if obj is None:
+        obj = fnIfNotFound()
+        redis_con.set(key, serializers.serialize('json', obj), ex=timeout_sec)
+        obj = redis_con.get(key)
+
+    redis_con.expire(key, timeout_sec)
+
+    return [d.object for d in serializers.deserialize('json', obj)]
+
+
+class Command(BaseCommand):
+    help = "Compares the hit ratio and latency of the model cache with the previous JSON based implementation"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=MODELS.keys(), default="location")
+        parser.add_argument("--requests", type=int, default=20000)
+        parser.add_argument("--keys", type=int, default=500, help="number of distinct ids read")
+        parser.add_argument("--skew", type=float, default=1.2, help="zipf exponent of the id popularity")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        model = MODELS[options["model"]]
+        ids = list(model.objects.order_by("id").values_list("id", flat=True)[:options["keys"]])
+        if not ids:
+            raise CommandError(f"No {options['model']} rows, generate some data first.")
+
+        # zipf-like popularity: a few hot ids are read most of the time
+        weights = [1 / (rank + 1) ** options["skew"] for rank in range(len(ids))]
+        workload = random.Random(options["seed"]).choices(ids, weights=weights, k=options["requests"])
+
+        self.stdout.write(f"{len(workload)} reads of {len(ids)} {options['model']} ids")
+
+        self._run("legacy (json + re-read + expire)", workload, lambda obj_id, fn: _legacy_get_model_from_redis(
+            "bench:legacy:%s:%s" % (options["model"], obj_id), fn, redis_dao.MODEL_CACHE_TIMEOUT
+        ), model)
+
+        self._run("redis (pickle + pipelined expire)", workload, lambda obj_id, fn: cache_tools.get_model_from_redis(
+            "bench:pickle:%s:%s" % (options["model"], obj_id), fn, redis_dao.MODEL_CACHE_TIMEOUT
+        ), model)
+
+        local = redis_dao.model_cache.local
+        local.clear()
+        redis_dao.model_cache.invalidate(*[redis_keys.get_model_cache_key(model._meta.model_name, obj_id) for obj_id in ids])
+        self._run("local lru + redis (redis_dao)", workload, lambda obj_id, fn: redis_dao._get_model(model, obj_id), model)
+        self.stdout.write(f"  local tier: {local.hits} hits / {local.misses} misses")
+
+        cache_tools.purge_cache(
+            ["bench:%s:%s:%s" % (prefix, options["model"], obj_id) for prefix in ("legacy", "pickle") for obj_id in ids]
+        )
+
+    def _run(self, name, workload, get, model):
+        def _loader(obj_id):
+            def _get_obj():
+                return model.objects.filter(pk=obj_id)
+            return _get_obj
+
+        latencies = []
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for obj_id in workload:
+                t0 = time.perf_counter()
+                get(obj_id, _loader(obj_id))
+                latencies.append(time.perf_counter() - t0)
+            elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        # every miss of both tiers is one query
+        hit_ratio = 1 - len(queries) / len(workload)
+        self.stdout.write(
+            f"{name}: {len(workload) / elapsed:,.0f} reads/s, hit ratio {hit_ratio:.1%}, "
+            f"p50 {statistics.median(latencies) * 1e6:.0f}us, p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f}us"
+        )
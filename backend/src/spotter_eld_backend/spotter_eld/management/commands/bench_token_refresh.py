@@ -0,0 +1,58 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+
+from spotter_eld_api.views.serializers import DriverTokenObtainPairSerializer, DriverTokenRefreshSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compares the refresh throughput of the token_blacklist tables with the redis blacklist"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--refreshes", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        # the user and the tokens written to the database are rolled back at the end
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(username=f"bench-{time.time_ns()}")
+                self._run("database (token_blacklist tables)", TokenRefreshSerializer, user, options["refreshes"])
+                self._run("redis (token_dao)", DriverTokenRefreshSerializer, user, options["refreshes"])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _run(self, name, serializer_class, user, count):
+        refresh = str(DriverTokenObtainPairSerializer.get_token(user))
+
+        queries = []
+
+        def _count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        latencies = []
+        with connection.execute_wrapper(_count_query):
+            started = time.perf_counter()
+            for _ in range(count):
+                t0 = time.perf_counter()
+                serializer = serializer_class(data={"refresh": refresh})
+                serializer.is_valid(raise_exception=True)
+                # each refresh uses the token of the previous rotation, as a client does
+                refresh = serializer.validated_data["refresh"]
+                latencies.append(time.perf_counter() - t0)
+            elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        self.stdout.write(
+            f"{name}: {count / elapsed:,.0f} refreshes/s, {len(queries) / count:.1f} queries per refresh, "
+            f"p50 {statistics.median(latencies) * 1e6:.0f}us, p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f}us"
+        )
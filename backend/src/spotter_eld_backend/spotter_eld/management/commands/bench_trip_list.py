@@ -0,0 +1,84 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from helper.common.constants import LocationType, TripStatus
+from spotter_eld.models import Driver, Vehicle, Location, Trip
+from spotter_eld_api.logic import trip_list_logic
+from spotter_eld_api.views.serializers import TripListSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compares the throughput of TripListSerializer with the .values() based trip list rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--trips", type=int, default=1000)
+        parser.add_argument("--locations", type=int, default=50)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        # the fixture is created in a transaction rolled back at the end
+        try:
+            with transaction.atomic():
+                driver = self._create_fixture(options["trips"], options["locations"])
+                self._bench(driver, options["repeat"])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _create_fixture(self, trip_count, location_count):
+        user = User.objects.create_user(username=f"bench-{time.time_ns()}")
+        driver = Driver.objects.create(user=user, name="Bench driver", license_number=f"BENCH-{user.id}")
+        vehicle = Vehicle.objects.create(name="Bench truck", model="B", year=2020, vin=f"BENCH{user.id:012d}")
+        locations = Location.objects.bulk_create([
+            Location(name=f"Bench location {i}", latitude=i, longitude=i, type=LocationType.TRIP_START)
+            for i in range(location_count)
+        ])
+
+        start = timezone.now() - timedelta(hours=trip_count * 3)
+        trips = []
+        for i in range(trip_count):
+            trip_start = start + timedelta(hours=i * 3)
+            trips.append(Trip(
+                driver=driver, vehicle=vehicle, distance=100,
+                start_location=locations[i % location_count], end_location=locations[(i + 1) % location_count],
+                start_dt=trip_start, pickup_start_dt=trip_start + timedelta(minutes=30),
+                pickup_end_dt=trip_start + timedelta(minutes=90), drop_off_start_dt=trip_start + timedelta(hours=2),
+                drop_off_end_dt=trip_start + timedelta(hours=2, minutes=30), end_dt=trip_start + timedelta(hours=2, minutes=30),
+                status=TripStatus.ENDED,
+            ))
+        Trip.objects.bulk_create(trips)
+
+        return driver
+
+    def _bench(self, driver, repeat):
+        def _serializer():
+            return TripListSerializer(Trip.objects.filter(driver=driver).select_related('driver', 'vehicle'), many=True).data
+
+        def _rows():
+            return trip_list_logic.get_trip_rows(Trip.objects.filter(driver=driver))
+
+        def _rows_without_nested():
+            return trip_list_logic.get_trip_rows(Trip.objects.filter(driver=driver), expand=[])
+
+        baseline = None
+        for name, fn in [("TripListSerializer", _serializer), ("values() rows", _rows),
+                         ("values() rows, expand=", _rows_without_nested)]:
+            fn()
+            started = time.perf_counter()
+            for _ in range(repeat):
+                fn()
+            per_list = (time.perf_counter() - started) / repeat
+
+            baseline = baseline or per_list
+            self.stdout.write(
+                f"{name}: {per_list * 1000:.1f} ms per list, {1 / per_list:.1f} lists/s, x{baseline / per_list:.1f}"
+            )
@@ -0,0 +1,48 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from helper.redis import breadcrumb_stream
+from spotter_eld_api.logic import telemetry_logic
+
+REPORT_EVERY_SEC = 10
+
+
+class Command(BaseCommand):
+    help = "Inserts the GPS breadcrumbs queued in the redis stream, run one or more per node"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--consumer", help="name of this worker in the consumer group, defaults to host-pid")
+        parser.add_argument("--count", type=int, default=500, help="stream entries (uploads) read at once")
+        parser.add_argument("--block", type=int, default=1000, help="milliseconds to wait for new entries")
+        parser.add_argument("--once", action="store_true", help="drain what is queued and exit")
+
+    def handle(self, *args, **options):
+        consumer = options["consumer"] or f"{socket.gethostname()}-{os.getpid()}"
+        breadcrumb_stream.ensure_group()
+
+        total = reported = 0
+        started = last_claim = last_report = time.monotonic()
+        claim_stale = True
+        while True:
+            inserted = telemetry_logic.drain(
+                consumer, count=options["count"], block_ms=options["block"], claim_stale=claim_stale
+            )
+            total += inserted
+
+            now = time.monotonic()
+            claim_stale = now - last_claim >= breadcrumb_stream.CLAIM_IDLE_MS / 1000
+            if claim_stale:
+                last_claim = now
+
+            if options["once"] and not inserted:
+                break
+            if now - last_report >= REPORT_EVERY_SEC:
+                self.stdout.write(f"{total} samples inserted, {(total - reported) / (now - last_report):.0f} samples/s")
+                reported, last_report = total, now
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} samples inserted in {time.monotonic() - started:.1f}s"
+        ))
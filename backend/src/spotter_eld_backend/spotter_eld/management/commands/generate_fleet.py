@@ -0,0 +1,418 @@
+import math
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from helper.common.constants import DutyEventType, LocationType, TripStatus
+from spotter_eld.models import Driver, DriverHos, DutyEvent, Fueling, Location, RestBreak, Trip, Vehicle
+from spotter_eld_api.logic import cycle_logic, duty_event_logic, trip_logic
+
+# continental US
+LATITUDES = (25.0, 49.0)
+LONGITUDES = (-124.0, -67.0)
+EARTH_RADIUS_MILES = 3959
+# road miles per great circle mile
+ROAD_FACTOR = 1.2
+# end locations drawn for a trip, the nearest one is taken: mostly regional hauls, a few long ones
+END_CANDIDATES = 20
+
+# location type -> share of the locations
+LOCATION_SHARES = {
+    LocationType.TRIP_START: 0.3, LocationType.TRIP_END: 0.3, LocationType.FUELING: 0.2, LocationType.BREAK_REST: 0.2,
+}
+
+# hours of service of property carrying drivers
+MAX_DRIVING_HOURS = 11
+MAX_WINDOW_HOURS = 14
+BREAK_AFTER_DRIVING_HOURS = 8
+BREAK_MINUTES = (30, 45)
+OFF_DUTY_HOURS = (10, 12)
+RESTART_HOURS = (34, 48)
+# a new shift is not started when it could take the driver over the cycle limit
+SHIFT_ON_DUTY_HOURS = 14
+
+SPEED_MPH = (48, 62)
+DEADHEAD_MILES = (5, 60)
+PHASE_MINUTES = (30, 150, 60)  # triangular: low, high, mode
+# between two trips of a shift
+TURNAROUND_HOURS = (0.5, 2)
+
+# refuels before sync_logic.MAX_FUELING_MILES
+FUEL_RANGE_MILES = (650, 950)
+FUELING_MINUTES = (15, 35)
+MPG = (5.5, 7.5)
+FUEL_PRICE = (3.4, 4.6)
+
+# trips are only started that long before now, the ones ending after now are dropped
+END_MARGIN = timedelta(hours=2)
+
+# epsilon of the hour counters
+EPSILON = 1e-6
+
+
+def _distance_miles(a, b):
+    lat1, lon1, lat2, lon2 = map(math.radians, (a.latitude, a.longitude, b.latitude, b.longitude))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(h))
+
+
+@contextmanager
+def _historical_created_dt(*model_classes):
+    """
+    The generated rows keep the created_dt they are given (the fueling time is its created_dt) instead of the time of
+    the insert
+    """
+    fields = [model_class._meta.get_field('created_dt') for model_class in model_classes]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class _TripRows:
+    """
+    Rows of one simulated trip, added to the fleet once the trip ended before now
+    """
+
+    def __init__(self):
+        self.trip = None
+        self.rest_breaks = []
+        self.fuelings = []
+        self.duty_events = []
+
+
+class _DriverClock:
+    """
+    Hours of service state of a driver: the current time, the open shift and the on-duty hours of the cycle
+    """
+
+    def __init__(self, rng, start):
+        self.rng = rng
+        self.t = start
+        # date -> hours driving or on duty, for the cycle limit
+        self.on_duty = {}
+        # date -> [driving hours, on-duty hours], the DriverHos rows of the driver as the trips closing would write
+        # them (see cycle_logic.trip_day_buckets)
+        self.buckets = {}
+        self.start_shift()
+
+    def start_shift(self):
+        self.shift_start = self.t
+        self.shift_driving = 0
+        self.driving_since_break = 0
+
+    def window_left(self):
+        return MAX_WINDOW_HOURS - (self.t - self.shift_start).total_seconds() / 3600
+
+    def work(self, hours):
+        end = self.t + timedelta(hours=hours)
+        for day, day_hours in cycle_logic.split_hours_by_day(self.t, end).items():
+            self.on_duty[day] = self.on_duty.get(day, 0) + day_hours
+        self.t = end
+
+    def off_duty_hours(self):
+        """
+        @return: hours until the next shift, a restart when the next shift could break the cycle limit
+        """
+        first_day = cycle_logic.get_window_start(timezone.localdate(self.t))
+        cycle_hours = sum(hours for day, hours in self.on_duty.items() if day >= first_day)
+        if cycle_hours + SHIFT_ON_DUTY_HOURS > cycle_logic.CYCLE_LIMIT_HOURS:
+            return self.rng.uniform(*RESTART_HOURS)
+        return self.rng.uniform(*OFF_DUTY_HOURS)
+
+    def end_shift(self):
+        self.t += timedelta(hours=self.off_duty_hours())
+        self.start_shift()
+
+    def add_trip(self, trip):
+        for day, (driving, on_duty) in cycle_logic.trip_day_buckets(trip).items():
+            bucket = self.buckets.setdefault(day, [0, 0])
+            bucket[0] += driving
+            bucket[1] += on_duty
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a synthetic fleet: --drivers drivers with their users and vehicles, --locations locations and "
+        "--months months of trips per driver with their pickup/drop-off phases, rest breaks, fuelings, duty events "
+        "and daily on-duty buckets. The schedules follow the hours of service rules (11 hours driving in a 14 hours "
+        "window, 30 minutes break after 8 hours driving, 10 hours off duty, 34 hours restart before the 70 hours "
+        "cycle limit). The same --seed generates the same fleet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--drivers", type=int, default=100)
+        parser.add_argument("--vehicles", type=int, help="defaults to --drivers, a vehicle per driver")
+        parser.add_argument("--locations", type=int, default=500)
+        parser.add_argument("--months", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--chunk-size", type=int, default=5000, help="rows per bulk_create")
+        parser.add_argument("--password", help="password of the generated users, unusable by default")
+
+    def handle(self, *args, **options):
+        if options["drivers"] < 1 or options["locations"] < len(LOCATION_SHARES) or options["months"] < 1:
+            raise CommandError("--drivers and --months must be positive, --locations at least 4.")
+
+        self.seed = options["seed"]
+        self.chunk_size = options["chunk_size"]
+        if User.objects.filter(username__startswith=f"fleet-{self.seed}-").exists():
+            raise CommandError(f"A fleet was already generated with seed {self.seed}, pass another --seed.")
+
+        self.rng = random.Random(self.seed)
+        # the primary keys are assigned here: the children of a chunk reference rows that MySQL would not return
+        self.next_ids = {}
+        self.pending = {model_class: [] for model_class in (Trip, RestBreak, Fueling, DutyEvent, DriverHos)}
+        self.counts = {}
+        self.started = time.perf_counter()
+
+        if connection.vendor == "sqlite" and not connection.in_atomic_block:
+            # a throwaway database: the chunks do not wait for the disk
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA synchronous = OFF")
+
+        end = timezone.now() - END_MARGIN
+        start = end - timedelta(days=30 * options["months"])
+
+        drivers = self._create_drivers(options["drivers"], options["password"])
+        vehicles = self._create_vehicles(options["vehicles"] or options["drivers"])
+        self._create_locations(options["locations"])
+        # vehicle id -> odometer
+        self.odometers = {vehicle.id: vehicle.current_mileage for vehicle in vehicles}
+
+        with _historical_created_dt(Trip, RestBreak, Fueling, DutyEvent):
+            for i, driver in enumerate(drivers):
+                self._simulate_driver(driver, vehicles[i % len(vehicles)], start, end)
+            self._flush()
+
+        for vehicle in vehicles:
+            vehicle.current_mileage = int(self.odometers[vehicle.id])
+        Vehicle.objects.bulk_update(vehicles, ["current_mileage"], batch_size=self.chunk_size)
+
+        elapsed = time.perf_counter() - self.started
+        total = sum(self.counts.values())
+        self.stdout.write(
+            f"Generated {total:,} rows in {elapsed:.0f}s ({total / elapsed:,.0f} rows/s): "
+            + ", ".join(f"{count:,} {name}" for name, count in self.counts.items())
+        )
+
+    # ===========================================================================
+    # Rows
+    # ===========================================================================
+
+    def _new_id(self, model_class):
+        if model_class not in self.next_ids:
+            self.next_ids[model_class] = (model_class.objects.aggregate(Max("id"))["id__max"] or 0) + 1
+        self.next_ids[model_class] += 1
+        return self.next_ids[model_class] - 1
+
+    def _bulk_create(self, model_class, objs):
+        if model_class is DutyEvent:
+            # past events: DutyEvent.objects would push them to the dispatch streams
+            queryset = models.QuerySet(DutyEvent)
+        else:
+            queryset = model_class.objects
+        with transaction.atomic():
+            queryset.bulk_create(objs, batch_size=self.chunk_size)
+
+        name = model_class._meta.verbose_name_plural
+        self.counts[name] = self.counts.get(name, 0) + len(objs)
+
+    def _flush(self):
+        """
+        Inserts the pending rows, the trips before their children
+        """
+        for model_class, objs in self.pending.items():
+            if objs:
+                self._bulk_create(model_class, objs)
+                objs.clear()
+
+        total = sum(self.counts.values())
+        self.stdout.write(f"{total:,} rows, {total / (time.perf_counter() - self.started):,.0f} rows/s")
+
+    def _create_drivers(self, count, password):
+        password = make_password(password)
+        users = [
+            User(id=self._new_id(User), username=f"fleet-{self.seed}-driver-{i}", password=password,
+                 first_name="Driver", last_name=str(i), date_joined=timezone.now())
+            for i in range(count)
+        ]
+        drivers = [
+            Driver(id=self._new_id(Driver), user_id=user.id, name=f"Driver {self.seed}-{i}",
+                   license_number=f"FLEET-{self.seed}-{i:07d}")
+            for i, user in enumerate(users)
+        ]
+        for i in range(0, count, self.chunk_size):
+            self._bulk_create(User, users[i:i + self.chunk_size])
+            self._bulk_create(Driver, drivers[i:i + self.chunk_size])
+        return drivers
+
+    def _create_vehicles(self, count):
+        vehicles = [
+            Vehicle(id=self._new_id(Vehicle), name=f"Truck {i}", model=self.rng.choice(["T680", "579", "Cascadia", "VNL"]),
+                    year=self.rng.randint(2012, 2025), vin=f"F{self.seed % 100000:05d}{i:011d}",
+                    current_mileage=self.rng.randint(20000, 600000))
+            for i in range(count)
+        ]
+        self._bulk_create(Vehicle, vehicles)
+        return vehicles
+
+    def _create_locations(self, count):
+        self.locations = {}
+        for location_type, share in LOCATION_SHARES.items():
+            self.locations[location_type] = [
+                Location(id=self._new_id(Location), name=f"Fleet {self.seed} {location_type.lower()} {i}",
+                         latitude=round(self.rng.uniform(*LATITUDES), 6),
+                         longitude=round(self.rng.uniform(*LONGITUDES), 6), type=location_type)
+                for i in range(max(1, int(count * share)))
+            ]
+            self._bulk_create(Location, self.locations[location_type])
+
+    # ===========================================================================
+    # Schedules
+    # ===========================================================================
+
+    def _simulate_driver(self, driver, vehicle, start, end):
+        # first shift some time in the first day
+        clock = _DriverClock(self.rng, start + timedelta(hours=self.rng.uniform(0, 24)))
+        fuel = {"miles": 0, "range": self.rng.uniform(*FUEL_RANGE_MILES)}
+
+        while clock.t < end:
+            rows = self._simulate_trip(clock, driver.id, vehicle.id, fuel)
+            if rows.trip.end_dt > end:
+                break
+
+            clock.add_trip(rows.trip)
+            self.pending[Trip].append(rows.trip)
+            self.pending[RestBreak].extend(rows.rest_breaks)
+            self.pending[Fueling].extend(rows.fuelings)
+            self.pending[DutyEvent].extend(rows.duty_events)
+            if sum(len(objs) for objs in self.pending.values()) >= self.chunk_size:
+                self._flush()
+
+            if clock.shift_driving < MAX_DRIVING_HOURS - 2 and clock.window_left() > 3:
+                clock.t += timedelta(hours=self.rng.uniform(*TURNAROUND_HOURS))
+            else:
+                clock.end_shift()
+
+        self.pending[DriverHos].extend(
+            DriverHos(driver_id=driver.id, date=day, total_driving_hours=round(driving, 2),
+                      total_on_duty_hours=round(on_duty, 2))
+            for day, (driving, on_duty) in clock.buckets.items()
+        )
+
+    def _simulate_trip(self, clock, driver_id, vehicle_id, fuel):
+        rng = self.rng
+        rows = _TripRows()
+        trip_id = self._new_id(Trip)
+        start_location = rng.choice(self.locations[LocationType.TRIP_START])
+        end_location = min(
+            rng.sample(self.locations[LocationType.TRIP_END], min(END_CANDIDATES, len(self.locations[LocationType.TRIP_END]))),
+            key=lambda location: _distance_miles(start_location, location)
+        )
+        loaded_miles = max(20, _distance_miles(start_location, end_location) * ROAD_FACTOR)
+        deadhead_miles = rng.uniform(*DEADHEAD_MILES)
+        speed = rng.uniform(*SPEED_MPH)
+
+        def _event(event_type, **kwargs):
+            event = duty_event_logic.build_event(driver_id, trip_id, event_type, clock.t, **kwargs)
+            event.created_dt = event.ts
+            rows.duty_events.append(event)
+
+        def _rest(minutes):
+            rest_break = RestBreak(
+                id=self._new_id(RestBreak), trip_id=trip_id, location=rng.choice(self.locations[LocationType.BREAK_REST]),
+                start_dt=clock.t, end_dt=clock.t + timedelta(minutes=minutes), duration=round(minutes, 2),
+                created_dt=clock.t,
+            )
+            rows.rest_breaks.append(rest_break)
+            _event(DutyEventType.REST_BREAK_START, location_id=rest_break.location_id, rest_break_id=rest_break.id)
+            clock.t = rest_break.end_dt
+            _event(DutyEventType.REST_BREAK_END, location_id=rest_break.location_id, rest_break_id=rest_break.id,
+                   duration=rest_break.duration)
+
+        def _refuel():
+            minutes = rng.uniform(*FUELING_MINUTES)
+            amount = round(fuel["miles"] / rng.uniform(*MPG), 1)
+            fueling = Fueling(
+                id=self._new_id(Fueling), trip_id=trip_id, location=rng.choice(self.locations[LocationType.FUELING]),
+                amount=amount, cost=round(amount * rng.uniform(*FUEL_PRICE), 2), duration=round(minutes, 2),
+                mileage_at_fueling=int(self.odometers[vehicle_id]), created_dt=clock.t,
+            )
+            rows.fuelings.append(fueling)
+            _event(DutyEventType.FUELING, location_id=fueling.location_id, odometer=fueling.mileage_at_fueling,
+                   fueling_id=fueling.id, amount=fueling.amount, cost=fueling.cost, duration=fueling.duration)
+            clock.work(minutes / 60)
+            fuel["miles"], fuel["range"] = 0, rng.uniform(*FUEL_RANGE_MILES)
+
+        def _drive(miles):
+            while miles > EPSILON:
+                if clock.shift_driving >= MAX_DRIVING_HOURS - EPSILON or clock.window_left() <= EPSILON:
+                    # sleeper berth until the next shift, the trip goes on
+                    _rest(clock.off_duty_hours() * 60)
+                    clock.start_shift()
+                elif clock.driving_since_break >= BREAK_AFTER_DRIVING_HOURS - EPSILON:
+                    _rest(rng.uniform(*BREAK_MINUTES))
+                    clock.driving_since_break = 0
+                elif fuel["miles"] >= fuel["range"] - EPSILON:
+                    _refuel()
+                else:
+                    hours = min(
+                        MAX_DRIVING_HOURS - clock.shift_driving,
+                        BREAK_AFTER_DRIVING_HOURS - clock.driving_since_break,
+                        clock.window_left(),
+                    )
+                    step = min(miles, hours * speed, fuel["range"] - fuel["miles"])
+                    clock.work(step / speed)
+                    clock.shift_driving += step / speed
+                    clock.driving_since_break += step / speed
+                    self.odometers[vehicle_id] += step
+                    fuel["miles"] += step
+                    miles -= step
+
+        def _on_duty():
+            minutes = rng.triangular(*PHASE_MINUTES)
+            clock.work(minutes / 60)
+            # a 30 minutes interruption of the driving counts as the break
+            if minutes >= BREAK_MINUTES[0]:
+                clock.driving_since_break = 0
+
+        start_dt = clock.t
+        _event(DutyEventType.TRIP_START, location_id=start_location.id, odometer=round(self.odometers[vehicle_id], 1))
+        _drive(deadhead_miles)
+
+        pickup_start_dt = clock.t
+        _event(DutyEventType.PICKUP_START, odometer=round(self.odometers[vehicle_id], 1))
+        _on_duty()
+        pickup_end_dt = clock.t
+        _event(DutyEventType.PICKUP_END, odometer=round(self.odometers[vehicle_id], 1))
+        _drive(loaded_miles)
+
+        drop_off_start_dt = clock.t
+        _event(DutyEventType.DROP_OFF_START, odometer=round(self.odometers[vehicle_id], 1))
+        _on_duty()
+        _event(DutyEventType.DROP_OFF_END, odometer=round(self.odometers[vehicle_id], 1))
+        _event(DutyEventType.TRIP_END, location_id=end_location.id, odometer=round(self.odometers[vehicle_id], 1))
+
+        pickup_duration = trip_logic.get_phase_minutes(pickup_start_dt, pickup_end_dt)
+        drop_off_duration = trip_logic.get_phase_minutes(drop_off_start_dt, clock.t)
+        rows.trip = Trip(
+            id=trip_id, driver_id=driver_id, vehicle_id=vehicle_id, start_location=start_location,
+            end_location=end_location, start_dt=start_dt, end_dt=clock.t, pickup_start_dt=pickup_start_dt,
+            pickup_end_dt=pickup_end_dt, pickup_duration=pickup_duration, drop_off_start_dt=drop_off_start_dt,
+            drop_off_end_dt=clock.t, drop_off_duration=drop_off_duration, status=TripStatus.ENDED,
+            violations=(trip_logic.get_pickup_violations(pickup_duration)
+                        + (trip_logic.get_drop_off_violation(drop_off_duration) or "")) or None,
+            distance=round(deadhead_miles + loaded_miles, 1), created_dt=start_dt,
+        )
+        return rows
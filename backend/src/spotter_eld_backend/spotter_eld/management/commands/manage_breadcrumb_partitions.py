@@ -0,0 +1,56 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+TABLE = "spotter_eld_breadcrumb"
+
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+class Command(BaseCommand):
+    help = "Adds the monthly partitions of the breadcrumb table ahead of time and drops the expired ones (MySQL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months-ahead", type=int, default=3)
+        parser.add_argument("--retention-months", type=int, default=12, help="months of breadcrumbs kept")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "mysql":
+            self.stdout.write("The breadcrumb table is only partitioned on MySQL, nothing to do.")
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL",
+                [TABLE]
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+
+            this_month = date.today().replace(day=1)
+
+            # new months are split out of the catch-all pmax partition, which is empty as long as this runs ahead
+            added = []
+            for i in range(options["months_ahead"] + 1):
+                month = _add_months(this_month, i)
+                if f"p{month:%Y%m}" not in existing:
+                    added.append(
+                        f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{_add_months(month, 1):%Y-%m-%d}'))"
+                    )
+            if added:
+                cursor.execute(
+                    f"ALTER TABLE {TABLE} REORGANIZE PARTITION pmax INTO "
+                    f"({', '.join(added)}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+                )
+
+            oldest_kept = f"p{_add_months(this_month, -options['retention_months']):%Y%m}"
+            expired = sorted(name for name in existing if name != "pmax" and name < oldest_kept)
+            if expired:
+                # dropping a partition discards its rows without a row by row delete
+                cursor.execute(f"ALTER TABLE {TABLE} DROP PARTITION {', '.join(expired)}")
+
+        self.stdout.write(self.style.SUCCESS(f"{len(added)} partitions added, {len(expired)} partitions dropped"))
@@ -0,0 +1,73 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from helper.redis import token_dao
+
+
+class Command(BaseCommand):
+    help = ("Writes the refresh token rotations queued in redis to the token_blacklist tables, "
+            "run a single instance")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=1000, help="rotations written at once")
+        parser.add_argument("--sleep", type=float, default=1, help="seconds to wait when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="write what is queued and exit")
+        parser.add_argument("--warm", action="store_true",
+                            help="load the unexpired blacklisted tokens of the database into redis first")
+
+    def handle(self, *args, **options):
+        if options["warm"]:
+            self._warm()
+
+        total = 0
+        while True:
+            entries = token_dao.get_token_log(options["batch"])
+            if entries:
+                self._persist(entries)
+                # trimmed once written: a crash in between writes the batch again, the inserts ignore duplicates
+                token_dao.trim_token_log(len(entries))
+                total += len(entries)
+            elif options["once"]:
+                break
+            else:
+                time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"{total} rotations persisted"))
+
+    def _persist(self, entries):
+        new_tokens = [entry["outstanding"] for entry in entries]
+        # the tokens of deleted users are not recorded
+        user_ids = set(User.objects.filter(id__in={token["user_id"] for token in new_tokens}).values_list("id", flat=True))
+
+        with transaction.atomic():
+            OutstandingToken.objects.bulk_create([
+                OutstandingToken(
+                    user_id=token["user_id"], jti=token["jti"], token=token["token"],
+                    created_at=datetime_from_epoch(token["iat"]), expires_at=datetime_from_epoch(token["exp"]),
+                )
+                for token in new_tokens if token["user_id"] in user_ids
+            ], ignore_conflicts=True)
+
+            # a rotated token is in the table if it was issued by a login or by a rotation persisted before it
+            token_ids = OutstandingToken.objects.filter(
+                jti__in=[entry["blacklisted"] for entry in entries]
+            ).values_list("id", flat=True)
+            BlacklistedToken.objects.bulk_create(
+                [BlacklistedToken(token_id=token_id) for token_id in token_ids], ignore_conflicts=True
+            )
+
+    def _warm(self):
+        tokens = list(
+            BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+            .values_list("token__jti", "token__expires_at")
+        )
+        for i in range(0, len(tokens), 1000):
+            token_dao.blacklist([(jti, expires_at.timestamp()) for jti, expires_at in tokens[i:i + 1000]])
+
+        self.stdout.write(f"{len(tokens)} blacklisted tokens loaded into redis")
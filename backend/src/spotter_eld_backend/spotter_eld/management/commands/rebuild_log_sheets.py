@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from spotter_eld.models import Driver, DailyLogSheet
+from spotter_eld_api.logic import log_sheet_logic
+
+# number of days built out of one load of the events
+CHUNK_DAYS = 31
+
+
+class Command(BaseCommand):
+    help = "Backfills or rebuilds the materialized daily log sheets of closed days"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", required=True, help="first day (YYYY-MM-DD)")
+        parser.add_argument("--end", help="last day (YYYY-MM-DD), defaults to yesterday")
+        parser.add_argument("--driver", type=int, action="append", dest="driver_ids", help="driver id, repeatable")
+        parser.add_argument("--only-missing", action="store_true", help="skip the days already materialized")
+
+    def handle(self, *args, **options):
+        yesterday = timezone.localdate() - timedelta(days=1)
+
+        first_day = parse_date(options["start"] or "")
+        last_day = parse_date(options["end"]) if options["end"] else yesterday
+        if not first_day or not last_day:
+            raise CommandError("Dates must be in YYYY-MM-DD format.")
+
+        # today is still open, its sheet is built on read
+        last_day = min(last_day, yesterday)
+        if first_day > last_day:
+            raise CommandError("Nothing to rebuild: start must be before yesterday and before end.")
+
+        drivers = Driver.objects.order_by("id")
+        if options["driver_ids"]:
+            drivers = drivers.filter(id__in=options["driver_ids"])
+
+        total = 0
+        for driver in drivers.iterator():
+            existing = set()
+            if options["only_missing"]:
+                existing = set(
+                    DailyLogSheet.objects.filter(driver=driver, date__gte=first_day, date__lte=last_day)
+                    .values_list("date", flat=True)
+                )
+
+            chunk_start = first_day
+            while chunk_start <= last_day:
+                chunk_end = min(chunk_start + timedelta(days=CHUNK_DAYS - 1), last_day)
+
+                if not all(day in existing for day in log_sheet_logic.iter_days(chunk_start, chunk_end)):
+                    log_sheets = [
+                        (day, log_sheet)
+                        for day, log_sheet in log_sheet_logic.build_log_sheets(driver, chunk_start, chunk_end)
+                        if day not in existing
+                    ]
+                    log_sheet_logic.store_log_sheets(driver, log_sheets)
+                    total += len(log_sheets)
+
+                chunk_start = chunk_end + timedelta(days=1)
+
+            self.stdout.write(f"Driver {driver.id}: log sheets up to date")
+
+        self.stdout.write(self.style.SUCCESS(f"{total} log sheets materialized from {first_day} to {last_day}"))
@@ -0,0 +1,61 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from spotter_eld.models import Driver, DutyEvent, Trip
+from spotter_eld_api.logic import cycle_logic, duty_event_logic, log_sheet_logic
+
+# number of trips whose events are loaded in one query
+CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the trip columns, cycle buckets and log sheets from the duty event log"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--driver", type=int, action="append", dest="driver_ids", help="driver id, repeatable")
+        parser.add_argument("--trip", type=int, action="append", dest="trip_ids", help="trip id, repeatable")
+        parser.add_argument("--dry-run", action="store_true", help="only report the trips that differ from the log")
+
+    def handle(self, *args, **options):
+        trips = Trip.objects.order_by("id")
+        if options["driver_ids"]:
+            trips = trips.filter(driver_id__in=options["driver_ids"])
+        if options["trip_ids"]:
+            trips = trips.filter(id__in=options["trip_ids"])
+
+        # driver id -> replayed trips that changed
+        changed = defaultdict(list)
+        chunk = []
+        for trip in trips.iterator(chunk_size=CHUNK_SIZE):
+            chunk.append(trip)
+            if len(chunk) >= CHUNK_SIZE:
+                self._replay_chunk(chunk, changed, options["dry_run"])
+                chunk = []
+        self._replay_chunk(chunk, changed, options["dry_run"])
+
+        if not options["dry_run"]:
+            for driver in Driver.objects.filter(id__in=list(changed)):
+                cycle_logic.rebuild_cycle(driver)
+                for trip in changed[driver.id]:
+                    log_sheet_logic.refresh_log_sheets(driver, trip.start_dt, trip.end_dt)
+
+        count = sum(len(trips) for trips in changed.values())
+        verb = "differ from" if options["dry_run"] else "replayed from"
+        self.stdout.write(self.style.SUCCESS(f"{count} trips of {len(changed)} drivers {verb} the duty event log"))
+
+    def _replay_chunk(self, trips, changed, dry_run):
+        if not trips:
+            return
+
+        events = defaultdict(list)
+        for event in DutyEvent.objects.filter(trip_id__in=[trip.id for trip in trips]).order_by("trip_id", "ts", "id"):
+            events[event.trip_id].append(event)
+
+        for trip in trips:
+            changes = duty_event_logic.replay_trip(trip, events[trip.id], dry_run=dry_run)
+            if changes:
+                changed[trip.driver_id].append(trip)
+                self.stdout.write(f"Trip {trip.id}: " + ", ".join(
+                    f"{field} {stored} -> {projected}" for field, (stored, projected) in changes.items()
+                ))
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:08
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def merge_daily_buckets(apps, schema_editor):
+    """
+    end_drop_off used to insert one DriverHos row per trip; fold those into a single bucket per driver and day
+    """
+    DriverHos = apps.get_model('spotter_eld', 'DriverHos')
+
+    kept = {}
+    for hos in DriverHos.objects.order_by('driver_id', 'date', 'id'):
+        key = (hos.driver_id, hos.date)
+        bucket = kept.get(key)
+        if bucket is None:
+            kept[key] = hos
+            continue
+
+        bucket.total_driving_hours += hos.total_driving_hours
+        bucket.total_on_duty_hours += hos.total_on_duty_hours
+        bucket.save(update_fields=['total_driving_hours', 'total_on_duty_hours'])
+        hos.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spotter_eld', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='driver',
+            name='cycle_computed_on',
+            field=models.DateField(blank=True, help_text='Day current_cycle_used was last rolled', null=True),
+        ),
+        migrations.AlterField(
+            model_name='driver',
+            name='current_cycle_used',
+            field=models.FloatField(default=0, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(70)]),
+        ),
+        migrations.RunPython(merge_daily_buckets, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='driverhos',
+            constraint=models.UniqueConstraint(fields=('driver', 'date'), name='unique_driver_hos_day'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spotter_eld', '0002_driver_cycle_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyLogSheet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payload', models.JSONField()),
+                ('created_dt', models.DateTimeField(auto_now_add=True)),
+                ('updated_dt', models.DateTimeField(auto_now=True)),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_sheets', to='spotter_eld.driver')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('driver', 'date'), name='unique_daily_log_sheet')],
+            },
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:17
+
+from django.db import migrations, models
+
+
+def end_duplicate_ongoing_trips(apps, schema_editor):
+    """
+    create_trip only checked for an ongoing trip before inserting, so concurrent requests could leave a driver or
+    a vehicle with several ongoing trips; keep the latest one ongoing and end the others
+    """
+    Trip = apps.get_model('spotter_eld', 'Trip')
+
+    seen_drivers, seen_vehicles = set(), set()
+    for trip in Trip.objects.filter(status='ONGOING').order_by('-start_dt', '-id'):
+        if trip.driver_id in seen_drivers or trip.vehicle_id in seen_vehicles:
+            trip.status = 'ENDED'
+            trip.end_dt = trip.end_dt or trip.updated_dt
+            trip.save(update_fields=['status', 'end_dt'])
+            continue
+
+        seen_drivers.add(trip.driver_id)
+        seen_vehicles.add(trip.vehicle_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spotter_eld', '0003_daily_log_sheet'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fueling',
+            index=models.Index(fields=['trip', 'created_dt'], name='fueling_trip_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['type'], name='location_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restbreak',
+            index=models.Index(fields=['trip', 'start_dt'], name='restbreak_trip_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['driver', 'status'], name='trip_driver_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['vehicle', 'status'], name='trip_vehicle_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['driver', 'start_dt'], name='trip_driver_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['driver', 'end_dt'], name='trip_driver_end_idx'),
+        ),
+        migrations.RunPython(end_duplicate_ongoing_trips, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='trip',
+            constraint=models.UniqueConstraint(models.Case(models.When(status='ONGOING', then=models.F('driver'))), name='unique_ongoing_trip_per_driver'),
+        ),
+        migrations.AddConstraint(
+            model_name='trip',
+            constraint=models.UniqueConstraint(models.Case(models.When(status='ONGOING', then=models.F('vehicle'))), name='unique_ongoing_trip_per_vehicle'),
+        ),
+    ]
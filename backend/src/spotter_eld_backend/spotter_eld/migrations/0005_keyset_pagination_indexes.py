@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spotter_eld', '0004_trip_event_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='driver',
+            index=models.Index(fields=['created_dt', 'id'], name='driver_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['created_dt', 'id'], name='location_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['driver', 'created_dt', 'id'], name='trip_driver_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(fields=['created_dt', 'id'], name='vehicle_created_idx'),
+        ),
+    ]
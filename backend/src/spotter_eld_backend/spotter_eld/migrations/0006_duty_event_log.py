@@ -0,0 +1,94 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+TRIP_PHASE_EVENTS = [
+    ('start_dt', 'TRIP_START'),
+    ('pickup_start_dt', 'PICKUP_START'),
+    ('pickup_end_dt', 'PICKUP_END'),
+    ('drop_off_start_dt', 'DROP_OFF_START'),
+    ('drop_off_end_dt', 'DROP_OFF_END'),
+]
+
+
+def backfill_duty_events(apps, schema_editor):
+    """
+    Seeds the log with the events of the existing trips, rest breaks and fuelings
+    """
+    Trip = apps.get_model('spotter_eld', 'Trip')
+    RestBreak = apps.get_model('spotter_eld', 'RestBreak')
+    Fueling = apps.get_model('spotter_eld', 'Fueling')
+    DutyEvent = apps.get_model('spotter_eld', 'DutyEvent')
+
+    def _events():
+        for trip in Trip.objects.order_by('id').iterator(chunk_size=BATCH_SIZE):
+            for field, event_type in TRIP_PHASE_EVENTS:
+                if getattr(trip, field):
+                    yield DutyEvent(
+                        driver_id=trip.driver_id, trip_id=trip.id, type=event_type, ts=getattr(trip, field),
+                        location_id=trip.start_location_id if event_type == 'TRIP_START' else None,
+                    )
+            if trip.status == 'ENDED':
+                yield DutyEvent(
+                    driver_id=trip.driver_id, trip_id=trip.id, type='TRIP_END',
+                    ts=trip.end_dt or trip.drop_off_end_dt or trip.updated_dt,
+                )
+
+        for rest_break in RestBreak.objects.select_related('trip').order_by('id').iterator(chunk_size=BATCH_SIZE):
+            yield DutyEvent(
+                driver_id=rest_break.trip.driver_id, trip_id=rest_break.trip_id, type='REST_BREAK_START',
+                ts=rest_break.start_dt, location_id=rest_break.location_id, data={"rest_break_id": rest_break.id},
+            )
+            if rest_break.end_dt:
+                yield DutyEvent(
+                    driver_id=rest_break.trip.driver_id, trip_id=rest_break.trip_id, type='REST_BREAK_END',
+                    ts=rest_break.end_dt, location_id=rest_break.location_id,
+                    data={"rest_break_id": rest_break.id, "duration": rest_break.duration},
+                )
+
+        for fueling in Fueling.objects.select_related('trip').order_by('id').iterator(chunk_size=BATCH_SIZE):
+            yield DutyEvent(
+                driver_id=fueling.trip.driver_id, trip_id=fueling.trip_id, type='FUELING', ts=fueling.created_dt,
+                location_id=fueling.location_id, odometer=fueling.mileage_at_fueling,
+                data={"fueling_id": fueling.id, "amount": fueling.amount, "cost": fueling.cost,
+                      "duration": fueling.duration},
+            )
+
+    batch = []
+    for event in _events():
+        batch.append(event)
+        if len(batch) >= BATCH_SIZE:
+            DutyEvent.objects.bulk_create(batch)
+            batch = []
+    DutyEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spotter_eld', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DutyEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('TRIP_START', 'Trip Start'), ('PICKUP_START', 'Pickup Start'), ('PICKUP_END', 'Pickup End'), ('DROP_OFF_START', 'Drop Off Start'), ('DROP_OFF_END', 'Drop Off End'), ('TRIP_END', 'Trip End'), ('REST_BREAK_START', 'Rest Break Start'), ('REST_BREAK_END', 'Rest Break End'), ('FUELING', 'Fueling')], max_length=20)),
+                ('ts', models.DateTimeField()),
+                ('odometer', models.FloatField(blank=True, help_text='Mileage when the event happened', null=True)),
+                ('data', models.JSONField(blank=True, default=dict, help_text='Attributes of the event (rest break id, fuel, ...)')),
+                ('created_dt', models.DateTimeField(auto_now_add=True)),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duty_events', to='spotter_eld.driver')),
+                ('location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='duty_events', to='spotter_eld.location')),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duty_events', to='spotter_eld.trip')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trip', 'ts'], name='duty_event_trip_ts_idx'), models.Index(fields=['driver', 'ts'], name='duty_event_driver_ts_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_duty_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spotter_eld', '0006_duty_event_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dutyevent',
+            name='client_key',
+            field=models.CharField(blank=True, help_text='Idempotency key of the event uploaded by the app', max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='dutyevent',
+            constraint=models.UniqueConstraint(fields=('driver', 'client_key'), name='unique_duty_event_client_key'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:38
+
+from datetime import date
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# monthly partitions created ahead, the next ones are added by the manage_breadcrumb_partitions command
+MONTHS_AHEAD = 3
+
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_breadcrumbs(apps, schema_editor):
+    """
+    MySQL only: partitions the table by month of ts. Every unique key of a partitioned table must contain ts,
+    the primary key becomes (id, ts).
+    """
+    if schema_editor.connection.vendor != 'mysql':
+        return
+
+    first_month = date.today().replace(day=1)
+    partitions = []
+    for i in range(MONTHS_AHEAD + 1):
+        month = _add_months(first_month, i)
+        partitions.append(
+            f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{_add_months(month, 1):%Y-%m-%d}'))"
+        )
+    partitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+
+    schema_editor.execute("ALTER TABLE spotter_eld_breadcrumb DROP PRIMARY KEY, ADD PRIMARY KEY (id, ts)")
+    schema_editor.execute(
+        "ALTER TABLE spotter_eld_breadcrumb PARTITION BY RANGE (TO_DAYS(ts)) (%s)" % ", ".join(partitions)
+    )
+
+
+def unpartition_breadcrumbs(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+
+    schema_editor.execute("ALTER TABLE spotter_eld_breadcrumb REMOVE PARTITIONING")
+    schema_editor.execute("ALTER TABLE spotter_eld_breadcrumb DROP PRIMARY KEY, ADD PRIMARY KEY (id)")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spotter_eld', '0007_duty_event_client_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Breadcrumb',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('ts', models.DateTimeField()),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('speed', models.FloatField(help_text='Speed in mph')),
+                ('odometer', models.FloatField(blank=True, help_text='Odometer in miles', null=True)),
+                ('driver', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='breadcrumbs', to='spotter_eld.driver')),
+                ('vehicle', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='breadcrumbs', to='spotter_eld.vehicle')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('vehicle', 'ts'), name='unique_breadcrumb_vehicle_ts')],
+            },
+        ),
+        migrations.RunPython(partition_breadcrumbs, unpartition_breadcrumbs),
+    ]
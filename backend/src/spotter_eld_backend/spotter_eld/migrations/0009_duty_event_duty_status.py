@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spotter_eld', '0008_breadcrumb'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dutyevent',
+            name='type',
+            field=models.CharField(choices=[('TRIP_START', 'Trip Start'), ('PICKUP_START', 'Pickup Start'), ('PICKUP_END', 'Pickup End'), ('DROP_OFF_START', 'Drop Off Start'), ('DROP_OFF_END', 'Drop Off End'), ('TRIP_END', 'Trip End'), ('REST_BREAK_START', 'Rest Break Start'), ('REST_BREAK_END', 'Rest Break End'), ('FUELING', 'Fueling'), ('DUTY_STATUS', 'Duty Status Detected')], max_length=20),
+        ),
+    ]
@@ -1,22 +1,31 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import Case, F, When
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.utils import timezone
-from datetime import timedelta
 
 
-from helper.common.constants import TripStatus, LocationType
+from helper.common.constants import DutyEventType, TripStatus, LocationType
+from spotter_eld.signals import duty_events_created
+
+
 class Driver(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="driver_profile")
     name = models.CharField(max_length=255)
     license_number = models.CharField(max_length=50, unique=True)
-    current_cycle_used = models.IntegerField(
+    current_cycle_used = models.FloatField(
         default=0,
         validators=[MinValueValidator(0), MaxValueValidator(70)]  # 70-hour limit
     )
+    cycle_computed_on = models.DateField(blank=True, null=True, help_text="Day current_cycle_used was last rolled")
     created_dt = models.DateTimeField(auto_now_add=True)
     updated_dt = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # keyset pagination, see helper.common.pagination
+        indexes = [
+            models.Index(fields=['created_dt', 'id'], name='driver_created_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -25,17 +34,9 @@ class Driver(models.Model):
         Calculate the total on-duty hours for the last `days` days.
         Includes driving time, pickup/drop-off time, and fueling time.
         """
-        now = timezone.now()
-        start_date = now - timedelta(days=days)
+        from spotter_eld_api.logic import hos_engine
 
-        # Get all trips within the last `days` days
-        trips = Trip.objects.filter(driver=self, start_dt__gte=start_date)
-
-        total_on_duty_hours = 0
-        for trip in trips:
-            total_on_duty_hours += trip.total_on_duty_hours()
-
-        return total_on_duty_hours
+        return float(hos_engine.evaluate_driver(self, cycle_days=days).cycle_hours[0])
 
     def is_compliant_with_70_hour_rule(self):
         """
@@ -47,13 +48,12 @@ class Driver(models.Model):
         """
         Check if the driver is within the 14-hour driving window.
         """
-        # Get the last trip end time (or last off-duty time)
-        last_trip = Trip.objects.filter(driver=self).order_by('-end_dt').first()
-        if not last_trip or not last_trip.end_dt:
-            return True  # No previous trips, compliant by default
+        from spotter_eld_api.logic import hos_engine
+
+        window_end_time = hos_engine.evaluate_driver(self, now=trip_start_time).window_end(self.id)
+        if not window_end_time:
+            return True  # No open shift, compliant by default
 
-        # Calculate the 14-hour window
-        window_end_time = last_trip.end_dt + timedelta(hours=14)
         return trip_start_time <= window_end_time
 
 
@@ -66,6 +66,12 @@ class Vehicle(models.Model):
     created_dt = models.DateTimeField(auto_now_add=True)
     updated_dt = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # keyset pagination, see helper.common.pagination
+        indexes = [
+            models.Index(fields=['created_dt', 'id'], name='vehicle_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.year} {self.name} {self.model}"
 
@@ -85,6 +91,12 @@ class Location(models.Model):
     created_dt = models.DateTimeField(auto_now_add=True)
     updated_dt = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['type'], name='location_type_idx'),
+            models.Index(fields=['created_dt', 'id'], name='location_created_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -112,6 +124,25 @@ class Trip(models.Model):
     created_dt = models.DateTimeField(auto_now_add=True)
     updated_dt = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['driver', 'status'], name='trip_driver_status_idx'),
+            models.Index(fields=['vehicle', 'status'], name='trip_vehicle_status_idx'),
+            models.Index(fields=['driver', 'start_dt'], name='trip_driver_start_idx'),
+            models.Index(fields=['driver', 'end_dt'], name='trip_driver_end_idx'),
+            models.Index(fields=['driver', 'created_dt', 'id'], name='trip_driver_created_idx'),
+        ]
+        # One ongoing trip per driver and per vehicle. MySQL has no partial index, the expression is NULL for the
+        # ended trips which a unique index does not compare.
+        constraints = [
+            models.UniqueConstraint(
+                Case(When(status=TripStatus.ONGOING, then=F('driver'))), name='unique_ongoing_trip_per_driver'
+            ),
+            models.UniqueConstraint(
+                Case(When(status=TripStatus.ONGOING, then=F('vehicle'))), name='unique_ongoing_trip_per_vehicle'
+            ),
+        ]
+
     def __str__(self):
         return f"Trip {self.id} by {self.driver.name}"
 
@@ -145,6 +176,12 @@ class DriverHos(models.Model):
     created_dt = models.DateTimeField(auto_now_add=True)
     updated_dt = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # one on-duty bucket per driver and day, see spotter_eld_api.logic.cycle_logic
+        constraints = [
+            models.UniqueConstraint(fields=['driver', 'date'], name='unique_driver_hos_day'),
+        ]
+
     def __str__(self):
         return f"Log for {self.driver.name} on {self.date}"
 
@@ -158,6 +195,11 @@ class RestBreak(models.Model):
     created_dt = models.DateTimeField(auto_now_add=True)
     updated_dt = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['trip', 'start_dt'], name='restbreak_trip_start_idx'),
+        ]
+
     def __str__(self):
         return f"Rest break for {self.trip.driver.name} on {self.trip.start_dt.date()}"
 
@@ -172,5 +214,120 @@ class Fueling(models.Model):
     created_dt = models.DateTimeField(auto_now_add=True)
     updated_dt = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['trip', 'created_dt'], name='fueling_trip_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Fueling for Trip {self.trip.id} at {self.location.name}"
+
+
+class DailyLogSheet(models.Model):
+    """
+    Materialized log sheet of a driver-day, as returned by get_driver_log_sheet
+    """
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE, related_name='log_sheets')
+    date = models.DateField()
+    payload = models.JSONField()
+    created_dt = models.DateTimeField(auto_now_add=True)
+    updated_dt = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['driver', 'date'], name='unique_daily_log_sheet'),
+        ]
+
+    def __str__(self):
+        return f"Log sheet for {self.driver.name} on {self.date}"
+
+
+class DutyEventQuerySet(models.QuerySet):
+
+    def update(self, **kwargs):
+        raise TypeError("Duty events are append only.")
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            duty_events_created.send(sender=self.model, duty_events=objs)
+        return objs
+
+
+class DutyEvent(models.Model):
+    """
+    Append only log of what happened on the trips, the write model of the driver's duty record.
+    The trip phase columns and the trace are projections of it, see spotter_eld_api.logic.duty_event_logic.
+    """
+    TYPE_CHOICES = (
+        (DutyEventType.TRIP_START, "Trip Start"),
+        (DutyEventType.PICKUP_START, "Pickup Start"),
+        (DutyEventType.PICKUP_END, "Pickup End"),
+        (DutyEventType.DROP_OFF_START, "Drop Off Start"),
+        (DutyEventType.DROP_OFF_END, "Drop Off End"),
+        (DutyEventType.TRIP_END, "Trip End"),
+        (DutyEventType.REST_BREAK_START, "Rest Break Start"),
+        (DutyEventType.REST_BREAK_END, "Rest Break End"),
+        (DutyEventType.FUELING, "Fueling"),
+        (DutyEventType.DUTY_STATUS, "Duty Status Detected"),
+    )
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE, related_name='duty_events')
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='duty_events')
+    type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    ts = models.DateTimeField()
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='duty_events', blank=True, null=True)
+    odometer = models.FloatField(help_text="Mileage when the event happened", blank=True, null=True)
+    data = models.JSONField(default=dict, blank=True, help_text="Attributes of the event (rest break id, fuel, ...)")
+    client_key = models.CharField(
+        max_length=64, blank=True, null=True, help_text="Idempotency key of the event uploaded by the app"
+    )
+    created_dt = models.DateTimeField(auto_now_add=True)
+
+    objects = DutyEventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['trip', 'ts'], name='duty_event_trip_ts_idx'),
+            models.Index(fields=['driver', 'ts'], name='duty_event_driver_ts_idx'),
+        ]
+        # an uploaded event is applied once, see spotter_eld_api.logic.sync_logic
+        constraints = [
+            models.UniqueConstraint(fields=['driver', 'client_key'], name='unique_duty_event_client_key'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise TypeError("Duty events are append only.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.type} of trip {self.trip_id} at {self.ts}"
+
+
+class Breadcrumb(models.Model):
+    """
+    GPS sample of a vehicle, inserted in bulk by the drain_breadcrumbs workers.
+    On MySQL the table is partitioned by month of ts (see manage_breadcrumb_partitions), which does not allow
+    foreign key constraints.
+    """
+    id = models.BigAutoField(primary_key=True)
+    vehicle = models.ForeignKey(
+        Vehicle, on_delete=models.DO_NOTHING, related_name='breadcrumbs', db_constraint=False, db_index=False
+    )
+    driver = models.ForeignKey(
+        Driver, on_delete=models.DO_NOTHING, related_name='breadcrumbs', db_constraint=False, db_index=False
+    )
+    ts = models.DateTimeField()
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    speed = models.FloatField(help_text="Speed in mph")
+    odometer = models.FloatField(help_text="Odometer in miles", null=True, blank=True)
+
+    class Meta:
+        # also deduplicates the samples of an upload sent or drained twice
+        constraints = [
+            models.UniqueConstraint(fields=['vehicle', 'ts'], name='unique_breadcrumb_vehicle_ts'),
+        ]
+
     def __str__(self):
-        return f"Fueling for Trip {self.trip.id} at {self.location.name}"
\ No newline at end of file
+        return f"Breadcrumb of vehicle {self.vehicle_id} at {self.ts}"
@@ -43,6 +43,9 @@ ALLOWED_HOSTS = ["*"]
 CORS_ALLOWED_ORIGINS = lsettings.get("CORS_ALLOWED_ORIGINS", ["http://localhost", "http://127.0.0.1:3000"])
 # CORS_ALLOWED_ORIGINS = ["*"]
 CORS_ALLOW_HEADERS = ["*"]
+# next page of the list endpoints (see helper.common.pagination), replayed and in progress responses (see
+# api_decorators.idempotent), profiled requests (see helper.middleware.profiler_middleware)
+CORS_EXPOSE_HEADERS = ["X-Next-Cursor", "Link", "Idempotent-Replayed", "Retry-After", "X-Profile-Id"]
 
 # Application definition
 
@@ -66,6 +69,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first: the time of the other middlewares is counted
+    'helper.middleware.metrics_middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -74,6 +79,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # last: the profile covers the view
+    'helper.middleware.profiler_middleware.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'spotter_eld.urls'
@@ -106,6 +113,21 @@ REDIS_PORT = lsettings.get("REDIS_PORT", 6379)
 REDIS_DB = lsettings.get("REDIS_DB", 0)
 REDIS_PASSWORD = lsettings.get("REDIS_PASSWORD", None)
 
+# ===============================================================================
+# Request metrics, see helper.middleware.metrics_middleware
+# ===============================================================================
+# fraction of the requests recorded, 0 disables the middleware
+METRICS_SAMPLE_RATE = lsettings.get("METRICS_SAMPLE_RATE", 1.0)
+# bearer token expected by /metrics, when empty /metrics is only served with DEBUG on
+METRICS_TOKEN = lsettings.get("METRICS_TOKEN", "")
+# the sampled requests slower than this are logged
+METRICS_SLOW_REQUEST_SECONDS = lsettings.get("METRICS_SLOW_REQUEST_SECONDS", 1.0)
+
+# On demand request profiles, see helper.middleware.profiler_middleware
+PROFILER_ENABLED = lsettings.get("PROFILER_ENABLED", True)
+# lifetime of the X-Profile-Token header given on the admin page
+PROFILER_TOKEN_MAX_AGE = lsettings.get("PROFILER_TOKEN_MAX_AGE", 60 * 60 * 24)
+
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
@@ -255,10 +277,15 @@ MEDIA_ROOT = lsettings.get('MEDIA_ROOT', os.environ.get('MEDIA_ROOT', os.path.jo
 # DRF Authentication Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # stateless: the user and its driver profile come from the token claims
+        'spotter_eld_api.authentication.DriverTokenAuthentication',
     ),
 }
 
+# Keyset pagination of the list endpoints, see helper.common.pagination
+API_PAGE_SIZE = lsettings.get("API_PAGE_SIZE", 100)
+API_MAX_PAGE_SIZE = lsettings.get("API_MAX_PAGE_SIZE", 500)
+
 # JWT Token Settings
 from datetime import timedelta
 
@@ -266,4 +293,9 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
+    # the rotated refresh tokens are blacklisted in redis, see helper.redis.token_dao
+    'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_USER_CLASS': 'spotter_eld_api.authentication.DriverTokenUser',
+    'TOKEN_OBTAIN_SERIALIZER': 'spotter_eld_api.views.serializers.DriverTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'spotter_eld_api.views.serializers.DriverTokenRefreshSerializer',
 }
@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# sent by DutyEvent.objects.bulk_create, which sends no post_save: duty_events (the DutyEvent list)
+duty_events_created = Signal()
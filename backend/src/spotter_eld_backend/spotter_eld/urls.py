@@ -18,11 +18,14 @@ from django.contrib import admin
 from django.urls import path, include
 
 from spotter_eld_api import urls
+from spotter_eld_api.views import metrics, profiles
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 urlpatterns = [
+    path('admin/profiles/', include(profiles.urls)),  # before the admin catch-all
     path('admin/', admin.site.urls),
     path('api/', include(urls)),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),  # JWT login
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),  # JWT refresh
+    path('', include(metrics.urls)),  # Prometheus scrape
 ]
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SpotterEldApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'spotter_eld_api'
+
+    def ready(self):
+        # cache invalidation receivers
+        from spotter_eld_api import signals  # noqa: F401
@@ -0,0 +1,109 @@
+"""
+Stateless JWT authentication: the user and its driver profile are built from the token claims (see
+DriverTokenObtainPairSerializer) without reading the database, the only lookup left is the revocation check in redis
+(see helper.redis.token_dao).
+"""
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from helper.redis import token_dao
+from spotter_eld.models import Driver
+
+# Driver field -> claim carrying it
+DRIVER_CLAIMS = {'id': 'driver_id', 'name': 'driver_name', 'license_number': 'license_number'}
+
+
+def get_driver_claims(user):
+    """
+    @return: dict of the claims describing the driver profile of the user, driver_id is None when there is none
+    """
+    driver = Driver.objects.filter(user_id=user.id).values(*DRIVER_CLAIMS).first() or {'id': None}
+    return {claim: driver.get(field) for field, claim in DRIVER_CLAIMS.items()}
+
+
+class DriverTokenUser(TokenUser):
+
+    @cached_property
+    def driver_profile(self):
+        """
+        Driver holding the fields of the claims, the other fields are deferred and read on first access
+        @raise AttributeError: the user has no driver profile, as for a User without one
+        """
+        if 'driver_id' not in self.token:
+            # token issued before the driver claims existed
+            driver = Driver.objects.filter(user_id=self.id).first()
+        elif self.token['driver_id'] is None:
+            driver = None
+        else:
+            driver = Driver.from_db(
+                None, ['id', 'user_id', 'name', 'license_number'],
+                [self.token['driver_id'], self.id, self.token.get('driver_name'), self.token.get('license_number')]
+            )
+
+        if driver is None:
+            raise AttributeError('driver_profile')
+        return driver
+
+    def __getattr__(self, attr):
+        # TokenUser answers the unknown attributes with the claims, hasattr(user, 'driver_profile') must stay False
+        if attr == 'driver_profile':
+            raise AttributeError(attr)
+        return super().__getattr__(attr)
+
+
+async def aget_driver_profile(user):
+    """
+    driver_profile for the async views, the tokens issued before the driver claims existed are looked up with the
+    async ORM
+    @return: Driver or None
+    """
+    if 'driver_id' not in user.token:
+        return await Driver.objects.filter(user_id=user.id).afirst()
+    return getattr(user, 'driver_profile', None)
+
+
+class DriverTokenAuthentication(JWTStatelessUserAuthentication):
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+
+        if token_dao.is_revoked(user.id, self._get_auth_time(validated_token)):
+            raise AuthenticationFailed("Token has been revoked.", code="token_revoked")
+
+        return user
+
+    async def aauthenticate(self, request):
+        """
+        authenticate for the async views: the token is checked the same way, the revocation is read with the asyncio
+        redis client
+        @return: (user, validated token) or None when the request has no token
+        @raise AuthenticationFailed
+        """
+        header = self.get_header(request)
+        raw_token = self.get_raw_token(header) if header is not None else None
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        user = super().get_user(validated_token)
+        if await token_dao.ais_revoked(user.id, self._get_auth_time(validated_token)):
+            raise AuthenticationFailed("Token has been revoked.", code="token_revoked")
+
+        return user, validated_token
+
+    @staticmethod
+    def _get_auth_time(validated_token):
+        return validated_token.get('auth_time', validated_token.get('iat', 0))
+
+
+class RedisBlacklistRefreshToken(RefreshToken):
+    """
+    Refresh token whose blacklist is checked in redis when it is rotated (see DriverTokenRefreshSerializer) instead
+    of a BlacklistedToken query when it is decoded
+    """
+
+    def check_blacklist(self):
+        pass
@@ -0,0 +1,201 @@
+"""
+Daily hours of the drivers and their 70-hour/8-day cycle.
+
+Closing a trip books its hours into the DriverHos row of each day it spans, split on midnights. The on-duty hours of
+the last CYCLE_DAYS rows are summed into Driver.current_cycle_used whenever a trip is booked, and otherwise at most
+once a day, on the first read after midnight (see get_cycle_used).
+"""
+import logging
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from helper.common.constants import TripStatus
+from helper.redis import redis_dao
+from spotter_eld.models import Driver, DriverHos, Trip
+
+log = logging.getLogger(__name__)
+
+# 70-hour/8-day rule
+CYCLE_DAYS = 8
+CYCLE_LIMIT_HOURS = 70
+
+
+def get_window_start(today):
+    """
+    First day of the rolling cycle that ends on 'today' (inclusive)
+    """
+    return today - timedelta(days=CYCLE_DAYS - 1)
+
+
+def split_hours_by_day(start_dt, end_dt):
+    """
+    Splits the [start_dt, end_dt) interval on local midnights
+    @return: dict {date: hours} with the part of the interval that falls on each day
+    """
+    buckets = {}
+    if not start_dt or not end_dt or end_dt <= start_dt:
+        return buckets
+
+    current = timezone.localtime(start_dt)
+    end = timezone.localtime(end_dt)
+    while current < end:
+        next_midnight = timezone.make_aware(datetime.combine(current.date() + timedelta(days=1), time.min))
+        chunk_end = min(end, next_midnight)
+        buckets[current.date()] = buckets.get(current.date(), 0) + (chunk_end - current).total_seconds() / 3600
+        current = chunk_end
+
+    return buckets
+
+
+def trip_day_buckets(trip):
+    """
+    @return: dict {date: (driving_hours, on_duty_hours)} for a closed trip.
+    The whole trip is on duty, its pickup and drop off are the part that is not driving (the intervals of
+    hos_engine.load_duty_intervals); every interval is split on midnights
+    """
+    buckets = {day: [hours, hours] for day, hours in split_hours_by_day(trip.start_dt, trip.end_dt).items()}
+    if not buckets:
+        return buckets
+
+    phases = (
+        (trip.pickup_start_dt, trip.pickup_end_dt or trip.drop_off_start_dt or trip.end_dt),
+        (trip.drop_off_start_dt, trip.drop_off_end_dt or trip.end_dt),
+    )
+    for start_dt, end_dt in phases:
+        if not start_dt or not end_dt:
+            continue
+        for day, hours in split_hours_by_day(max(start_dt, trip.start_dt), min(end_dt, trip.end_dt)).items():
+            buckets[day][0] -= hours
+
+    return buckets
+
+
+def _add_to_bucket(driver_id, day, driving_hours, on_duty_hours):
+    updated = DriverHos.objects.filter(driver_id=driver_id, date=day).update(
+        total_driving_hours=F('total_driving_hours') + driving_hours,
+        total_on_duty_hours=F('total_on_duty_hours') + on_duty_hours,
+    )
+    if updated:
+        return
+
+    try:
+        with transaction.atomic():
+            DriverHos.objects.create(
+                driver_id=driver_id,
+                date=day,
+                total_driving_hours=driving_hours,
+                total_on_duty_hours=on_duty_hours,
+            )
+    except IntegrityError:
+        # another request opened the bucket in the meantime
+        _add_to_bucket(driver_id, day, driving_hours, on_duty_hours)
+
+
+def record_trip(driver, trip):
+    """
+    Books the hours of a trip that was just closed into the driver's daily buckets and rolls the cycle total.
+    @param driver: Driver owning the trip
+    @param trip: ended Trip
+    @return: the driver's on-duty hours used in the current cycle
+    """
+    with transaction.atomic():
+        for day, (driving_hours, on_duty_hours) in trip_day_buckets(trip).items():
+            _add_to_bucket(driver.id, day, driving_hours, on_duty_hours)
+
+    return refresh_cycle_used(driver)
+
+
+def rebuild_cycle(driver):
+    """
+    Recomputes the driver's daily buckets from the ended trips (after their columns were replayed from the duty
+    event log) and rolls the cycle total.
+    """
+    buckets = {}
+    for trip in Trip.objects.filter(driver_id=driver.id, status=TripStatus.ENDED).iterator():
+        for day, (driving_hours, on_duty_hours) in trip_day_buckets(trip).items():
+            bucket = buckets.setdefault(day, [0, 0])
+            bucket[0] += driving_hours
+            bucket[1] += on_duty_hours
+
+    with transaction.atomic():
+        DriverHos.objects.filter(driver_id=driver.id).delete()
+        DriverHos.objects.bulk_create([
+            DriverHos(driver_id=driver.id, date=day, total_driving_hours=driving_hours, total_on_duty_hours=on_duty_hours)
+            for day, (driving_hours, on_duty_hours) in sorted(buckets.items())
+        ])
+
+    return refresh_cycle_used(driver)
+
+
+def refresh_cycle_used(driver, today=None):
+    """
+    Recomputes current_cycle_used from the last CYCLE_DAYS buckets (at most CYCLE_DAYS rows, older days simply fall out of the window)
+    and stores it on the driver.
+    """
+    today = today or timezone.localdate()
+
+    total = (
+            DriverHos.objects.filter(driver_id=driver.id, date__gte=get_window_start(today), date__lte=today)
+            .aggregate(total_hours=Sum('total_on_duty_hours'))['total_hours'] or 0
+    )
+
+    Driver.objects.filter(pk=driver.id).update(current_cycle_used=total, cycle_computed_on=today)
+    # .update() sends no signal
+    transaction.on_commit(lambda: redis_dao.invalidate(Driver, driver.id))
+    driver.current_cycle_used = total
+    driver.cycle_computed_on = today
+
+    return total
+
+
+def get_cycle_used(driver, today=None):
+    """
+    Returns the on-duty hours the driver used in the rolling 8-day cycle.
+    The value is maintained on the driver row, it only gets rolled once per day.
+    """
+    today = today or timezone.localdate()
+
+    if driver.cycle_computed_on == today:
+        return driver.current_cycle_used
+
+    return refresh_cycle_used(driver, today)
+
+
+async def aget_cycle_used(driver, today=None):
+    """
+    get_cycle_used for the async views, with the async ORM
+    """
+    today = today or timezone.localdate()
+
+    if driver.cycle_computed_on == today:
+        return driver.current_cycle_used
+
+    total = (
+            await DriverHos.objects.filter(driver_id=driver.id, date__gte=get_window_start(today), date__lte=today)
+            .aaggregate(total_hours=Sum('total_on_duty_hours'))
+    )['total_hours'] or 0
+
+    await Driver.objects.filter(pk=driver.id).aupdate(current_cycle_used=total, cycle_computed_on=today)
+    await sync_to_async(redis_dao.invalidate, thread_sensitive=False)(Driver, driver.id)
+    driver.current_cycle_used = total
+    driver.cycle_computed_on = today
+
+    return total
+
+
+def get_cycle_rolled_at(driver):
+    """
+    @return: epoch seconds of the local midnight the driver's cycle was last rolled on (0 if never)
+    """
+    if not driver.cycle_computed_on:
+        return 0
+
+    return timezone.make_aware(datetime.combine(driver.cycle_computed_on, time.min)).timestamp()
+
+
+def has_reached_cycle_limit(driver):
+    return get_cycle_used(driver) >= CYCLE_LIMIT_HOURS
@@ -0,0 +1,150 @@
+"""
+Append only duty event log (DutyEvent) and the projections maintained from it.
+
+Every write on a trip appends its events in the transaction that updates the read models: the phase columns of the
+Trip row (see trip_logic), the RestBreak and Fueling rows. The trip trace is read from the log. The Trip columns, the
+cycle buckets and the log sheets can be rebuilt from the log, see replay_trip and the replay_duty_events command.
+"""
+from helper.common.constants import DutyEventType, TripStatus
+from spotter_eld.models import DutyEvent, Trip
+from spotter_eld_api.logic import trip_logic
+
+# event -> Trip column holding its time
+PHASE_COLUMNS = {
+    DutyEventType.TRIP_START: 'start_dt',
+    DutyEventType.PICKUP_START: 'pickup_start_dt',
+    DutyEventType.PICKUP_END: 'pickup_end_dt',
+    DutyEventType.DROP_OFF_START: 'drop_off_start_dt',
+    DutyEventType.DROP_OFF_END: 'drop_off_end_dt',
+    DutyEventType.TRIP_END: 'end_dt',
+}
+
+
+def build_event(driver_id, trip_id, event_type, ts, location_id=None, odometer=None, **data):
+    """
+    @return: the unsaved DutyEvent, the extra keyword arguments go to its data
+    """
+    return DutyEvent(
+        driver_id=driver_id, trip_id=trip_id, type=event_type, ts=ts, location_id=location_id, odometer=odometer,
+        data=data
+    )
+
+
+def record_trip_start(trip):
+    DutyEvent.objects.bulk_create([
+        build_event(trip.driver_id, trip.id, DutyEventType.TRIP_START, trip.start_dt, location_id=trip.start_location_id)
+    ])
+
+
+def record_rest_break_start(driver_id, rest_break):
+    DutyEvent.objects.bulk_create([
+        build_event(driver_id, rest_break.trip_id, DutyEventType.REST_BREAK_START, rest_break.start_dt,
+               location_id=rest_break.location_id, rest_break_id=rest_break.id)
+    ])
+
+
+def record_rest_break_end(driver_id, rest_break):
+    DutyEvent.objects.bulk_create([
+        build_event(driver_id, rest_break.trip_id, DutyEventType.REST_BREAK_END, rest_break.end_dt,
+               location_id=rest_break.location_id, rest_break_id=rest_break.id, duration=rest_break.duration)
+    ])
+
+
+def record_fueling(driver_id, fueling):
+    DutyEvent.objects.bulk_create([
+        build_event(driver_id, fueling.trip_id, DutyEventType.FUELING, fueling.created_dt,
+               location_id=fueling.location_id, odometer=fueling.mileage_at_fueling, fueling_id=fueling.id,
+               amount=fueling.amount, cost=fueling.cost, duration=fueling.duration)
+    ])
+
+
+def get_trip_events(trip_id):
+    return list(DutyEvent.objects.filter(trip_id=trip_id).order_by('ts', 'id'))
+
+
+async def aget_trip_events(trip_id):
+    return [event async for event in DutyEvent.objects.filter(trip_id=trip_id).order_by('ts', 'id')]
+
+
+def project_trip(events):
+    """
+    Folds the events of a trip into its Trip columns, with the rules applied by trip_logic when they are written
+    @param events: DutyEvent list of one trip ordered by ts
+    @return: dict {field: value} of the phase columns, status, durations and violations
+    """
+    values = {column: None for column in PHASE_COLUMNS.values()}
+    for event in events:
+        column = PHASE_COLUMNS.get(event.type)
+        if column and values[column] is None:
+            values[column] = event.ts
+
+    values.update({
+        'status': TripStatus.ENDED if values['end_dt'] else TripStatus.ONGOING,
+        'pickup_duration': Trip._meta.get_field('pickup_duration').default,
+        'drop_off_duration': Trip._meta.get_field('drop_off_duration').default,
+        'violations': None,
+    })
+    if values['pickup_start_dt'] and values['pickup_end_dt']:
+        values['pickup_duration'] = trip_logic.get_phase_minutes(values['pickup_start_dt'], values['pickup_end_dt'])
+        values['violations'] = trip_logic.get_pickup_violations(values['pickup_duration'])
+    if values['drop_off_start_dt'] and values['drop_off_end_dt']:
+        values['drop_off_duration'] = trip_logic.get_phase_minutes(
+            values['drop_off_start_dt'], values['drop_off_end_dt']
+        )
+        violation = trip_logic.get_drop_off_violation(values['drop_off_duration'])
+        if violation:
+            values['violations'] = (values['violations'] or "") + violation
+
+    return values
+
+
+def replay_trip(trip, events, dry_run=False):
+    """
+    Rebuilds the Trip columns from the log
+    @param events: DutyEvent list of the trip ordered by ts, a trip without events is left untouched
+    @return: dict {field: (stored value, projected value)} of the columns that differed
+    """
+    if not events:
+        return {}
+
+    values = project_trip(events)
+    changes = {
+        field: (getattr(trip, field), value) for field, value in values.items() if getattr(trip, field) != value
+    }
+
+    if changes and not dry_run:
+        for field in changes:
+            setattr(trip, field, values[field])
+        # saved (not updated) so that the signals refresh the cached trip state
+        trip.save(update_fields=[*changes, 'updated_dt'])
+
+    return changes
+
+
+def get_trace(trip, events):
+    """
+    @param events: DutyEvent list of the trip ordered by ts
+    @return: list of dict {type, _dt, location_id, duration} of the trip start, rest breaks, fuelings and trip end
+    """
+    rest_break_durations = {
+        event.data.get("rest_break_id"): event.data.get("duration")
+        for event in events if event.type == DutyEventType.REST_BREAK_END
+    }
+
+    actions = []
+    for event in events:
+        if event.type == DutyEventType.TRIP_START:
+            actions.append({"type": "Trip Start", "_dt": event.ts, "location_id": trip.start_location_id,
+                            "duration": None})
+        elif event.type == DutyEventType.REST_BREAK_START:
+            actions.append({"type": "Rest Break", "_dt": event.ts, "location_id": event.location_id,
+                            "duration": rest_break_durations.get(event.data.get("rest_break_id"))})
+        elif event.type == DutyEventType.FUELING:
+            actions.append({"type": "Fueling", "_dt": event.ts, "location_id": event.location_id,
+                            "duration": event.data.get("duration")})
+        elif event.type == DutyEventType.TRIP_END:
+            actions.append({"type": "Trip End", "_dt": event.ts, "location_id": trip.end_location_id,
+                            "duration": None})
+
+    return actions
+
@@ -0,0 +1,178 @@
+"""
+Duty-status detection from the vehicle telemetry (FMCSA ELD rules, 49 CFR 395 appendix A 4.3.1.2 and 4.4.1.2).
+
+The vehicle is Driving as soon as it moves at MOTION_SPEED_MPH or more. Once it has stayed below that speed for
+STOP_MINUTES in a row, the driver is back On Duty (not driving) from the time it stopped. The samples stop with the
+engine: a gap of PARKED_GAP_MINUTES without sample puts the driver Off Duty from the last sample.
+
+The samples of a vehicle are folded into a small state (status, last sample time, time it stopped), O(1) per sample.
+The states live in redis (see duty_status_dao) and are advanced by the drain_breadcrumbs workers batch by batch,
+samples at or before the last one seen are skipped so that a batch drained twice does not move them twice. The
+transitions are appended to the duty event log of the ongoing trip of the vehicle and replace the tapped phases in
+the log sheets from the first detected one (see log_sheet_logic.trip_duty_intervals).
+
+The transitions are only recorded once the state they were detected on is saved, a batch losing the compare and set
+detects them again on the new state. They are saved in the state too: a batch stopping between the save and the
+insert leaves them to the next batch of the vehicle, which inserts them again (once, by client_key) with its own.
+"""
+import logging
+from datetime import datetime, timezone as dt_timezone
+
+from django.utils import timezone
+
+from helper.common.constants import DutyEventType, DutyStatus
+from helper.redis import duty_status_dao, trip_state_dao
+from spotter_eld.models import Driver, DutyEvent
+from spotter_eld_api.logic import log_sheet_logic
+
+log = logging.getLogger(__name__)
+
+MOTION_SPEED_MPH = 5
+STOP_MINUTES = 5
+PARKED_GAP_MINUTES = 30
+
+# a batch losing the compare and set of a vehicle state that many times gives up on that vehicle
+MAX_SAVE_ATTEMPTS = 3
+
+
+def get_initial_state():
+    return {"status": DutyStatus.OFF_DUTY, "last_ts": None, "stopped_ts": None, "transitions": []}
+
+
+def detect(state, samples):
+    """
+    Advances the state of a vehicle over its new samples
+    @param state: dict {status, last_ts, stopped_ts}, updated in place
+    @param samples: list of [ts (epoch seconds), latitude, longitude, speed, odometer, ...] ordered by ts
+    @return: list of (ts, DutyStatus, sample) transitions
+    """
+    transitions = []
+
+    def _set_status(ts, status, sample):
+        if state["status"] != status:
+            state["status"] = status
+            transitions.append((ts, status, sample))
+
+    for sample in samples:
+        ts, speed = sample[0], sample[3]
+        last_ts = state["last_ts"]
+        if last_ts is not None and ts <= last_ts:
+            continue
+
+        if last_ts is not None and ts - last_ts >= PARKED_GAP_MINUTES * 60:
+            state["stopped_ts"] = None
+            _set_status(last_ts, DutyStatus.OFF_DUTY, sample)
+
+        if speed >= MOTION_SPEED_MPH:
+            state["stopped_ts"] = None
+            _set_status(ts, DutyStatus.DRIVING, sample)
+        elif state["status"] == DutyStatus.DRIVING:
+            if state["stopped_ts"] is None:
+                state["stopped_ts"] = ts
+            if ts - state["stopped_ts"] >= STOP_MINUTES * 60:
+                _set_status(state["stopped_ts"], DutyStatus.ON_DUTY, sample)
+                state["stopped_ts"] = None
+
+        state["last_ts"] = ts
+
+    return transitions
+
+
+def _resolve_transitions(vehicle_id, transitions, active_trips):
+    """
+    @param transitions: list of (ts, status, sample), the id of the driver who uploaded the sample is appended to it
+    @param active_trips: dict {driver id: trip state or None}, filled with the drivers not read yet
+    @return: list of [driver id, trip id, ts, status, odometer] of the transitions made during an ongoing trip of the
+    vehicle, saved in the state until they are recorded
+    """
+    resolved = []
+    for ts, status, sample in transitions:
+        driver_id = sample[5]
+        if driver_id not in active_trips:
+            active_trips[driver_id] = trip_state_dao.get_active_trip(driver_id)
+        trip = active_trips[driver_id]
+        if not trip or trip["vehicle_id"] != vehicle_id:
+            # the duty event log is kept per trip
+            continue
+
+        resolved.append([driver_id, trip["trip_id"], ts, status, sample[4]])
+
+    return resolved
+
+
+def _to_duty_event(vehicle_id, transition):
+    driver_id, trip_id, ts, status, odometer = transition
+    return DutyEvent(
+        driver_id=driver_id, trip_id=trip_id, type=DutyEventType.DUTY_STATUS,
+        ts=datetime.fromtimestamp(ts, tz=dt_timezone.utc), odometer=odometer,
+        data={"status": status, "vehicle_id": vehicle_id},
+        # the same transition recorded again (by the next batch of the vehicle) is inserted once
+        client_key=f"telemetry:{vehicle_id}:{round(ts * 1000)}:{status}"
+    )
+
+
+def process(entries, now=None):
+    """
+    Runs the detector over a drained batch of breadcrumb entries and records the transitions
+    @param entries: list of (entry id, vehicle id, driver id, samples)
+    @return: list of the DutyEvent recorded, with the ones left by the previous batches of the vehicles
+    """
+    now = now or timezone.now()
+
+    # vehicle id -> samples of the batch ordered by ts, the driver who uploaded a sample is appended to it
+    vehicle_samples = {}
+    for _, vehicle_id, driver_id, samples in entries:
+        vehicle_samples.setdefault(vehicle_id, []).extend([*sample, driver_id] for sample in samples)
+    for samples in vehicle_samples.values():
+        samples.sort(key=lambda sample: sample[0])
+
+    active_trips = {}
+    recorded = []
+    pending = set(vehicle_samples)
+    for _ in range(MAX_SAVE_ATTEMPTS):
+        if not pending:
+            break
+
+        raw_states = duty_status_dao.get_states(pending)
+        new_states = {}
+        transitions = {}
+        for vehicle_id in pending:
+            state = duty_status_dao.decode(raw_states[vehicle_id]) or get_initial_state()
+            # left by the batch that saved the state, recorded unless it stopped right after the save
+            previous = state.get("transitions", [])
+            state["transitions"] = _resolve_transitions(
+                vehicle_id, detect(state, vehicle_samples[vehicle_id]), active_trips
+            )
+            new_states[vehicle_id] = (raw_states[vehicle_id], state)
+            transitions[vehicle_id] = previous + state["transitions"]
+
+        pending = duty_status_dao.save_states(new_states)
+        duty_events = [
+            _to_duty_event(vehicle_id, transition)
+            for vehicle_id in new_states if vehicle_id not in pending
+            for transition in transitions[vehicle_id]
+        ]
+        DutyEvent.objects.bulk_create(duty_events, ignore_conflicts=True)
+        recorded.extend(duty_events)
+
+    if pending:
+        log.warning("Duty status of vehicles %s not saved, their states kept changing", sorted(pending))
+
+    _refresh_closed_days(recorded, now)
+    return recorded
+
+
+def _refresh_closed_days(duty_events, now):
+    """
+    Transitions drained after midnight change the materialized log sheet of the day before
+    """
+    today_start = log_sheet_logic.get_day_range(timezone.localdate(now))[0]
+
+    ranges = {}
+    for event in duty_events:
+        if event.ts < today_start:
+            first, last = ranges.get(event.driver_id, (event.ts, event.ts))
+            ranges[event.driver_id] = (min(first, event.ts), max(last, event.ts))
+
+    for driver in Driver.objects.filter(id__in=ranges) if ranges else []:
+        log_sheet_logic.refresh_log_sheets(driver, *ranges[driver.id], now=now)
@@ -0,0 +1,121 @@
+import time
+
+from helper.common import http_cache
+from helper.common.constants import LocationType, TripStatus
+from helper.redis import redis_keys
+from helper.redis.two_tier_cache import TwoTierCache
+from spotter_eld.models import Location, Vehicle
+from spotter_eld_api.logic import cycle_logic
+from spotter_eld_api.views.serializers import LocationSerializer, VehicleSerializer
+
+FORM_DATA_CACHE_TIMEOUT = 60 * 60 * 6
+
+form_data_cache = TwoTierCache(FORM_DATA_CACHE_TIMEOUT, local_timeout_sec=60, max_size=64)
+
+TRIP_LOCATION_TYPES = [LocationType.TRIP_START, LocationType.TRIP_END]
+ALL_LOCATION_TYPES = [LocationType.TRIP_START, LocationType.TRIP_END, LocationType.FUELING, LocationType.BREAK_REST]
+
+
+def _get_cached(key, fn):
+    """
+    Caches the result of fn along with the time it was computed, which is used as the Last-Modified of the data
+    """
+
+    def _get_obj():
+        return {"data": fn(), "last_modified": time.time()}
+
+    return form_data_cache.get(key, _get_obj)
+
+
+async def _aget_cached(key, afn):
+    async def _get_obj():
+        return {"data": await afn(), "last_modified": time.time()}
+
+    return await form_data_cache.aget(key, _get_obj)
+
+
+def get_locations(location_types):
+    """
+    @param location_types: list of LocationType
+    @return: dict {"data": serialized locations ordered by id, "last_modified": epoch seconds}
+    """
+    entries = []
+    for location_type in location_types:
+        def _get_locations(location_type=location_type):
+            return list(LocationSerializer(Location.objects.filter(type=location_type), many=True).data)
+
+        entries.append(_get_cached(redis_keys.get_form_locations_key(location_type), _get_locations))
+
+    return _merge_locations(entries)
+
+
+async def aget_locations(location_types):
+    """
+    get_locations for the async views, same cache entries
+    """
+    entries = []
+    for location_type in location_types:
+        async def _get_locations(location_type=location_type):
+            locations = [location async for location in Location.objects.filter(type=location_type)]
+            return list(LocationSerializer(locations, many=True).data)
+
+        entries.append(await _aget_cached(redis_keys.get_form_locations_key(location_type), _get_locations))
+
+    return _merge_locations(entries)
+
+
+def _merge_locations(entries):
+    data = [location for entry in entries for location in entry["data"]]
+    if len(entries) > 1:
+        data.sort(key=lambda location: location["id"])
+
+    return {
+        "data": data,
+        "last_modified": max(entry["last_modified"] for entry in entries),
+    }
+
+
+def get_unallocated_vehicles():
+    """
+    @return: dict {"data": serialized vehicles not assigned to an ongoing trip, "last_modified": epoch seconds}
+    """
+
+    def _get_vehicles():
+        return list(VehicleSerializer(Vehicle.objects.exclude(trips__status=TripStatus.ONGOING), many=True).data)
+
+    return _get_cached(redis_keys.get_form_unallocated_vehicles_key(), _get_vehicles)
+
+
+async def aget_unallocated_vehicles():
+    async def _get_vehicles():
+        vehicles = [vehicle async for vehicle in Vehicle.objects.exclude(trips__status=TripStatus.ONGOING)]
+        return list(VehicleSerializer(vehicles, many=True).data)
+
+    return await _aget_cached(redis_keys.get_form_unallocated_vehicles_key(), _get_vehicles)
+
+
+def get_trips_validators(locations, trips):
+    """
+    @param locations: get_locations result
+    @param trips: trips serialized with their driver, vehicle and locations (selected along)
+    @return: tuple (ETag, Last-Modified epoch seconds) of a response holding the locations and the trips
+    """
+    versions = []
+    last_modified = locations["last_modified"]
+    for trip in trips:
+        # the cycle of the driver is updated without touching its updated_dt
+        rows_modified = [
+            row.updated_dt.timestamp() for row in (trip, trip.driver, trip.vehicle, trip.start_location, trip.end_location)
+        ] + [cycle_logic.get_cycle_rolled_at(trip.driver)]
+        versions.append((trip.id, trip.driver.current_cycle_used, *rows_modified))
+        last_modified = max(last_modified, *rows_modified)
+
+    return http_cache.build_etag(locations["last_modified"], *versions), last_modified
+
+
+def invalidate_locations():
+    form_data_cache.invalidate(*[redis_keys.get_form_locations_key(location_type) for location_type in ALL_LOCATION_TYPES])
+
+
+def invalidate_vehicles():
+    form_data_cache.invalidate(redis_keys.get_form_unallocated_vehicles_key())
@@ -0,0 +1,257 @@
+"""
+Fleet wide hours-of-service evaluation.
+
+The duty intervals of every driver are loaded once into columnar numpy arrays (driver, start, end, status) and the
+11-hour driving, 14-hour window and 70-hour/8-day limits are computed for all the drivers with array operations,
+so the cost is a constant number of queries whatever the size of the fleet.
+"""
+import logging
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.db.models import Q
+from django.utils import timezone
+
+from spotter_eld.models import Driver, Trip, RestBreak
+from spotter_eld_api.logic.cycle_logic import CYCLE_DAYS, CYCLE_LIMIT_HOURS
+
+log = logging.getLogger(__name__)
+
+DRIVING_LIMIT_HOURS = 11
+WINDOW_LIMIT_HOURS = 14
+RESET_OFF_DUTY_HOURS = 10
+
+# interval status codes
+DRIVING = 0
+ON_DUTY = 1
+OFF_DUTY = 2
+
+_HOUR = 3600.0
+
+
+class FleetHosStatus:
+    """
+    Result of an evaluation, one entry per driver in every array (hours are floats)
+    """
+
+    def __init__(self, driver_ids, names, driving_hours, window_hours, cycle_hours, shift_start, now):
+        self.driver_ids = driver_ids
+        self.names = names
+        self.driving_hours = driving_hours
+        self.window_hours = window_hours
+        self.cycle_hours = cycle_hours
+        self.shift_start = shift_start
+        self.now = now
+
+        self.driving_left = np.clip(DRIVING_LIMIT_HOURS - driving_hours, 0, None)
+        self.window_left = np.clip(WINDOW_LIMIT_HOURS - window_hours, 0, None)
+        self.cycle_left = np.clip(CYCLE_LIMIT_HOURS - cycle_hours, 0, None)
+        self.remaining_hours = np.minimum(np.minimum(self.driving_left, self.window_left), self.cycle_left)
+
+        self.compliant_11_hour = driving_hours <= DRIVING_LIMIT_HOURS
+        self.compliant_14_hour = window_hours <= WINDOW_LIMIT_HOURS
+        self.compliant_70_hour = cycle_hours < CYCLE_LIMIT_HOURS
+
+    def __len__(self):
+        return len(self.driver_ids)
+
+    def index_of(self, driver_id):
+        idx = np.searchsorted(self.driver_ids, driver_id)
+        if idx >= len(self.driver_ids) or self.driver_ids[idx] != driver_id:
+            return None
+        return idx
+
+    def window_end(self, driver_id):
+        """
+        @return: datetime at which the 14-hour window of the driver's current shift closes, None if no shift is open
+        """
+        idx = self.index_of(driver_id)
+        if idx is None or np.isnan(self.shift_start[idx]):
+            return None
+        return datetime.fromtimestamp(self.shift_start[idx] + WINDOW_LIMIT_HOURS * _HOUR, tz=timezone.get_current_timezone())
+
+    def to_rows(self, available_only=False):
+        rows = []
+        for idx in range(len(self.driver_ids)):
+            if available_only and self.remaining_hours[idx] <= 0:
+                continue
+
+            rows.append({
+                "driver": int(self.driver_ids[idx]),
+                "name": self.names[idx] if self.names is not None else None,
+                "driving_hours": round(float(self.driving_hours[idx]), 2),
+                "window_hours": round(float(self.window_hours[idx]), 2),
+                "cycle_hours": round(float(self.cycle_hours[idx]), 2),
+                "remaining_hours": round(float(self.remaining_hours[idx]), 2),
+                "compliant_11_hour": bool(self.compliant_11_hour[idx]),
+                "compliant_14_hour": bool(self.compliant_14_hour[idx]),
+                "compliant_70_hour": bool(self.compliant_70_hour[idx]),
+            })
+
+        return rows
+
+
+def _to_epoch(values):
+    return np.array([v.timestamp() if v else np.nan for v in values], dtype=np.float64)
+
+
+def _first_set(*columns):
+    """
+    Element wise first non NaN value of the given columns (the last one is expected to be always set)
+    """
+    result = columns[-1]
+    for column in reversed(columns[:-1]):
+        result = np.where(np.isnan(column), result, column)
+    return result
+
+
+def load_duty_intervals(since, now, driver_ids=None):
+    """
+    Loads the duty intervals overlapping [since, now] for the given drivers (all when None) in 2 queries.
+    Trips are split in driving / on-duty (pickup and drop-off) intervals, rest breaks are off-duty.
+    @return: tuple of numpy arrays (driver_id, start, end, status), start and end in epoch seconds
+    """
+    trip_q = Q(start_dt__lte=now) & (Q(end_dt__isnull=True) | Q(end_dt__gte=since))
+    rest_q = Q(start_dt__lte=now) & (Q(end_dt__isnull=True) | Q(end_dt__gte=since))
+    if driver_ids is not None:
+        trip_q &= Q(driver_id__in=driver_ids)
+        rest_q &= Q(trip__driver_id__in=driver_ids)
+
+    trips = list(Trip.objects.filter(trip_q).values_list(
+        'driver_id', 'start_dt', 'end_dt', 'pickup_start_dt', 'pickup_end_dt', 'drop_off_start_dt', 'drop_off_end_dt'
+    ))
+    rests = list(RestBreak.objects.filter(rest_q).values_list('trip__driver_id', 'start_dt', 'end_dt'))
+
+    now_ts = now.timestamp()
+
+    if trips:
+        columns = list(zip(*trips))
+        driver = np.array(columns[0], dtype=np.int64)
+        start, end, pickup_start, pickup_end, drop_start, drop_end = (_to_epoch(column) for column in columns[1:])
+    else:
+        driver = np.empty(0, dtype=np.int64)
+        start = end = pickup_start = pickup_end = drop_start = drop_end = np.empty(0)
+
+    end = np.where(np.isnan(end), now_ts, end)
+
+    # each trip is cut in: driving, pickup, driving, drop-off (phases that did not happen are dropped below)
+    parts = [
+        (start, _first_set(pickup_start, drop_start, end), DRIVING),
+        (pickup_start, _first_set(pickup_end, drop_start, end), ON_DUTY),
+        (pickup_end, _first_set(drop_start, end), DRIVING),
+        (drop_start, _first_set(drop_end, end), ON_DUTY),
+    ]
+
+    if rests:
+        columns = list(zip(*rests))
+        rest_start = _to_epoch(columns[1])
+        rest_end = _to_epoch(columns[2])
+        parts.append((rest_start, np.where(np.isnan(rest_end), now_ts, rest_end), OFF_DUTY))
+        rest_driver = np.array(columns[0], dtype=np.int64)
+    else:
+        rest_driver = np.empty(0, dtype=np.int64)
+
+    drivers = np.concatenate([driver, driver, driver, driver, rest_driver])
+    starts = np.concatenate([p[0] for p in parts])
+    ends = np.concatenate([p[1] for p in parts])
+    statuses = np.concatenate([np.full(len(p[0]), p[2], dtype=np.int8) for p in parts])
+
+    valid = ~np.isnan(starts) & (ends > starts)
+    return drivers[valid], np.minimum(starts[valid], now_ts), np.minimum(ends[valid], now_ts), statuses[valid]
+
+
+def _work_segments(drivers, starts, ends, statuses):
+    """
+    Sweeps the intervals of all drivers at once and returns the elementary segments where the driver was working.
+    Off-duty intervals suspend the work (rest breaks are taken inside the trip interval).
+    @return: tuple (driver, start, end, is_driving) of the working segments, sorted by driver and time
+    """
+    work_delta = np.where(statuses == OFF_DUTY, -1, 1)
+    drive_delta = np.where(statuses == DRIVING, 1, np.where(statuses == OFF_DUTY, -1, 0))
+
+    ev_driver = np.concatenate([drivers, drivers])
+    ev_time = np.concatenate([starts, ends])
+    ev_work = np.concatenate([work_delta, -work_delta])
+    ev_drive = np.concatenate([drive_delta, -drive_delta])
+
+    order = np.lexsort((ev_time, ev_driver))
+    ev_driver, ev_time = ev_driver[order], ev_time[order]
+
+    # the deltas of every driver sum up to 0 so a global cumsum restarts from 0 on each driver
+    work_level = np.cumsum(ev_work[order])
+    drive_level = np.cumsum(ev_drive[order])
+
+    same_driver = ev_driver[:-1] == ev_driver[1:]
+    seg_start = ev_time[:-1]
+    seg_end = ev_time[1:]
+    working = same_driver & (work_level[:-1] > 0) & (seg_end > seg_start)
+
+    return ev_driver[:-1][working], seg_start[working], seg_end[working], drive_level[:-1][working] > 0
+
+
+def evaluate(driver_ids=None, now=None, cycle_days=CYCLE_DAYS):
+    """
+    Evaluates the hours of service of the given drivers (whole fleet when None) in one pass.
+    @param driver_ids: iterable of driver ids or None for all the drivers
+    @param now: evaluation time, defaults to timezone.now()
+    @param cycle_days: number of days of the rolling cycle
+    @return: FleetHosStatus
+    """
+    now = now or timezone.now()
+    now_ts = now.timestamp()
+
+    today = timezone.localdate(now)
+    cycle_start = timezone.make_aware(datetime.combine(today - timedelta(days=cycle_days - 1), time.min))
+
+    if driver_ids is None:
+        fleet = list(Driver.objects.order_by('id').values_list('id', 'name'))
+        ids = np.array([row[0] for row in fleet], dtype=np.int64)
+        names = [row[1] for row in fleet]
+    else:
+        ids = np.unique(np.array(list(driver_ids), dtype=np.int64))
+        names = None
+
+    # the 10-hour reset may have started before the cycle window
+    since = min(cycle_start, now - timedelta(hours=WINDOW_LIMIT_HOURS + RESET_OFF_DUTY_HOURS))
+    drivers, starts, ends, statuses = load_duty_intervals(since, now, None if driver_ids is None else ids.tolist())
+
+    n = len(ids)
+    driving_hours = np.zeros(n)
+    cycle_hours = np.zeros(n)
+    shift_start = np.full(n, np.nan)
+
+    if len(drivers):
+        seg_driver, seg_start, seg_end, seg_driving = _work_segments(drivers, starts, ends, statuses)
+
+        known = np.isin(seg_driver, ids)
+        seg_driver, seg_start, seg_end, seg_driving = seg_driver[known], seg_start[known], seg_end[known], seg_driving[known]
+        seg_idx = np.searchsorted(ids, seg_driver)
+
+        # 70-hour/8-day: on duty time clipped to the cycle window
+        cycle_span = np.clip(seg_end, cycle_start.timestamp(), None) - np.clip(seg_start, cycle_start.timestamp(), None)
+        np.add.at(cycle_hours, seg_idx, np.clip(cycle_span, 0, None) / _HOUR)
+
+        # the shift starts on the first working segment after 10 consecutive hours off duty
+        prev_end = np.concatenate([[-np.inf], seg_end[:-1]])
+        new_driver = np.concatenate([[True], seg_driver[1:] != seg_driver[:-1]])
+        reset = new_driver | (seg_start - prev_end >= RESET_OFF_DUTY_HOURS * _HOUR)
+        np.fmax.at(shift_start, seg_idx[reset], seg_start[reset])
+
+        # the shift is over when the driver has been off duty for 10 hours since the last working segment
+        last_end = np.full(n, -np.inf)
+        np.maximum.at(last_end, seg_idx, seg_end)
+        shift_start[now_ts - last_end >= RESET_OFF_DUTY_HOURS * _HOUR] = np.nan
+
+        in_shift = seg_driving & (seg_start >= np.nan_to_num(shift_start[seg_idx], nan=np.inf))
+        np.add.at(driving_hours, seg_idx[in_shift], (seg_end[in_shift] - seg_start[in_shift]) / _HOUR)
+
+    window_hours = np.where(np.isnan(shift_start), 0, (now_ts - shift_start) / _HOUR)
+
+    return FleetHosStatus(ids, names, driving_hours, window_hours, cycle_hours, shift_start, now)
+
+
+def evaluate_driver(driver, now=None, cycle_days=CYCLE_DAYS):
+    """
+    Single driver shortcut of evaluate
+    """
+    return evaluate([driver.id], now=now, cycle_days=cycle_days)
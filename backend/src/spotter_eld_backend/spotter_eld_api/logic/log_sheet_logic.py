@@ -0,0 +1,493 @@
+"""
+Daily log sheet (record of duty status) builder.
+
+All the events of a driver-day are fetched in a constant number of queries and merged into one time ordered
+duty-status timeline, which feeds both the 24-hour grid and the recap.
+
+Log sheets of closed days are materialized in DailyLogSheet and served from there.
+"""
+import logging
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from helper.common.constants import DutyEventType, DutyStatus
+from spotter_eld.models import Trip, RestBreak, Fueling, DriverHos, DailyLogSheet, DutyEvent
+from spotter_eld_api.logic.cycle_logic import CYCLE_LIMIT_HOURS
+
+log = logging.getLogger(__name__)
+
+# the recap sums the on-duty hours of the last 7 days including the log day
+RECAP_DAYS = 7
+
+# number of days built out of one load of the events when serving a range
+RANGE_CHUNK_DAYS = 31
+# longest range served by the export
+RANGE_MAX_DAYS = 366
+
+# when two statuses overlap, the first one of this list wins
+STATUS_PRIORITY = [DutyStatus.SLEEPER_BERTH, DutyStatus.ON_DUTY, DutyStatus.DRIVING]
+
+
+def get_day_range(log_date):
+    """
+    @return: half-open [start, end) aware datetimes of the local day
+    """
+    day_start = timezone.make_aware(datetime.combine(log_date, time.min))
+    return day_start, day_start + timedelta(days=1)
+
+
+def iter_days(first_day, last_day):
+    day = first_day
+    while day <= last_day:
+        yield day
+        day += timedelta(days=1)
+
+
+def _get_event_querysets(driver, range_start, range_end):
+    """
+    @return: tuple (trips, rest_breaks, fuelings) querysets of load_events
+    """
+    overlap_q = Q(start_dt__lt=range_end) & (Q(end_dt__isnull=True) | Q(end_dt__gte=range_start))
+
+    return (
+        Trip.objects.filter(overlap_q, driver=driver)
+        .select_related('start_location', 'end_location', 'vehicle')
+        .order_by('start_dt'),
+        RestBreak.objects.filter(overlap_q, trip__driver=driver)
+        .select_related('location', 'trip__vehicle')
+        .order_by('start_dt'),
+        Fueling.objects.filter(trip__driver=driver, created_dt__gte=range_start, created_dt__lt=range_end)
+        .select_related('location')
+        .order_by('created_dt'),
+    )
+
+
+def _get_detected_statuses_queryset(trips):
+    for trip in trips:
+        trip.detected_statuses = []
+
+    return (
+        DutyEvent.objects.filter(trip_id__in=[trip.id for trip in trips], type=DutyEventType.DUTY_STATUS)
+        .order_by('ts', 'id').values_list('trip_id', 'ts', 'data')
+    )
+
+
+def _set_detected_status(trips_by_id, trip_id, ts, data):
+    trips_by_id[trip_id].detected_statuses.append((ts, data["status"]))
+
+
+def load_events(driver, range_start, range_end):
+    """
+    Fetches every event of the driver overlapping [range_start, range_end) in 4 queries, with the related rows
+    the log sheet needs already joined. The duty statuses detected from the telemetry are set on their trip as
+    detected_statuses, a list of (ts, status).
+    @return: tuple (trips, rest_breaks, fuelings) ordered by time
+    """
+    trips, rest_breaks, fuelings = _get_event_querysets(driver, range_start, range_end)
+
+    trips = list(trips)
+    trips_by_id = {trip.id: trip for trip in trips}
+    for row in _get_detected_statuses_queryset(trips):
+        _set_detected_status(trips_by_id, *row)
+
+    return trips, list(rest_breaks), list(fuelings)
+
+
+async def aload_events(driver, range_start, range_end):
+    """
+    load_events for the async views, with the async ORM
+    """
+    trips, rest_breaks, fuelings = _get_event_querysets(driver, range_start, range_end)
+
+    trips = [trip async for trip in trips]
+    trips_by_id = {trip.id: trip for trip in trips}
+    async for row in _get_detected_statuses_queryset(trips):
+        _set_detected_status(trips_by_id, *row)
+
+    return trips, [rest async for rest in rest_breaks], [fuel async for fuel in fuelings]
+
+
+def _get_on_duty_buckets_queryset(driver, first_day, last_day):
+    return (
+        DriverHos.objects.filter(driver=driver, date__gte=first_day, date__lte=last_day)
+        .values_list('date', 'total_on_duty_hours')
+    )
+
+
+def load_on_duty_buckets(driver, first_day, last_day):
+    """
+    @return: dict {date: on-duty hours} from the driver's daily cycle buckets
+    """
+    return dict(_get_on_duty_buckets_queryset(driver, first_day, last_day))
+
+
+async def aload_on_duty_buckets(driver, first_day, last_day):
+    return {day: hours async for day, hours in _get_on_duty_buckets_queryset(driver, first_day, last_day)}
+
+
+def trip_duty_intervals(trip, now):
+    """
+    Splits a trip in driving and on-duty (pickup / drop-off) intervals. From the first duty status detected from the
+    telemetry (see duty_status_logic), the detected statuses replace the ones derived from the tapped phases.
+    @return: list of (start, end, status)
+    """
+    end = trip.end_dt or now
+
+    def _first_set(*values):
+        return next(value for value in values if value)
+
+    intervals = [
+        (trip.start_dt, _first_set(trip.pickup_start_dt, trip.drop_off_start_dt, end), DutyStatus.DRIVING),
+    ]
+    if trip.pickup_start_dt:
+        intervals.append((trip.pickup_start_dt, _first_set(trip.pickup_end_dt, trip.drop_off_start_dt, end), DutyStatus.ON_DUTY))
+    if trip.pickup_end_dt:
+        intervals.append((trip.pickup_end_dt, _first_set(trip.drop_off_start_dt, end), DutyStatus.DRIVING))
+    if trip.drop_off_start_dt:
+        intervals.append((trip.drop_off_start_dt, _first_set(trip.drop_off_end_dt, end), DutyStatus.ON_DUTY))
+
+    detected = [(ts, status) for ts, status in getattr(trip, 'detected_statuses', []) if trip.start_dt <= ts < end]
+    if not detected:
+        return intervals
+
+    first_detected = detected[0][0]
+    intervals = [(start, min(stop, first_detected), status) for start, stop, status in intervals if start < first_detected]
+    for (start, status), (stop, _) in zip(detected, detected[1:] + [(end, None)]):
+        if status != DutyStatus.OFF_DUTY:
+            intervals.append((start, stop, status))
+
+    return intervals
+
+
+def build_timeline(intervals, day_start, day_stop):
+    """
+    Merges possibly overlapping (start, end, status) intervals into consecutive segments covering [day_start, day_stop).
+    Uncovered time is Off Duty, overlaps are resolved with STATUS_PRIORITY.
+    @return: list of (start, end, status) without gaps, adjacent segments have different statuses
+    """
+    events = []
+    for start, end, status in intervals:
+        start, end = max(start, day_start), min(end, day_stop)
+        if start < end:
+            events.append((start, 1, status))
+            events.append((end, -1, status))
+    events.sort(key=lambda event: event[0])
+
+    active = {status: 0 for status in STATUS_PRIORITY}
+    timeline = []
+    cursor = day_start
+    idx = 0
+    while cursor < day_stop:
+        while idx < len(events) and events[idx][0] <= cursor:
+            active[events[idx][2]] += events[idx][1]
+            idx += 1
+
+        next_change = events[idx][0] if idx < len(events) else day_stop
+        status = next((status for status in STATUS_PRIORITY if active[status] > 0), DutyStatus.OFF_DUTY)
+
+        if timeline and timeline[-1][2] == status:
+            timeline[-1] = (timeline[-1][0], next_change, status)
+        else:
+            timeline.append((cursor, next_change, status))
+        cursor = next_change
+
+    return timeline
+
+
+def _hours(delta):
+    return delta.total_seconds() / 3600
+
+
+def build_log_sheet(driver, log_date, trips, rest_breaks, fuelings, on_duty_buckets, now=None):
+    """
+    Builds the log sheet of one day out of already loaded events (no query is issued).
+    Events outside of the day are ignored, so the same lists can be used for several days.
+    """
+    now = now or timezone.now()
+    day_start, day_end = get_day_range(log_date)
+    day_stop = min(day_end, max(now, day_start))
+
+    def _in_day(dt):
+        return dt and day_start <= dt < day_end
+
+    intervals = []
+    trip_events = []
+    miles_driven = 0
+
+    for trip in trips:
+        intervals.extend(trip_duty_intervals(trip, now))
+
+        if _in_day(trip.start_dt):
+            miles_driven += trip.distance
+            trip_events.append((trip.start_dt, {
+                "type": "Trip Start",
+                "timestamp": trip.start_dt.isoformat(),
+                "location": trip.start_location.name,
+                "odometer": trip.vehicle.current_mileage,
+            }))
+
+        if _in_day(trip.end_dt):
+            trip_events.append((trip.end_dt, {
+                "type": "Trip End",
+                "timestamp": trip.end_dt.isoformat(),
+                "location": trip.end_location.name,
+                "odometer": trip.vehicle.current_mileage,
+            }))
+
+    for rest in rest_breaks:
+        intervals.append((rest.start_dt, rest.end_dt or now, DutyStatus.SLEEPER_BERTH))
+
+        if _in_day(rest.start_dt):
+            trip_events.append((rest.start_dt, {
+                "type": "Rest Break",
+                "timestamp": rest.start_dt.isoformat(),
+                "location": rest.location.name,
+                "odometer": rest.trip.vehicle.current_mileage,
+            }))
+
+    for fuel in fuelings:
+        if not _in_day(fuel.created_dt):
+            continue
+
+        if fuel.duration:
+            intervals.append((fuel.created_dt, fuel.created_dt + timedelta(minutes=fuel.duration), DutyStatus.ON_DUTY))
+
+        trip_events.append((fuel.created_dt, {
+            "type": "Fuel Stop",
+            "timestamp": fuel.created_dt.isoformat(),
+            "location": fuel.location.name,
+            "odometer": fuel.mileage_at_fueling,
+        }))
+
+    timeline = build_timeline(intervals, day_start, day_stop)
+
+    total_hours = {
+        DutyStatus.OFF_DUTY: 0,
+        DutyStatus.SLEEPER_BERTH: 0,
+        DutyStatus.DRIVING: 0,
+        DutyStatus.ON_DUTY: 0,
+    }
+    logs = []
+    for start, end, status in timeline:
+        total_hours[status] += _hours(end - start)
+        logs.append({
+            "startHour": round(_hours(start - day_start), 2),
+            "endHour": round(_hours(end - day_start), 2),
+            "status": status,
+        })
+    total_hours = {status: round(hours, 2) for status, hours in total_hours.items()}
+
+    driving_hours = total_hours[DutyStatus.DRIVING]
+    on_duty_hours = round(total_hours[DutyStatus.DRIVING] + total_hours[DutyStatus.ON_DUTY], 2)
+
+    # 70-hour/8-day recap: on-duty hours of the last 7 days including the log day
+    recap_hours = on_duty_hours + sum(
+        hours for day, hours in on_duty_buckets.items() if log_date - timedelta(days=RECAP_DAYS - 1) <= day < log_date
+    )
+
+    trip_events.sort(key=lambda event: event[0])
+
+    return {
+        "driver": {
+            "name": driver.name,
+            "license": driver.license_number,
+        },
+        "date": log_date.isoformat(),
+        "logs": logs,
+        "trip_events": [event for _, event in trip_events],
+        "daily_recap": {
+            "total_driving_hours": f"{driving_hours} hrs",
+            "total_on_duty_hours": f"{on_duty_hours} hrs",
+            "hours_available_tomorrow": round(max(0, CYCLE_LIMIT_HOURS - recap_hours), 2),
+            "miles_driven": f"{miles_driven} miles",
+        },
+        "total_hours": total_hours,
+        "remarks": [event["location"] for _, event in trip_events],
+    }
+
+
+def group_events_by_day(first_day, last_day, trips, rest_breaks, fuelings, now):
+    """
+    Dispatches the events on the days they touch in one pass
+    @return: dict {date: (trips, rest_breaks, fuelings)} for every day of [first_day, last_day]
+    """
+    days = {day: ([], [], []) for day in iter_days(first_day, last_day)}
+
+    def _dispatch(events, idx, get_start, get_end):
+        for event in events:
+            start_day = max(timezone.localdate(get_start(event)), first_day)
+            end_day = min(timezone.localdate(get_end(event) or now), last_day)
+            for day in iter_days(start_day, end_day):
+                days[day][idx].append(event)
+
+    _dispatch(trips, 0, lambda trip: trip.start_dt, lambda trip: trip.end_dt)
+    _dispatch(rest_breaks, 1, lambda rest: rest.start_dt, lambda rest: rest.end_dt)
+    _dispatch(fuelings, 2, lambda fuel: fuel.created_dt, lambda fuel: fuel.created_dt)
+
+    return days
+
+
+def build_log_sheets(driver, first_day, last_day, now=None):
+    """
+    Builds the log sheets of every day of [first_day, last_day] out of a single load of the events
+    @return: generator of (date, log sheet)
+    """
+    now = now or timezone.now()
+    range_start, range_end = get_day_range(first_day)[0], get_day_range(last_day)[1]
+
+    trips, rest_breaks, fuelings = load_events(driver, range_start, range_end)
+    on_duty_buckets = load_on_duty_buckets(driver, first_day - timedelta(days=RECAP_DAYS - 1), last_day - timedelta(days=1))
+
+    days = group_events_by_day(first_day, last_day, trips, rest_breaks, fuelings, now)
+    for day, (day_trips, day_rest_breaks, day_fuelings) in days.items():
+        yield day, build_log_sheet(driver, day, day_trips, day_rest_breaks, day_fuelings, on_duty_buckets, now=now)
+
+
+def build_driver_log_sheet(driver, log_date, now=None):
+    """
+    Builds the log sheet of the driver for the given date from the event tables in a constant number of queries
+    @param driver: Driver
+    @param log_date: datetime.date
+    """
+    day_start, day_end = get_day_range(log_date)
+
+    trips, rest_breaks, fuelings = load_events(driver, day_start, day_end)
+    on_duty_buckets = load_on_duty_buckets(driver, log_date - timedelta(days=RECAP_DAYS - 1), log_date - timedelta(days=1))
+
+    return build_log_sheet(driver, log_date, trips, rest_breaks, fuelings, on_duty_buckets, now=now)
+
+
+async def abuild_driver_log_sheet(driver, log_date, now=None):
+    day_start, day_end = get_day_range(log_date)
+
+    trips, rest_breaks, fuelings = await aload_events(driver, day_start, day_end)
+    on_duty_buckets = await aload_on_duty_buckets(
+        driver, log_date - timedelta(days=RECAP_DAYS - 1), log_date - timedelta(days=1)
+    )
+
+    return build_log_sheet(driver, log_date, trips, rest_breaks, fuelings, on_duty_buckets, now=now)
+
+
+def is_day_closed(log_date, now=None):
+    return get_day_range(log_date)[1] <= (now or timezone.now())
+
+
+def store_log_sheets(driver, log_sheets):
+    """
+    Upserts materialized log sheets
+    @param log_sheets: iterable of (date, log sheet)
+    """
+    rows = [DailyLogSheet(driver_id=driver.id, date=day, payload=payload) for day, payload in log_sheets]
+    if rows:
+        DailyLogSheet.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['driver', 'date'], update_fields=['payload', 'updated_dt']
+        )
+
+
+async def astore_log_sheets(driver, log_sheets):
+    rows = [DailyLogSheet(driver_id=driver.id, date=day, payload=payload) for day, payload in log_sheets]
+    if rows:
+        await DailyLogSheet.objects.abulk_create(
+            rows, update_conflicts=True, unique_fields=['driver', 'date'], update_fields=['payload', 'updated_dt']
+        )
+
+
+def get_driver_log_sheet(driver, log_date, now=None):
+    """
+    Returns the log sheet of the driver for the given date.
+    Closed days are served from DailyLogSheet when the stored sheet was built after the day closed,
+    otherwise the sheet is built from the events (and stored if the day is closed).
+    """
+    now = now or timezone.now()
+    day_end = get_day_range(log_date)[1]
+
+    if day_end > now:
+        return build_driver_log_sheet(driver, log_date, now=now)
+
+    stored = (
+        DailyLogSheet.objects.filter(driver=driver, date=log_date, updated_dt__gte=day_end)
+        .values_list('payload', flat=True).first()
+    )
+    if stored is not None:
+        return stored
+
+    log_sheet = build_driver_log_sheet(driver, log_date, now=now)
+    store_log_sheets(driver, [(log_date, log_sheet)])
+
+    return log_sheet
+
+
+async def aget_driver_log_sheet(driver, log_date, now=None):
+    """
+    get_driver_log_sheet for the async views, with the async ORM
+    """
+    now = now or timezone.now()
+    day_end = get_day_range(log_date)[1]
+
+    if day_end > now:
+        return await abuild_driver_log_sheet(driver, log_date, now=now)
+
+    stored = await (
+        DailyLogSheet.objects.filter(driver=driver, date=log_date, updated_dt__gte=day_end)
+        .values_list('payload', flat=True).afirst()
+    )
+    if stored is not None:
+        return stored
+
+    log_sheet = await abuild_driver_log_sheet(driver, log_date, now=now)
+    await astore_log_sheets(driver, [(log_date, log_sheet)])
+
+    return log_sheet
+
+
+def refresh_log_sheets(driver, start_dt, end_dt, now=None):
+    """
+    Rebuilds the materialized sheets of the closed days touched by the [start_dt, end_dt] interval
+    (a trip or rest break that was just closed). Today's sheet is built on read.
+    """
+    now = now or timezone.now()
+    first_day = timezone.localdate(start_dt)
+    last_day = min(timezone.localdate(end_dt or now), timezone.localdate(now) - timedelta(days=1))
+
+    if first_day > last_day:
+        return
+
+    store_log_sheets(driver, build_log_sheets(driver, first_day, last_day, now=now))
+
+
+def iter_driver_log_sheets(driver, first_day, last_day, now=None):
+    """
+    Yields the log sheets of [first_day, last_day] in date order, chunk by chunk so that the memory used does not
+    grow with the range. Each chunk reads the materialized sheets once and builds the missing days out of a single
+    load of the events.
+    @return: generator of (date, log sheet)
+    """
+    now = now or timezone.now()
+
+    chunk_start = first_day
+    while chunk_start <= last_day:
+        chunk_end = min(chunk_start + timedelta(days=RANGE_CHUNK_DAYS - 1), last_day)
+
+        stored = {
+            day: payload
+            for day, payload, updated_dt in DailyLogSheet.objects.filter(
+                driver=driver, date__gte=chunk_start, date__lte=chunk_end
+            ).values_list('date', 'payload', 'updated_dt')
+            if updated_dt >= get_day_range(day)[1]
+        }
+
+        built = {}
+        if len(stored) < (chunk_end - chunk_start).days + 1:
+            built = {
+                day: log_sheet
+                for day, log_sheet in build_log_sheets(driver, chunk_start, chunk_end, now=now)
+                if day not in stored
+            }
+            store_log_sheets(driver, [(day, log_sheet) for day, log_sheet in built.items() if is_day_closed(day, now)])
+
+        for day in iter_days(chunk_start, chunk_end):
+            yield day, stored[day] if day in stored else built[day]
+
+        chunk_start = chunk_end + timedelta(days=1)
@@ -0,0 +1,256 @@
+"""
+Batch upload of the events recorded by the app while offline.
+
+The events are applied in their order, at their own timestamps, in one transaction: the trips, rest breaks and
+locations they refer to are read once (the rows that change are locked), the transitions are applied in memory with
+the rules of trip_logic, each trip is then saved once and the duty events are inserted in one statement. Every event
+carries an idempotency key, stored on its DutyEvent: an event applied by a previous upload is reported as a duplicate
+and not applied again. An event breaking a rule is rejected without failing the others.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from helper.common.constants import DutyEventType, SyncEventStatus, SyncEventType, TransitionOutcome, TripStatus
+from spotter_eld.models import DutyEvent, Fueling, Location, RestBreak, Trip
+from spotter_eld_api.logic import cycle_logic, log_sheet_logic, trip_logic
+
+SYNC_MAX_EVENTS = 500
+
+# the clock of the app may run a bit ahead of the server's
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+# fueling must occur at least once every MAX_FUELING_MILES
+MAX_FUELING_MILES = 1000
+
+PHASES = {
+    SyncEventType.START_PICKUP: 'pickup_start_dt',
+    SyncEventType.END_PICKUP: 'pickup_end_dt',
+    SyncEventType.START_DROP_OFF: 'drop_off_start_dt',
+    SyncEventType.END_DROP_OFF: 'drop_off_end_dt',
+}
+
+TRIP_FIELDS = [*PHASES.values(), 'pickup_duration', 'drop_off_duration', 'violations', 'end_dt', 'status', 'updated_dt']
+
+REJECTIONS = {
+    TransitionOutcome.NOT_FOUND: "Trip not found.",
+    TransitionOutcome.ALREADY_DONE: "This phase is already recorded for the trip.",
+    TransitionOutcome.NOT_ONGOING: "The trip is not ongoing.",
+    TransitionOutcome.OUT_OF_ORDER: "The previous phase of the trip is not recorded.",
+}
+
+
+class _Rejected(Exception):
+    pass
+
+
+class _Batch:
+    """
+    Rows read by the batch and changes applied so far
+    """
+
+    def __init__(self, driver, events):
+        self.driver = driver
+
+        keys = [event["key"] for event in events] + [event["rest_break_key"] for event in events
+                                                      if "rest_break_key" in event]
+        # key -> data of the duty event recorded for it
+        self.applied = dict(
+            DutyEvent.objects.filter(driver_id=driver.id, client_key__in=keys).values_list("client_key", "data")
+        )
+
+        self.trips = {
+            trip.id: trip
+            for trip in Trip.objects.select_for_update().filter(
+                driver_id=driver.id, id__in={event["trip"] for event in events if "trip" in event}
+            )
+        }
+        self.location_ids = set(
+            Location.objects.filter(id__in={event["location"] for event in events if "location" in event})
+            .values_list("id", flat=True)
+        )
+
+        rest_break_ids = {event["rest_break"] for event in events if "rest_break" in event}
+        rest_break_ids.update(data["rest_break_id"] for data in self.applied.values() if "rest_break_id" in data)
+        self.rest_breaks = {
+            rest_break.id: rest_break
+            for rest_break in RestBreak.objects.select_for_update().filter(trip__driver_id=driver.id, id__in=rest_break_ids)
+        }
+        # key of the START_REST_BREAK event -> RestBreak
+        self.rest_breaks_by_key = {
+            key: self.rest_breaks.get(data["rest_break_id"])
+            for key, data in self.applied.items() if "rest_break_id" in data
+        }
+
+        self.max_mileages = dict(
+            Fueling.objects.filter(trip_id__in=self.trips).values("trip_id")
+            .annotate(max_mileage=Max("mileage_at_fueling")).values_list("trip_id", "max_mileage")
+        )
+
+        self.duty_events = []
+        self.changed_trips = {}
+        self.ended_trips = []
+        self.ended_rest_breaks = {}
+        self.fuelings = []
+
+    def _duty_event(self, trip_id, event_type, event, key=None, location_id=None, odometer=None, **data):
+        self.duty_events.append(DutyEvent(
+            driver_id=self.driver.id, trip_id=trip_id, type=event_type, ts=event["ts"], location_id=location_id,
+            odometer=odometer, data=data, client_key=key
+        ))
+
+    def _get_trip(self, event):
+        trip = self.trips.get(event["trip"])
+        if not trip:
+            raise _Rejected(REJECTIONS[TransitionOutcome.NOT_FOUND])
+        if event["ts"] < trip.start_dt:
+            raise _Rejected("The event happened before the start of the trip.")
+        return trip
+
+    def _check_location(self, event):
+        if event["location"] not in self.location_ids:
+            raise _Rejected("Location not found.")
+
+    def apply_phase(self, event):
+        phase = PHASES[event["type"]]
+        trip = self.trips.get(event["trip"])
+
+        state = {field: getattr(trip, field) for field in ['status', 'start_dt', *PHASES.values()]} if trip else None
+        rejection = trip_logic.get_rejection(state, phase)
+        if rejection:
+            raise _Rejected(REJECTIONS[rejection])
+        if event["ts"] < state[trip_logic.TRANSITIONS[phase]]:
+            raise _Rejected("The event happened before the previous phase of the trip.")
+
+        trip_logic.set_phase(trip, phase, event["ts"])
+        self.changed_trips[trip.id] = trip
+        if trip.status == TripStatus.ENDED:
+            self.ended_trips.append(trip)
+
+        for i, event_type in enumerate(trip_logic.PHASE_EVENTS[phase]):
+            self._duty_event(trip.id, event_type, event, key=event["key"] if i == 0 else None)
+
+        return trip.id
+
+    def start_rest_break(self, event):
+        trip = self._get_trip(event)
+        if trip.status != TripStatus.ONGOING:
+            raise _Rejected("Rest breaks can only be taken during the ongoing trip of the driver.")
+        self._check_location(event)
+
+        # saved one by one, MySQL does not return the ids of a bulk insert
+        rest_break = RestBreak.objects.create(trip=trip, location_id=event["location"], start_dt=event["ts"])
+        self.rest_breaks[rest_break.id] = rest_break
+        self.rest_breaks_by_key[event["key"]] = rest_break
+
+        self._duty_event(trip.id, DutyEventType.REST_BREAK_START, event, key=event["key"],
+                         location_id=rest_break.location_id, rest_break_id=rest_break.id)
+        return rest_break.id
+
+    def end_rest_break(self, event):
+        if "rest_break" in event:
+            rest_break = self.rest_breaks.get(event["rest_break"])
+        else:
+            rest_break = self.rest_breaks_by_key.get(event["rest_break_key"])
+
+        if not rest_break:
+            raise _Rejected("Rest Break not found.")
+        if rest_break.end_dt:
+            raise _Rejected("Rest Break already ended for this trip.")
+        if event["ts"] < rest_break.start_dt:
+            raise _Rejected("The event happened before the start of the rest break.")
+
+        rest_break.end_dt = event["ts"]
+        rest_break.duration = (rest_break.end_dt - rest_break.start_dt).total_seconds() / 60
+        self.ended_rest_breaks[rest_break.id] = rest_break
+
+        self._duty_event(rest_break.trip_id, DutyEventType.REST_BREAK_END, event, key=event["key"],
+                         location_id=rest_break.location_id, rest_break_id=rest_break.id, duration=rest_break.duration)
+        return rest_break.id
+
+    def add_fueling(self, event):
+        trip = self._get_trip(event)
+        self._check_location(event)
+
+        last_mileage = self.max_mileages.get(trip.id)
+        if last_mileage is not None and event["mileage_at_fueling"] - last_mileage > MAX_FUELING_MILES:
+            raise _Rejected("Fueling must occur at least once every 1,000 miles.")
+
+        fueling = Fueling.objects.create(
+            trip=trip, location_id=event["location"], amount=event["amount"], cost=event["cost"],
+            duration=event.get("duration"), mileage_at_fueling=event["mileage_at_fueling"],
+        )
+        # created_dt is the time of the fueling, set to the event time with the other changes
+        fueling.created_dt = event["ts"]
+        self.fuelings.append(fueling)
+        self.max_mileages[trip.id] = max(last_mileage or 0, fueling.mileage_at_fueling)
+
+        self._duty_event(trip.id, DutyEventType.FUELING, event, key=event["key"], location_id=fueling.location_id,
+                         odometer=fueling.mileage_at_fueling, fueling_id=fueling.id, amount=fueling.amount,
+                         cost=fueling.cost, duration=fueling.duration)
+        return fueling.id
+
+    def save(self):
+        for trip in self.changed_trips.values():
+            # saved (not updated) so that the signals refresh the cached trip state
+            trip.save(update_fields=TRIP_FIELDS)
+
+        RestBreak.objects.bulk_update(list(self.ended_rest_breaks.values()), ['end_dt', 'duration'])
+        Fueling.objects.bulk_update(self.fuelings, ['created_dt'])
+        DutyEvent.objects.bulk_create(self.duty_events)
+
+        for trip in self.ended_trips:
+            # Book the trip hours into the driver's daily buckets and roll the 70-hour/8-day cycle
+            cycle_logic.record_trip(self.driver, trip)
+            transaction.on_commit(
+                lambda trip=trip: log_sheet_logic.refresh_log_sheets(self.driver, trip.start_dt, trip.end_dt)
+            )
+        for rest_break in self.ended_rest_breaks.values():
+            transaction.on_commit(
+                lambda rest_break=rest_break: log_sheet_logic.refresh_log_sheets(
+                    self.driver, rest_break.start_dt, rest_break.end_dt
+                )
+            )
+
+
+def apply_events(driver, events, now=None):
+    """
+    @param events: list of validated SyncEventSerializer data, in the order they happened
+    @return: list of dict {key, status (SyncEventStatus), id of the trip / rest break / fueling or error}, one per
+    event
+    @raise IntegrityError: another upload applied one of the keys at the same time
+    """
+    now = now or timezone.now()
+
+    with transaction.atomic():
+        batch = _Batch(driver, events)
+        handlers = {
+            SyncEventType.START_REST_BREAK: batch.start_rest_break,
+            SyncEventType.END_REST_BREAK: batch.end_rest_break,
+            SyncEventType.FUELING: batch.add_fueling,
+            **{event_type: batch.apply_phase for event_type in PHASES},
+        }
+
+        results = []
+        for event in events:
+            key = event["key"]
+            if key in batch.applied:
+                results.append({"key": key, "status": SyncEventStatus.DUPLICATE})
+                continue
+
+            try:
+                if event["ts"] > now + MAX_CLOCK_SKEW:
+                    raise _Rejected("The event happened in the future.")
+                obj_id = handlers[event["type"]](event)
+            except _Rejected as e:
+                results.append({"key": key, "status": SyncEventStatus.REJECTED, "error": str(e)})
+                continue
+
+            batch.applied[key] = {}
+            results.append({"key": key, "status": SyncEventStatus.APPLIED, "id": obj_id})
+
+        batch.save()
+
+    return results
@@ -0,0 +1,113 @@
+"""
+GPS breadcrumb ingestion.
+
+The endpoint only validates the samples and appends them to a redis stream (see helper.redis.breadcrumb_stream),
+the request path does not write to the database. The drain_breadcrumbs workers read the stream in batches, insert
+the samples with one bulk insert per batch and run them through the duty-status detector (see duty_status_logic).
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.utils.dateparse import parse_datetime
+
+from helper.redis import breadcrumb_stream
+from spotter_eld.models import Breadcrumb
+from spotter_eld_api.logic import duty_status_logic
+
+MAX_SAMPLES = 1000
+MAX_SPEED_MPH = 200
+
+# rows per INSERT statement
+BULK_SIZE = 5000
+
+
+def _parse_ts(value):
+    """
+    @param value: epoch seconds or ISO 8601 datetime with an offset
+    @return: epoch seconds
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+
+    ts = parse_datetime(value) if isinstance(value, str) else None
+    if ts is None or ts.tzinfo is None:
+        raise ValueError("ts must be epoch seconds or an ISO 8601 datetime with an offset.")
+    return ts.timestamp()
+
+
+def _to_float(sample, name, low, high, required=True):
+    value = sample.get(name)
+    if value is None and not required:
+        return None
+
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number.")
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}.")
+    return value
+
+
+def parse_samples(raw_samples):
+    """
+    Validates the uploaded samples without DRF fields, which would cost more than the rest of the request
+    @param raw_samples: list of dict {lat, lon, speed, odometer (optional), ts}
+    @return: list of [ts (epoch seconds), latitude, longitude, speed, odometer] ordered by ts
+    @raise ValueError: with the error message of the first invalid sample
+    """
+    if not isinstance(raw_samples, list) or not raw_samples:
+        raise ValueError("samples must be a non empty list.")
+    if len(raw_samples) > MAX_SAMPLES:
+        raise ValueError(f"At most {MAX_SAMPLES} samples can be uploaded at once.")
+
+    samples = []
+    for i, sample in enumerate(raw_samples):
+        try:
+            if not isinstance(sample, dict):
+                raise ValueError("a sample must be an object.")
+            samples.append([
+                _parse_ts(sample.get("ts")),
+                _to_float(sample, "lat", -90, 90),
+                _to_float(sample, "lon", -180, 180),
+                _to_float(sample, "speed", 0, MAX_SPEED_MPH),
+                _to_float(sample, "odometer", 0, 10 ** 8, required=False),
+            ])
+        except ValueError as e:
+            raise ValueError(f"samples[{i}]: {e}")
+
+    samples.sort(key=lambda sample: sample[0])
+    return samples
+
+
+def to_breadcrumbs(vehicle_id, driver_id, samples):
+    return [
+        Breadcrumb(
+            vehicle_id=vehicle_id, driver_id=driver_id, ts=datetime.fromtimestamp(ts, tz=dt_timezone.utc),
+            latitude=latitude, longitude=longitude, speed=speed, odometer=odometer,
+        )
+        for ts, latitude, longitude, speed, odometer in samples
+    ]
+
+
+def drain(consumer, count=500, block_ms=1000, claim_stale=False):
+    """
+    Inserts one batch of stream entries and acknowledges them
+    @param count: entries read at once, an entry holds the samples of one upload
+    @param claim_stale: take the entries left pending by dead consumers first
+    @return: number of samples inserted
+    """
+    entries = breadcrumb_stream.claim_stale(consumer, count) if claim_stale else []
+    entries = entries or breadcrumb_stream.read(consumer, count, block_ms)
+    if not entries:
+        return 0
+
+    breadcrumbs = []
+    for _, vehicle_id, driver_id, samples in entries:
+        breadcrumbs.extend(to_breadcrumbs(vehicle_id, driver_id, samples))
+
+    # an entry drained twice (its consumer died before acknowledging it) hits the (vehicle, ts) unique key
+    Breadcrumb.objects.bulk_create(breadcrumbs, batch_size=BULK_SIZE, ignore_conflicts=True)
+    duty_status_logic.process(entries)
+    breadcrumb_stream.ack([entry_id for entry_id, *_ in entries])
+
+    return len(breadcrumbs)
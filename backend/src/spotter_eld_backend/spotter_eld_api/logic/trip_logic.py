@@ -0,0 +1,224 @@
+"""
+State machine of the trip phases: start_dt -> pickup_start_dt -> pickup_end_dt -> drop_off_start_dt -> drop_off_end_dt,
+the last one ends the trip.
+
+Each transition is a single conditional UPDATE of the ongoing trip of the driver, applied only when the phase is not
+set yet and the previous one is; the affected row count tells whether it went through. A repeated or concurrent tap
+is rejected by the database without locking, the reason of a rejection is only read on that path. The durations are
+computed from the trip state cached by trip_state_dao, a tap rejected on the cached state is checked again on the
+database state. An accepted tap appends its duty events in the same transaction, the phase columns being their
+projection (see duty_event_logic). Ending the trip also books its hours in that transaction, so that a retried tap,
+rejected as already done, can not lose them.
+
+.update() sends no signal, the caches refreshed by spotter_eld_api.signals on save are refreshed here.
+"""
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from helper.common.constants import DutyEventType, TransitionOutcome, TripStatus
+from helper.redis import redis_dao, trip_state_dao
+from spotter_eld.models import DutyEvent, Trip
+from spotter_eld_api.logic import cycle_logic, form_data_logic, log_sheet_logic
+
+# pickup and drop off are booked for at least an hour
+MIN_PHASE_MINUTES = 60
+
+# phase -> phase that must be set before it
+TRANSITIONS = {
+    'pickup_start_dt': 'start_dt',
+    'pickup_end_dt': 'pickup_start_dt',
+    'drop_off_start_dt': 'pickup_end_dt',
+    'drop_off_end_dt': 'drop_off_start_dt',
+}
+
+# phase -> duty events appended when it is set
+PHASE_EVENTS = {
+    'pickup_start_dt': [DutyEventType.PICKUP_START],
+    'pickup_end_dt': [DutyEventType.PICKUP_END],
+    'drop_off_start_dt': [DutyEventType.DROP_OFF_START],
+    'drop_off_end_dt': [DutyEventType.DROP_OFF_END, DutyEventType.TRIP_END],
+}
+
+
+def get_phase_minutes(start_dt, end_dt):
+    return max(MIN_PHASE_MINUTES, round((end_dt - start_dt).total_seconds() / 60, 2))
+
+
+def get_pickup_violations(pickup_duration):
+    """
+    @return: the violations of a trip when its pickup ends
+    """
+    return f"Pickup duration exceeded: {pickup_duration} minutes" if pickup_duration > MIN_PHASE_MINUTES else ""
+
+
+def get_drop_off_violation(drop_off_duration):
+    """
+    @return: the text appended to the violations of a trip when its drop off ends, None if there is no violation
+    """
+    if drop_off_duration > MIN_PHASE_MINUTES:
+        return f", Drop off duration exceeded: {drop_off_duration} minutes"
+    return None
+
+
+def _load_state(driver_id, trip_id):
+    """
+    @return: dict shaped like the trip_state_dao state of the trip, None if the driver has no such trip
+    """
+    trip = (
+        Trip.objects.filter(id=trip_id, driver_id=driver_id)
+        .values('id', 'vehicle_id', 'status', *trip_state_dao.PHASE_FIELDS)
+        .first()
+    )
+    if trip:
+        trip["trip_id"] = trip.pop("id")
+    return trip
+
+
+def get_rejection(state, phase):
+    """
+    @return: the TransitionOutcome rejecting the transition to 'phase', None if it is allowed
+    """
+    if not state:
+        return TransitionOutcome.NOT_FOUND
+    if state[phase]:
+        return TransitionOutcome.ALREADY_DONE
+    if state["status"] != TripStatus.ONGOING:
+        return TransitionOutcome.NOT_ONGOING
+    if not state[TRANSITIONS[phase]]:
+        return TransitionOutcome.OUT_OF_ORDER
+    return None
+
+
+def set_phase(trip, phase, ts):
+    """
+    Applies a transition to a Trip instance, with the same rules as the conditional updates
+    """
+    setattr(trip, phase, ts)
+    if phase == 'pickup_end_dt':
+        trip.pickup_duration = get_phase_minutes(trip.pickup_start_dt, ts)
+        trip.violations = get_pickup_violations(trip.pickup_duration)
+    elif phase == 'drop_off_end_dt':
+        trip.drop_off_duration = get_phase_minutes(trip.drop_off_start_dt, ts)
+        trip.end_dt = ts
+        trip.status = TripStatus.ENDED
+        violation = get_drop_off_violation(trip.drop_off_duration)
+        if violation:
+            trip.violations = (trip.violations or "") + violation
+
+
+def _build_trip(driver, state):
+    """
+    @return: unsaved Trip holding the state fields and the durations derived from them
+    """
+    trip = Trip(
+        id=state["trip_id"], driver=driver, vehicle_id=state["vehicle_id"], status=state["status"],
+        **{field: state[field] for field in trip_state_dao.PHASE_FIELDS}
+    )
+    if trip.pickup_start_dt and trip.pickup_end_dt:
+        trip.pickup_duration = get_phase_minutes(trip.pickup_start_dt, trip.pickup_end_dt)
+    if trip.drop_off_start_dt and trip.drop_off_end_dt:
+        trip.drop_off_duration = get_phase_minutes(trip.drop_off_start_dt, trip.drop_off_end_dt)
+
+    return trip
+
+
+def _refresh_caches(trip):
+    transaction.on_commit(lambda: trip_state_dao.save_trip(trip))
+    transaction.on_commit(lambda: redis_dao.invalidate(Trip, trip.id))
+    if trip.status != TripStatus.ONGOING:
+        # vehicle allocation depends on the ongoing trips
+        transaction.on_commit(form_data_logic.invalidate_vehicles)
+
+
+def _apply(driver, trip_id, phase, get_values, now=None, on_applied=None):
+    """
+    Sets 'phase' on the ongoing trip of the driver in one conditional UPDATE
+    @param get_values: function (state, now) returning the other fields to update
+    @param on_applied: function (trip) called in the transaction of the UPDATE when it went through
+    @return: tuple (TransitionOutcome, the updated trip or None), the trip is not read back: the fields that are not
+    part of the trip state (locations, distance, violations) are not loaded
+    """
+    now = now or timezone.now()
+
+    state = trip_state_dao.get_driver_trip(driver.id, trip_id)
+    is_cached = state is not None
+    if not is_cached:
+        # not the cached ongoing trip of the driver: an ended, foreign or unknown trip
+        state = _load_state(driver.id, trip_id)
+
+    rejection = get_rejection(state, phase)
+    if rejection and is_cached:
+        # the cached state may lag behind a commit whose write-through has not run or failed: only the database
+        # rejects a tap
+        state = _load_state(driver.id, trip_id)
+        rejection = get_rejection(state, phase)
+    if rejection:
+        return rejection, None
+
+    values = {phase: now, 'updated_dt': now, **get_values(state, now)}
+    with transaction.atomic():
+        updated = Trip.objects.filter(
+            id=state["trip_id"], driver_id=driver.id, status=TripStatus.ONGOING,
+            **{f"{phase}__isnull": True, f"{TRANSITIONS[phase]}__isnull": False}
+        ).update(**values)
+
+        if updated:
+            DutyEvent.objects.bulk_create([
+                DutyEvent(driver_id=driver.id, trip_id=state["trip_id"], type=event_type, ts=now)
+                for event_type in PHASE_EVENTS[phase]
+            ])
+
+            trip = _build_trip(driver, state)
+            for field, value in values.items():
+                if not hasattr(value, 'resolve_expression'):
+                    setattr(trip, field, value)
+            if on_applied:
+                on_applied(trip)
+
+    if not updated:
+        # a concurrent tap won
+        return get_rejection(_load_state(driver.id, trip_id), phase) or TransitionOutcome.ALREADY_DONE, None
+
+    _refresh_caches(trip)
+
+    return TransitionOutcome.DONE, trip
+
+
+def start_pickup(driver, trip_id, now=None):
+    return _apply(driver, trip_id, 'pickup_start_dt', lambda state, now: {}, now=now)
+
+
+def end_pickup(driver, trip_id, now=None):
+    def _get_values(state, now):
+        pickup_duration = get_phase_minutes(state["pickup_start_dt"], now)
+        return {'pickup_duration': pickup_duration, 'violations': get_pickup_violations(pickup_duration)}
+
+    return _apply(driver, trip_id, 'pickup_end_dt', _get_values, now=now)
+
+
+def start_drop_off(driver, trip_id, now=None):
+    return _apply(driver, trip_id, 'drop_off_start_dt', lambda state, now: {}, now=now)
+
+
+def end_drop_off(driver, trip_id, now=None):
+    """
+    Ends the drop off and the trip, and books the trip hours
+    """
+    def _get_values(state, now):
+        drop_off_duration = get_phase_minutes(state["drop_off_start_dt"], now)
+        values = {'drop_off_duration': drop_off_duration, 'end_dt': now, 'status': TripStatus.ENDED}
+        violation = get_drop_off_violation(drop_off_duration)
+        if violation:
+            # appended in the UPDATE, the pickup violations are not part of the trip state
+            values['violations'] = Concat(F('violations'), Value(violation))
+        return values
+
+    def _book_trip(trip):
+        # Book the trip hours into the driver's daily buckets and roll the 70-hour/8-day cycle
+        cycle_logic.record_trip(driver, trip)
+        # A trip running over midnight changes the materialized log sheets of the closed days
+        transaction.on_commit(lambda: log_sheet_logic.refresh_log_sheets(driver, trip.start_dt, trip.end_dt))
+
+    return _apply(driver, trip_id, 'drop_off_end_dt', _get_values, now=now, on_applied=_book_trip)
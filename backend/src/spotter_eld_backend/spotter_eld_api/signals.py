@@ -0,0 +1,105 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from helper.redis import redis_dao, token_dao, trip_events, trip_state_dao
+from spotter_eld.models import Driver, DutyEvent, Location, Trip, Vehicle
+from spotter_eld.signals import duty_events_created
+from spotter_eld_api.logic import form_data_logic
+
+
+@receiver([post_save, post_delete], sender=Location)
+def invalidate_location_form_data(sender, **kwargs):
+    transaction.on_commit(form_data_logic.invalidate_locations)
+
+
+@receiver([post_save, post_delete], sender=Vehicle)
+@receiver([post_save, post_delete], sender=Trip)
+def invalidate_vehicle_form_data(sender, **kwargs):
+    # vehicle allocation depends on the ongoing trips
+    transaction.on_commit(form_data_logic.invalidate_vehicles)
+
+
+@receiver(post_save, sender=Trip)
+def write_through_trip_state(sender, instance, **kwargs):
+    transaction.on_commit(lambda: trip_state_dao.save_trip(instance))
+
+
+@receiver(post_delete, sender=Trip)
+def purge_trip_state(sender, instance, **kwargs):
+    transaction.on_commit(lambda: trip_state_dao.purge(instance.driver_id))
+
+
+@receiver([post_save, post_delete], sender=Driver)
+@receiver([post_save, post_delete], sender=Vehicle)
+@receiver([post_save, post_delete], sender=Location)
+@receiver([post_save, post_delete], sender=Trip)
+def invalidate_cached_model(sender, instance, **kwargs):
+    transaction.on_commit(lambda: redis_dao.invalidate(sender, instance.pk))
+
+
+# User fields carried by the token claims, see spotter_eld_api.authentication
+USER_TOKEN_FIELDS = {'username', 'password', 'is_active', 'is_staff', 'is_superuser'}
+
+
+@receiver([post_save, post_delete], sender=User)
+def revoke_user_tokens(sender, instance, created=False, update_fields=None, **kwargs):
+    if not created and (update_fields is None or USER_TOKEN_FIELDS.intersection(update_fields)):
+        transaction.on_commit(lambda: token_dao.revoke_user_tokens(instance.pk))
+
+
+# Driver fields carried by the token claims and the user they are issued to
+DRIVER_TOKEN_FIELDS = ('name', 'license_number', 'user_id')
+
+
+def _revoke_tokens(user_ids):
+    for user_id in user_ids:
+        token_dao.revoke_user_tokens(user_id)
+
+
+@receiver(pre_save, sender=Driver)
+def load_driver_token_fields(sender, instance, update_fields=None, **kwargs):
+    # the stored values, compared by revoke_driver_tokens once saved
+    if not instance._state.adding and (
+        update_fields is None or {'user', *DRIVER_TOKEN_FIELDS}.intersection(update_fields)
+    ):
+        instance._stored_token_fields = Driver.objects.filter(pk=instance.pk).values(*DRIVER_TOKEN_FIELDS).first()
+
+
+@receiver(post_save, sender=Driver)
+def revoke_driver_tokens(sender, instance, created=False, **kwargs):
+    stored = instance.__dict__.pop('_stored_token_fields', None)
+    if created:
+        user_ids = {instance.user_id}
+    elif stored and any(stored[field] != getattr(instance, field) for field in DRIVER_TOKEN_FIELDS):
+        # a driver given to another user is no more the driver of the previous one
+        user_ids = {stored['user_id'], instance.user_id}
+    else:
+        return
+
+    # the driver claims of the tokens are stale, the driver logs in again
+    transaction.on_commit(lambda: _revoke_tokens(user_ids))
+
+
+@receiver(post_delete, sender=Driver)
+def revoke_deleted_driver_tokens(sender, instance, **kwargs):
+    transaction.on_commit(lambda: token_dao.revoke_user_tokens(instance.user_id))
+
+
+def _publish_duty_events(duty_events):
+    vehicle_ids = dict(
+        Trip.objects.filter(id__in={event.trip_id for event in duty_events}).values_list('id', 'vehicle_id')
+    )
+    trip_events.publish(duty_events, vehicle_ids)
+
+
+@receiver(duty_events_created, sender=DutyEvent)
+def push_duty_events(sender, duty_events, **kwargs):
+    transaction.on_commit(lambda: _publish_duty_events(duty_events))
+
+
+@receiver(post_save, sender=DutyEvent)
+def push_duty_event(sender, instance, created=False, **kwargs):
+    if created:
+        transaction.on_commit(lambda: _publish_duty_events([instance]))
@@ -1,3 +1,1295 @@
-from django.test import TestCase
+import json
+import pickle
+import re
+import threading
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.db.models import F, Q
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from redis import RedisError
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from helper.common import pagination
+from helper.decorators import api_decorators
+from helper.middleware import profiler_middleware
+from helper.redis import (
+    duty_status_dao, redis_dao, redis_keys, redis_tools, token_dao, trip_state_dao, two_tier_cache
+)
+from helper.common.constants import (
+    DutyEventType, DutyStatus, LocationType, SyncEventStatus, SyncEventType, TransitionOutcome, TripStatus
+)
+from spotter_eld_api.authentication import DriverTokenAuthentication
+from spotter_eld.management.commands import persist_token_blacklist
+from spotter_eld.models import Driver, DriverHos, DutyEvent, Vehicle, Location, Trip, RestBreak, Fueling
+from spotter_eld_api.logic import (
+    cycle_logic, duty_event_logic, duty_status_logic, form_data_logic, hos_engine, log_sheet_logic, sync_logic,
+    telemetry_logic, trip_list_logic, trip_logic
+)
+from spotter_eld_api.views import events
+from spotter_eld_api.views.serializers import TripListSerializer
+
+
+def _redis_is_up():
+    try:
+        return redis_tools.get_connection().ping()
+    except RedisError:
+        return False
+
+
+class LogSheetFixtureMixin:
+    log_date = date(2025, 3, 20)
+
+    def setUp(self):
+        user = User.objects.create_user(username="driver", password="pass")
+        self.driver = Driver.objects.create(user=user, name="Driver", license_number="LIC-1")
+        self.vehicle = Vehicle.objects.create(name="Truck", model="T1", year=2020, vin="VIN00000000000001", current_mileage=1000)
+        self.start_location = Location.objects.create(name="Start", latitude=1, longitude=1, type=LocationType.TRIP_START)
+        self.end_location = Location.objects.create(name="End", latitude=2, longitude=2, type=LocationType.TRIP_END)
+        self.day_start = timezone.make_aware(datetime.combine(self.log_date, time.min))
+
+    def _add_trip(self, start_hour):
+        start = self.day_start + timedelta(hours=start_hour)
+        trip = Trip.objects.create(
+            driver=self.driver, vehicle=self.vehicle, start_location=self.start_location, end_location=self.end_location,
+            start_dt=start, pickup_start_dt=start + timedelta(minutes=15), pickup_end_dt=start + timedelta(minutes=30),
+            drop_off_start_dt=start + timedelta(minutes=45), drop_off_end_dt=start + timedelta(minutes=50),
+            end_dt=start + timedelta(minutes=50), status=TripStatus.ENDED, distance=10,
+        )
+        RestBreak.objects.create(trip=trip, location=self.end_location, start_dt=start + timedelta(minutes=35),
+                                 end_dt=start + timedelta(minutes=40), duration=5)
+        fueling = Fueling.objects.create(trip=trip, location=self.start_location, amount=10, cost=30, duration=5,
+                                         mileage_at_fueling=1000)
+        Fueling.objects.filter(pk=fueling.pk).update(created_dt=start + timedelta(minutes=40))
+
+
+class CycleLedgerTest(LogSheetFixtureMixin, TestCase):
+
+    def test_trip_crossing_midnight(self):
+        start = self.day_start + timedelta(hours=22)
+        trip = Trip.objects.create(
+            driver=self.driver, vehicle=self.vehicle, start_location=self.start_location, end_location=self.end_location,
+            start_dt=start, pickup_start_dt=start, pickup_end_dt=start + timedelta(minutes=30), pickup_duration=60,
+            drop_off_start_dt=start + timedelta(hours=3, minutes=30), drop_off_end_dt=start + timedelta(hours=4),
+            drop_off_duration=60, end_dt=start + timedelta(hours=4), status=TripStatus.ENDED, distance=100,
+        )
+        cycle_logic.record_trip(self.driver, trip)
+
+        buckets = {
+            hos.date: (hos.total_driving_hours, hos.total_on_duty_hours)
+            for hos in DriverHos.objects.filter(driver=self.driver)
+        }
+        # the span is split on midnight, the pickup and drop off are not driving but are not added to it
+        self.assertEqual(buckets, {self.log_date: (1.5, 2), self.log_date + timedelta(days=1): (1.5, 2)})
+
+    def test_cycle_matches_hos_engine(self):
+        start = self.day_start + timedelta(hours=6)
+        trip = Trip.objects.create(
+            driver=self.driver, vehicle=self.vehicle, start_location=self.start_location, end_location=self.end_location,
+            start_dt=start, pickup_start_dt=start + timedelta(hours=1), pickup_end_dt=start + timedelta(hours=2),
+            drop_off_start_dt=start + timedelta(hours=4), drop_off_end_dt=start + timedelta(hours=5),
+            end_dt=start + timedelta(hours=5), status=TripStatus.ENDED, distance=100,
+        )
+        cycle_logic.record_trip(self.driver, trip)
+
+        status = hos_engine.evaluate_driver(self.driver, now=self.day_start + timedelta(hours=20))
+        self.assertEqual(cycle_logic.get_cycle_used(self.driver, today=self.log_date), 5)
+        self.assertAlmostEqual(float(status.cycle_hours[0]), 5)
+
+    def test_bucket_insert_race(self):
+        # another request inserted the bucket between the update and the insert of this one
+        DriverHos.objects.create(driver=self.driver, date=self.log_date, total_driving_hours=1, total_on_duty_hours=1)
+        real_filter = DriverHos.objects.filter
+        calls = []
+
+        def _filter(*args, **kwargs):
+            calls.append(kwargs)
+            return DriverHos.objects.none() if len(calls) == 1 else real_filter(*args, **kwargs)
+
+        with mock.patch.object(DriverHos.objects, "filter", side_effect=_filter):
+            cycle_logic._add_to_bucket(self.driver.id, self.log_date, 2, 3)
+
+        # the insert failed on the unique constraint and was retried as an update
+        self.assertEqual(len(calls), 2)
+        hos = DriverHos.objects.get(driver=self.driver, date=self.log_date)
+        self.assertEqual((hos.total_driving_hours, hos.total_on_duty_hours), (3, 4))
+
+    def test_cycle_rolls_once_per_day(self):
+        for offset in range(cycle_logic.CYCLE_DAYS):
+            DriverHos.objects.create(driver=self.driver, date=self.log_date - timedelta(days=offset),
+                                     total_driving_hours=5, total_on_duty_hours=8)
+        self.assertEqual(cycle_logic.get_cycle_used(self.driver, today=self.log_date), 64)
+
+        # the value is rolled once a day, a later booking goes through record_trip which refreshes it
+        DriverHos.objects.filter(driver=self.driver, date=self.log_date).update(total_on_duty_hours=10)
+        self.assertEqual(cycle_logic.get_cycle_used(self.driver, today=self.log_date), 64)
+
+        # the oldest day falls out of the window
+        next_day = self.log_date + timedelta(days=1)
+        self.assertEqual(cycle_logic.get_cycle_used(self.driver, today=next_day), 58)
+        self.driver.refresh_from_db()
+        self.assertEqual((self.driver.current_cycle_used, self.driver.cycle_computed_on), (58, next_day))
+
+
+class HosEngineTest(LogSheetFixtureMixin, TestCase):
+
+    def _add_driving(self, start, hours, driver=None):
+        return Trip.objects.create(
+            driver=driver or self.driver, vehicle=self.vehicle, start_location=self.start_location,
+            end_location=self.end_location, start_dt=start, end_dt=start + timedelta(hours=hours),
+            status=TripStatus.ENDED, distance=hours * 50,
+        )
+
+    def _evaluate(self, now_hour):
+        fleet_status = hos_engine.evaluate([self.driver.id], now=self.day_start + timedelta(hours=now_hour))
+        return fleet_status.to_rows()[0]
+
+    def test_shift_reset_after_10_hours_off(self):
+        self._add_driving(self.day_start, 4)
+        self._add_driving(self.day_start + timedelta(hours=15), 2)
+
+        # 11 hours off duty between the trips: the shift restarted at 15:00
+        row = self._evaluate(18)
+        self.assertEqual((row["driving_hours"], row["window_hours"], row["cycle_hours"]), (2, 3, 6))
+
+    def test_no_reset_under_10_hours_off(self):
+        self._add_driving(self.day_start, 4)
+        self._add_driving(self.day_start + timedelta(hours=12), 2)
+
+        row = self._evaluate(15)
+        self.assertEqual((row["driving_hours"], row["window_hours"]), (6, 15))
+        self.assertFalse(row["compliant_14_hour"])
+        self.assertEqual(row["remaining_hours"], 0)
+
+    def test_window_runs_during_rest_break(self):
+        trip = self._add_driving(self.day_start + timedelta(hours=6), 10)
+        RestBreak.objects.create(trip=trip, location=self.end_location, start_dt=self.day_start + timedelta(hours=9),
+                                 end_dt=self.day_start + timedelta(hours=11), duration=120)
+
+        # the break is not driving time but does not stop the 14-hour window
+        row = self._evaluate(16)
+        self.assertEqual((row["driving_hours"], row["window_hours"], row["cycle_hours"]), (8, 10, 8))
+        self.assertEqual(row["remaining_hours"], 3)
+
+    def test_cycle_clipped_at_window_start(self):
+        cycle_start = self.day_start - timedelta(days=hos_engine.CYCLE_DAYS - 1)
+        self._add_driving(cycle_start - timedelta(hours=2), 5)
+
+        # only the 3 hours after the start of the 8-day window count
+        row = self._evaluate(12)
+        self.assertEqual(row["cycle_hours"], 3)
+        self.assertEqual((row["driving_hours"], row["window_hours"]), (0, 0))
+
+    def test_available_only(self):
+        user = User.objects.create_user(username="other", password="pass")
+        other = Driver.objects.create(user=user, name="Other", license_number="LIC-2")
+        self._add_driving(self.day_start + timedelta(hours=1), 11)
+        self._add_driving(self.day_start + timedelta(hours=6), 2, driver=other)
+
+        fleet_status = hos_engine.evaluate([self.driver.id, other.id], now=self.day_start + timedelta(hours=12))
+        self.assertEqual(len(fleet_status.to_rows()), 2)
+        rows = fleet_status.to_rows(available_only=True)
+        self.assertEqual([row["driver"] for row in rows], [other.id])
+        # 9 hours of driving left but the window closes first
+        self.assertEqual(rows[0]["remaining_hours"], 8)
+
+    def test_fleet_availability_requires_staff(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(username="driver"))
+        self.assertEqual(client.get("/api/hos/get_fleet_availability").status_code, 403)
+
+        User.objects.filter(username="driver").update(is_staff=True)
+        client.force_authenticate(User.objects.get(username="driver"))
+        response = client.get("/api/hos/get_fleet_availability", {"driver_ids": str(self.driver.id)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["driver"] for row in response.data["drivers"]], [self.driver.id])
+
+
+class FormDataCacheTest(LogSheetFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        form_data_logic.form_data_cache.local.clear()
+        self.addCleanup(form_data_logic.form_data_cache.local.clear)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(username="driver"))
+
+    def _get(self, **headers):
+        return self.client.get("/api/trips/get_trip_form_data", headers=headers)
+
+    def test_not_modified_on_matching_etag(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Last-Modified", response)
+
+        not_modified = self._get(**{"If-None-Match": response["ETag"]})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], response["ETag"])
+        self.assertEqual(self._get(**{"If-None-Match": '"stale"'}).status_code, 200)
+
+    def test_new_etag_after_vehicle_change(self):
+        etag = self._get()["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Vehicle.objects.create(name="Truck 2", model="T1", year=2021, vin="VIN00000000000002", current_mileage=0)
+
+        response = self._get(**{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.data["vehicles"]), 2)
+
+    def test_new_etag_after_location_change(self):
+        etag = self._get()["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.end_location.name = "Renamed"
+            self.end_location.save()
+
+        response = self._get(**{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn("Renamed", [location["name"] for location in response.data["locations"]])
+
+    def test_new_etag_after_nested_trip_row_change(self):
+        Trip.objects.create(
+            driver=self.driver, vehicle=self.vehicle, start_location=self.start_location, end_location=self.end_location,
+            start_dt=self.day_start, distance=10,
+        )
+        for path in ("/api/fueling/get_fueling_form_data", "/api/rest_breaks/get_rest_break_form_data"):
+            etag = self.client.get(path)["ETag"]
+            self.vehicle.name = f"Renamed {path}"
+            self.vehicle.save()
+
+            response = self.client.get(path, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["trips"][0]["vehicle"]["name"], self.vehicle.name)
+
+            # the cycle is rolled with an update, updated_dt stays the same
+            etag = response["ETag"]
+            Driver.objects.filter(pk=self.driver.pk).update(current_cycle_used=F("current_cycle_used") + 1)
+            self.assertEqual(self.client.get(path, headers={"If-None-Match": etag}).status_code, 200)
+
+    def test_served_from_database_when_redis_is_down(self):
+        with mock.patch.object(two_tier_cache.redis_con, "get", side_effect=RedisError("down")):
+            response = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["vehicles"]), 1)
+
+
+class LogSheetBuilderTest(LogSheetFixtureMixin, TestCase):
+
+    def _build(self):
+        return log_sheet_logic.build_driver_log_sheet(self.driver, self.log_date, now=self.day_start + timedelta(days=2))
+
+    def test_query_count_does_not_grow_with_events(self):
+        self._add_trip(1)
+        with self.assertNumQueries(5):
+            self._build()
+
+        for hour in range(2, 22):
+            self._add_trip(hour)
+        with self.assertNumQueries(5):
+            log_sheet = self._build()
+
+        self.assertEqual(len(log_sheet["trip_events"]), 21 * 4)
+
+    def test_timeline_covers_the_day(self):
+        self._add_trip(1)
+        log_sheet = self._build()
+
+        self.assertEqual(log_sheet["logs"][0], {"startHour": 0.0, "endHour": 1.0, "status": DutyStatus.OFF_DUTY})
+        self.assertEqual(log_sheet["logs"][-1]["endHour"], 24.0)
+        self.assertAlmostEqual(sum(log_sheet["total_hours"].values()), 24.0, places=1)
+
+        # pickup 15 min, fueling 5 min and drop off 5 min are on duty, the rest break interrupts the driving
+        self.assertEqual(log_sheet["total_hours"][DutyStatus.SLEEPER_BERTH], 0.08)
+        self.assertEqual(log_sheet["total_hours"][DutyStatus.ON_DUTY], 0.42)
+        self.assertEqual(log_sheet["total_hours"][DutyStatus.DRIVING], 0.33)
+
+        timestamps = [event["timestamp"] for event in log_sheet["trip_events"]]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_closed_day_is_served_from_the_materialized_sheet(self):
+        self._add_trip(1)
+        now = self.day_start + timedelta(days=2)
+
+        log_sheet = log_sheet_logic.get_driver_log_sheet(self.driver, self.log_date, now=now)
+        with self.assertNumQueries(1):
+            self.assertEqual(log_sheet_logic.get_driver_log_sheet(self.driver, self.log_date, now=now), log_sheet)
+
+    def test_range_matches_the_single_day_sheets(self):
+        self._add_trip(1)
+        self._add_trip(23)
+        now = self.day_start + timedelta(days=5)
+        first_day, last_day = self.log_date - timedelta(days=1), self.log_date + timedelta(days=2)
+
+        log_sheets = list(log_sheet_logic.iter_driver_log_sheets(self.driver, first_day, last_day, now=now))
+
+        self.assertEqual([day for day, _ in log_sheets], list(log_sheet_logic.iter_days(first_day, last_day)))
+        for day, log_sheet in log_sheets:
+            self.assertEqual(log_sheet, log_sheet_logic.build_driver_log_sheet(self.driver, day, now=now))
+
+
+class QueryPlanTest(LogSheetFixtureMixin, TestCase):
+    """
+    The hot queries must be answered through an index, never by a full table scan
+    """
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor not in ("sqlite", "mysql"):
+            self.skipTest(f"No plan parser for {connection.vendor}")
+        self._add_trip(1)
+
+    def _full_scans(self, queryset):
+        if connection.vendor == "sqlite":
+            # "SCAN table" is a full scan, "SCAN table USING (COVERING) INDEX" walks an index
+            return re.findall(r"\bSCAN (\w+)(?! USING)", queryset.explain())
+
+        plan = json.loads(queryset.explain(format="json"))
+        return re.findall(r'"table_name": "(\w+)", "access_type": "ALL"', json.dumps(plan))
+
+    def assertUsesIndexes(self, queryset):
+        self.assertEqual(self._full_scans(queryset), [], queryset.explain())
+
+    def test_hot_queries_use_indexes(self):
+        day_start, day_end = log_sheet_logic.get_day_range(self.log_date)
+        overlap_q = Q(start_dt__lt=day_end) & (Q(end_dt__isnull=True) | Q(end_dt__gte=day_start))
+
+        self.assertUsesIndexes(Trip.objects.filter(driver=self.driver, status=TripStatus.ONGOING))
+        self.assertUsesIndexes(Trip.objects.filter(vehicle_id=self.vehicle.id, status=TripStatus.ONGOING))
+        self.assertUsesIndexes(Trip.objects.filter(overlap_q, driver=self.driver))
+        self.assertUsesIndexes(RestBreak.objects.filter(overlap_q, trip__driver=self.driver))
+        self.assertUsesIndexes(
+            Fueling.objects.filter(trip__driver=self.driver, created_dt__gte=day_start, created_dt__lt=day_end)
+        )
+        self.assertUsesIndexes(DriverHos.objects.filter(driver=self.driver, date__gte=self.log_date))
+        self.assertUsesIndexes(Location.objects.filter(type=LocationType.TRIP_START))
+        self.assertUsesIndexes(
+            Trip.objects.filter(driver=self.driver).order_by(*pagination.ORDERING).values_list('created_dt', 'id')[:10]
+        )
+
+    def test_one_ongoing_trip_per_driver_and_vehicle(self):
+        trip = Trip.objects.get()
+        Trip.objects.filter(pk=trip.pk).update(status=TripStatus.ONGOING)
+
+        other_vehicle = Vehicle.objects.create(name="Truck 2", model="T1", year=2020, vin="VIN00000000000002")
+        with self.assertRaises(IntegrityError):
+            Trip.objects.create(
+                driver=self.driver, vehicle=other_vehicle, start_location=self.start_location,
+                end_location=self.end_location, start_dt=self.day_start, distance=1,
+            )
+
+    def test_concurrent_trip_start_is_rejected(self):
+        client = APIClient()
+        client.force_authenticate(self.driver.user)
+        other_vehicle = Vehicle.objects.create(name="Truck 2", model="T1", year=2020, vin="VIN00000000000002")
+        data = {"vehicle": other_vehicle.id, "start_location": self.start_location.id,
+                "end_location": self.end_location.id, "distance": 1}
+
+        # a concurrent request inserted its trip after the checks of this one
+        with mock.patch.object(duty_event_logic, "record_trip_start",
+                               side_effect=IntegrityError("unique_ongoing_trip_per_driver")):
+            response = client.post("/api/trips/", data, format="json")
+
+        self.assertEqual((response.status_code, response.data),
+                         (400, {"error": "Driver or vehicle already has an ongoing trip."}))
+        self.assertFalse(Trip.objects.filter(vehicle=other_vehicle).exists())
+
+
+class TripStateDaoTest(LogSheetFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        trip_state_dao.purge(self.driver.id)
+        self.addCleanup(trip_state_dao.purge, self.driver.id)
+
+    def _add_ongoing_trip(self):
+        return Trip.objects.create(
+            driver=self.driver, vehicle=self.vehicle, start_location=self.start_location, end_location=self.end_location,
+            start_dt=self.day_start, distance=10,
+        )
+
+    def test_older_write_does_not_replace_newer(self):
+        if not _redis_is_up():
+            self.skipTest("No redis server")
+
+        trip = self._add_ongoing_trip()
+        stale = Trip.objects.get(pk=trip.pk)
+        trip.pickup_start_dt = self.day_start + timedelta(hours=1)
+        trip.save()
+        self.assertGreater(trip.updated_dt, stale.updated_dt)
+
+        # the write-through of the older save lands last
+        trip_state_dao.save_trip(trip)
+        trip_state_dao.save_trip(stale)
+
+        with self.assertNumQueries(0):
+            state = trip_state_dao.get_active_trip(self.driver.id)
+        self.assertEqual((state["trip_id"], state["pickup_start_dt"]), (trip.id, trip.pickup_start_dt))
+        self.assertEqual(state["version"], trip_state_dao.get_version(trip.updated_dt))
+
+    def test_no_ongoing_trip_is_cached(self):
+        if not _redis_is_up():
+            self.skipTest("No redis server")
+
+        self.assertIsNone(trip_state_dao.get_active_trip(self.driver.id))
+        with self.assertNumQueries(0):
+            self.assertIsNone(trip_state_dao.get_active_trip(self.driver.id))
+
+        # a trip started afterwards replaces the empty state
+        trip = self._add_ongoing_trip()
+        trip_state_dao.save_trip(trip)
+        self.assertEqual(trip_state_dao.get_driver_trip(self.driver.id, trip.id)["trip_id"], trip.id)
+
+    def test_database_fallback_when_redis_is_down(self):
+        trip = self._add_ongoing_trip()
+
+        with mock.patch.object(trip_state_dao.redis_con, "execute_command", side_effect=RedisError("down")):
+            state = trip_state_dao.get_active_trip(self.driver.id)
+            self.assertEqual((state["trip_id"], state["vehicle_id"]), (trip.id, self.vehicle.id))
+            self.assertIsNone(trip_state_dao.get_driver_trip(self.driver.id, trip.id + 1))
+            # a failed write-through is logged, not raised
+            trip_state_dao.save_trip(trip)
+
+    def test_failed_write_drops_the_old_state(self):
+        if not _redis_is_up():
+            self.skipTest("No redis server")
+
+        trip = self._add_ongoing_trip()
+        trip_state_dao.save_trip(trip)
+        Trip.objects.filter(pk=trip.pk).update(pickup_start_dt=trip.start_dt, updated_dt=timezone.now())
+        trip.refresh_from_db()
+
+        with mock.patch.object(trip_state_dao, "_write", side_effect=RedisError("lost")):
+            trip_state_dao.save_trip(trip)
+
+        # the next read goes to the database rather than keeping the old hash
+        state = trip_state_dao.get_active_trip(self.driver.id)
+        self.assertEqual(state["pickup_start_dt"], trip.start_dt)
+
+
+class ModelCacheTest(LogSheetFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._purge()
+        self.addCleanup(self._purge)
+
+    def _purge(self):
+        redis_dao.model_cache.local.clear()
+        redis_dao.invalidate(Location, self.end_location.pk)
+        redis_dao.invalidate(Driver, self.driver.pk)
+        redis_dao.invalidate(Vehicle, self.vehicle.pk)
+
+    def test_local_tier_and_invalidation(self):
+        self.assertEqual(redis_dao.get_location(self.end_location.pk).name, "End")
+        with self.assertNumQueries(0):
+            self.assertEqual(redis_dao.get_location(self.end_location.pk).name, "End")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.end_location.name = "Renamed"
+            self.end_location.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(redis_dao.get_location(self.end_location.pk).name, "Renamed")
+        self.assertIsNone(redis_dao.get_location(self.end_location.pk + 100))
+
+    def test_driver_and_vehicle_invalidation(self):
+        self.assertEqual(redis_dao.get_vehicle(self.vehicle.pk).name, "Truck")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vehicle.name = "Renamed"
+            self.vehicle.save()
+        self.assertEqual(redis_dao.get_vehicle(self.vehicle.pk).name, "Renamed")
+
+        self.assertEqual(redis_dao.get_driver(self.driver.pk).current_cycle_used, 0)
+        DriverHos.objects.create(driver=self.driver, date=self.log_date, total_driving_hours=2, total_on_duty_hours=3)
+        # the cycle is rolled with an update, which sends no signal
+        with self.captureOnCommitCallbacks(execute=True):
+            cycle_logic.refresh_cycle_used(self.driver, today=self.log_date)
+        self.assertEqual(redis_dao.get_driver(self.driver.pk).current_cycle_used, 3)
+
+    def test_redis_read_through(self):
+        if not _redis_is_up():
+            self.skipTest("No redis server")
+
+        redis_dao.get_location(self.end_location.pk)
+        # another process: empty local tier, the instance comes from redis
+        redis_dao.model_cache.local.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(redis_dao.get_location(self.end_location.pk).name, "End")
+
+        # the invalidation removes the redis entry too
+        redis_dao.invalidate(Location, self.end_location.pk)
+        Location.objects.filter(pk=self.end_location.pk).update(name="Renamed")
+        redis_dao.model_cache.local.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(redis_dao.get_location(self.end_location.pk).name, "Renamed")
+
+    def test_trip_trace_reads_the_cached_trip(self):
+        self._add_trip(8)
+        trip = Trip.objects.get()
+        self.addCleanup(redis_dao.invalidate, Trip, trip.pk)
+        client = APIClient()
+        client.force_authenticate(User.objects.get(username="driver"))
+
+        self.assertEqual(client.get("/api/trips/get_trip_trace", {"id": trip.pk}).data["trip_id"], trip.pk)
+        self.assertEqual(redis_dao.get_trip(trip.pk).end_location_id, self.end_location.pk)
+        self.assertEqual(client.get("/api/trips/get_trip_trace", {"id": trip.pk + 100}).status_code, 404)
+
+
+class TwoTierCacheTest(TestCase):
+    key = "test:two_tier_cache"
+
+    def setUp(self):
+        self.cache = two_tier_cache.TwoTierCache(60, local_timeout_sec=60, max_size=8, beta=0)
+        self.addCleanup(two_tier_cache._caches.remove, self.cache)
+        self.addCleanup(self.cache.invalidate, self.key)
+
+    def test_single_loader_on_concurrent_misses(self):
+        if not _redis_is_up():
+            self.skipTest("No redis server")
+
+        calls = []
+        results = []
+        barrier = threading.Barrier(4)
+
+        def _load():
+            calls.append(1)
+            # a slow query, long enough for every reader to miss
+            threading.Event().wait(0.3)
+            return "value"
+
+        def _read():
+            barrier.wait()
+            results.append(self.cache.get(self.key, _load))
+
+        threads = [threading.Thread(target=_read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # the readers that lost the lock waited for the entry of the winner
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["value"] * 4)
+
+    def test_invalidation_message_evicts_local_entry(self):
+        self.cache.local.set(self.key, "value")
+        other_key = self.key + ":other"
+        self.cache.local.set(other_key, "other")
+
+        # the message published by invalidate() in another process
+        two_tier_cache._on_invalidation({"data": self.key.encode("utf-8")})
+
+        self.assertEqual(self.cache.local.get(self.key), (False, None))
+        self.assertEqual(self.cache.local.get(other_key), (True, "other"))
+        self.assertEqual(self.cache.get(self.key, lambda: "reloaded"), "reloaded")
+
+
+class TripListTest(LogSheetFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        for hour in range(3):
+            self._add_trip(hour)
+        Trip.objects.create(
+            driver=self.driver, vehicle=self.vehicle, start_location=self.end_location, end_location=self.start_location,
+            start_dt=self.day_start + timedelta(hours=5), pickup_start_dt=self.day_start + timedelta(hours=6), distance=3,
+        )
+
+    def test_rows_match_the_serializer(self):
+        trips = Trip.objects.filter(driver=self.driver).order_by('id')
+        with self.assertNumQueries(4):
+            rows = trip_list_logic.get_trip_rows(trips)
+
+        self.assertEqual(rows, json.loads(json.dumps(TripListSerializer(trips, many=True).data)))
+
+    def test_fields_and_expand(self):
+        trips = Trip.objects.filter(driver=self.driver).order_by('id')
+        with self.assertNumQueries(1):
+            rows = trip_list_logic.get_trip_rows(trips, fields=["id", "driver", "show_end_pickup"], expand=[])
+
+        self.assertEqual(rows[-1], {"id": rows[-1]["id"], "driver": self.driver.id, "show_end_pickup": True})
+
+
+class PaginationTest(LogSheetFixtureMixin, TestCase):
+
+    def test_pages_cover_the_list_once(self):
+        for hour in range(7):
+            self._add_trip(hour)
+        # same created_dt for several trips, the id breaks the tie
+        Trip.objects.filter(id__in=Trip.objects.order_by('id').values('id')[:4]).update(created_dt=self.day_start)
+
+        seen, cursor = [], None
+        while True:
+            params = {"page_size": 3, **({"cursor": cursor} if cursor else {})}
+            page, cursor = pagination.paginate(RequestFactory().get("/", params), Trip.objects.all())
+            seen.extend(page.values_list('id', flat=True))
+            if not cursor:
+                break
+
+        self.assertEqual(seen, list(Trip.objects.order_by(*pagination.ORDERING).values_list('id', flat=True)))
+        self.assertEqual(len(seen), 7)
+
+
+class TripStateMixin(LogSheetFixtureMixin):
+    """
+    Starts from an empty trip state and runs the on_commit write-through of each transition, as the views do
+    """
+
+    def setUp(self):
+        super().setUp()
+        self._purge_trip_state(self.driver)
+
+    def _purge_trip_state(self, driver):
+        trip_state_dao.purge(driver.id)
+        self.addCleanup(trip_state_dao.purge, driver.id)
+
+    def _tap(self, transition, trip_id, now=None, driver=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return transition(driver or self.driver, trip_id, now=now)
+
+
+class TripTransitionTest(TripStateMixin, TestCase):
+
+    def test_phases_run_in_order_once(self):
+        trip = Trip.objects.create(
+            driver=self.driver, vehicle=self.vehicle, start_location=self.start_location, end_location=self.end_location,
+            start_dt=self.day_start, distance=10,
+        )
+        start = self.day_start + timedelta(hours=1)
+
+        self.assertEqual(self._tap(trip_logic.start_drop_off, trip.id, start)[0], TransitionOutcome.OUT_OF_ORDER)
+        self.assertEqual(self._tap(trip_logic.start_pickup, trip.id, start)[0], TransitionOutcome.DONE)
+        self.assertEqual(self._tap(trip_logic.start_pickup, trip.id, start)[0], TransitionOutcome.ALREADY_DONE)
+
+        other_user = User.objects.create_user(username="other", password="pass")
+        other_driver = Driver.objects.create(user=other_user, name="Other", license_number="LIC-2")
+        self._purge_trip_state(other_driver)
+        outcome = self._tap(trip_logic.end_pickup, trip.id, start, driver=other_driver)[0]
+        self.assertEqual(outcome, TransitionOutcome.NOT_FOUND)
+
+        outcome, updated = self._tap(trip_logic.end_pickup, trip.id, start + timedelta(minutes=90))
+        self.assertEqual((outcome, updated.pickup_duration), (TransitionOutcome.DONE, 90))
+        self._tap(trip_logic.start_drop_off, trip.id, start + timedelta(hours=3))
+        outcome, updated = self._tap(trip_logic.end_drop_off, trip.id, start + timedelta(hours=5))
+
+        trip.refresh_from_db()
+        self.assertEqual((outcome, updated.drop_off_duration, updated.pickup_duration), (TransitionOutcome.DONE, 120, 90))
+        self.assertEqual((trip.status, trip.end_dt, trip.drop_off_duration), (TripStatus.ENDED, updated.end_dt, 120))
+        self.assertEqual(trip.violations, "Pickup duration exceeded: 90.0 minutes, Drop off duration exceeded: 120.0 minutes")
+        self.assertEqual(self._tap(trip_logic.end_drop_off, trip.id)[0], TransitionOutcome.ALREADY_DONE)
+
+    def test_trip_end_and_hours_commit_together(self):
+        trip = Trip.objects.create(
+            driver=self.driver, vehicle=self.vehicle, start_location=self.start_location, end_location=self.end_location,
+            start_dt=self.day_start, distance=10,
+        )
+        for minutes, transition in [(60, trip_logic.start_pickup), (120, trip_logic.end_pickup),
+                                    (240, trip_logic.start_drop_off)]:
+            self._tap(transition, trip.id, self.day_start + timedelta(minutes=minutes))
+        end = self.day_start + timedelta(minutes=300)
+
+        with mock.patch.object(cycle_logic, "_add_to_bucket", side_effect=IntegrityError("lost")):
+            with self.assertRaises(IntegrityError):
+                self._tap(trip_logic.end_drop_off, trip.id, end)
+
+        # the trip did not end without its hours, the retry goes through
+        trip.refresh_from_db()
+        self.assertEqual((trip.status, trip.drop_off_end_dt), (TripStatus.ONGOING, None))
+        self.assertFalse(DriverHos.objects.filter(driver=self.driver).exists())
+
+        self.assertEqual(self._tap(trip_logic.end_drop_off, trip.id, end)[0], TransitionOutcome.DONE)
+        hos = DriverHos.objects.get(driver=self.driver, date=self.log_date)
+        self.assertEqual((hos.total_driving_hours, hos.total_on_duty_hours), (3, 5))
+
+    def test_stale_cached_state(self):
+        trip = Trip.objects.create(
+            driver=self.driver, vehicle=self.vehicle, start_location=self.start_location, end_location=self.end_location,
+            start_dt=self.day_start, distance=10,
+        )
+        # the write-through of the pickup start did not reach the cache
+        stale = {**trip_logic._load_state(self.driver.id, trip.id), "version": 0}
+        start = self.day_start + timedelta(hours=1)
+        self.assertEqual(self._tap(trip_logic.start_pickup, trip.id, start)[0], TransitionOutcome.DONE)
+
+        with mock.patch.object(trip_state_dao, "get_driver_trip", return_value=stale):
+            outcome, updated = self._tap(trip_logic.end_pickup, trip.id, start + timedelta(minutes=90))
+            self.assertEqual((outcome, updated.pickup_duration), (TransitionOutcome.DONE, 90))
+            self.assertEqual(self._tap(trip_logic.start_pickup, trip.id, start)[0], TransitionOutcome.ALREADY_DONE)
+
+
+class IdempotencyTest(LogSheetFixtureMixin, TestCase):
+    path = "/api/idempotent"
+
+    def setUp(self):
+        super().setUp()
+        if not _redis_is_up():
+            self.skipTest("No redis server")
+
+        self.user = User.objects.get(username="driver")
+        self.calls = []
+        self.marker_ttls = []
+
+        @api_view(["POST"])
+        @api_decorators.idempotent
+        def view(request):
+            self.calls.append(request.data)
+            self.marker_ttls.append(api_decorators.redis_con.ttl(
+                redis_keys.get_idempotency_key(self.user.id, self.path, request.headers["Idempotency-Key"])
+            ))
+            return Response({"call": len(self.calls)}, status=request.data.get("status", 201))
+
+        self.view = view
+        for idempotency_key in ("key-1", "key-2"):
+            self.addCleanup(api_decorators.redis_con.delete,
+                            redis_keys.get_idempotency_key(self.user.id, self.path, idempotency_key))
+
+    def _post(self, data, idempotency_key="key-1"):
+        request = APIRequestFactory().post(self.path, data, format="json", headers={"Idempotency-Key": idempotency_key})
+        force_authenticate(request, user=self.user)
+        return self.view(request)
+
+    def test_retry_is_replayed(self):
+        first = self._post({"trip": 1})
+        retry = self._post({"trip": 1})
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual((retry.status_code, retry.data), (201, first.data))
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        # the in flight marker outlives any request
+        self.assertGreater(self.marker_ttls[0], 60)
+        self.assertEqual(self._post({"trip": 1}, idempotency_key="key-2").data, {"call": 2})
+
+    def test_key_reused_for_another_request(self):
+        self._post({"trip": 1})
+        response = self._post({"trip": 2})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_retry_during_the_request(self):
+        key = redis_keys.get_idempotency_key(self.user.id, self.path, "key-1")
+        fingerprint = api_decorators._get_fingerprint(mock.Mock(method="POST", data={"trip": 1}))
+        api_decorators.redis_con.set(key, pickle.dumps({"fingerprint": fingerprint, "status_code": None}))
+
+        with mock.patch.object(api_decorators, "IDEMPOTENCY_WAIT_TIMEOUT", 0.2):
+            response = self._post({"trip": 1})
+
+        # the wait is capped, the view did not run a second time
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response["Retry-After"], str(api_decorators.IDEMPOTENCY_RETRY_AFTER))
+        self.assertEqual(self.calls, [])
+
+    def test_redis_errors(self):
+        key = redis_keys.get_idempotency_key(self.user.id, self.path, "key-1")
+        fingerprint = api_decorators._get_fingerprint(mock.Mock(method="POST", data={"trip": 1}))
+        api_decorators.redis_con.set(key, pickle.dumps({"fingerprint": fingerprint, "status_code": None}))
+
+        # the key is held, the request it belongs to may still be running
+        with mock.patch.object(api_decorators, "_wait_for_response", side_effect=RedisError("lost")):
+            response = self._post({"trip": 1})
+        self.assertEqual((response.status_code, self.calls), (409, []))
+
+        # the key could not be set at all: the request runs without the protection
+        with mock.patch.object(api_decorators.redis_con, "set", side_effect=RedisError("down")):
+            response = self._post({"trip": 2}, idempotency_key="key-2")
+        self.assertEqual((response.status_code, self.calls), (201, [{"trip": 2}]))
+
+    def test_server_errors_are_not_stored(self):
+        self.assertEqual(self._post({"trip": 1, "status": 503}).status_code, 503)
+        response = self._post({"trip": 1, "status": 503})
+
+        self.assertEqual(len(self.calls), 2)
+        self.assertFalse(response.has_header("Idempotent-Replayed"))
+
+
+class DutyEventTest(TripStateMixin, TestCase):
+
+    def test_trip_is_replayed_from_the_log(self):
+        trip = Trip.objects.create(
+            driver=self.driver, vehicle=self.vehicle, start_location=self.start_location, end_location=self.end_location,
+            start_dt=self.day_start, distance=10,
+        )
+        duty_event_logic.record_trip_start(trip)
+        rest_break = RestBreak.objects.create(trip=trip, location=self.end_location, start_dt=self.day_start + timedelta(hours=1))
+        duty_event_logic.record_rest_break_start(self.driver.id, rest_break)
+        for minutes, transition in [(120, trip_logic.start_pickup), (200, trip_logic.end_pickup),
+                                    (300, trip_logic.start_drop_off), (330, trip_logic.end_drop_off)]:
+            self._tap(transition, trip.id, self.day_start + timedelta(minutes=minutes))
+
+        events = duty_event_logic.get_trip_events(trip.id)
+        self.assertEqual([event.type for event in events], [
+            DutyEventType.TRIP_START, DutyEventType.REST_BREAK_START, DutyEventType.PICKUP_START,
+            DutyEventType.PICKUP_END, DutyEventType.DROP_OFF_START, DutyEventType.DROP_OFF_END, DutyEventType.TRIP_END,
+        ])
+        self.assertEqual(
+            [(action["type"], action["location_id"]) for action in duty_event_logic.get_trace(trip, events)],
+            [("Trip Start", self.start_location.id), ("Rest Break", self.end_location.id), ("Trip End", self.end_location.id)]
+        )
+
+        trip.refresh_from_db()
+        self.assertEqual(duty_event_logic.replay_trip(trip, events), {})
+
+        Trip.objects.filter(pk=trip.pk).update(pickup_end_dt=None, pickup_duration=5, violations="", status=TripStatus.ONGOING)
+        trip.refresh_from_db()
+        changes = duty_event_logic.replay_trip(trip, events)
+
+        trip.refresh_from_db()
+        self.assertEqual(set(changes), {"pickup_end_dt", "pickup_duration", "violations", "status"})
+        self.assertEqual((trip.status, trip.pickup_duration, trip.violations),
+                         (TripStatus.ENDED, 80, "Pickup duration exceeded: 80.0 minutes"))
+
+        with self.assertRaises(TypeError):
+            events[0].save()
+
+
+class SyncTest(LogSheetFixtureMixin, TestCase):
+
+    def test_batch_is_applied_once(self):
+        trip = Trip.objects.create(
+            driver=self.driver, vehicle=self.vehicle, start_location=self.start_location, end_location=self.end_location,
+            start_dt=self.day_start, distance=10,
+        )
+
+        def _event(key, event_type, minutes, **fields):
+            return {"key": key, "type": event_type, "ts": (self.day_start + timedelta(minutes=minutes)).isoformat(),
+                    "trip": trip.id, **fields}
+
+        events = [
+            _event("e1", SyncEventType.START_PICKUP, 10),
+            _event("e2", SyncEventType.START_PICKUP, 11),
+            _event("e3", SyncEventType.END_PICKUP, 100),
+            _event("e4", SyncEventType.START_REST_BREAK, 110, location=self.end_location.id),
+            _event("e5", SyncEventType.END_REST_BREAK, 140, rest_break_key="e4"),
+            _event("e6", SyncEventType.FUELING, 150, location=self.start_location.id, amount=10, cost=30,
+                   mileage_at_fueling=1200),
+            _event("e7", SyncEventType.START_DROP_OFF, 200),
+            _event("e8", SyncEventType.END_DROP_OFF, 230),
+        ]
+        client = APIClient()
+        client.force_authenticate(self.driver.user)
+
+        response = client.post("/api/sync/events", {"events": events}, format="json")
+        statuses = [result["status"] for result in response.data["results"]]
+        self.assertEqual(statuses, [SyncEventStatus.APPLIED, SyncEventStatus.REJECTED] + [SyncEventStatus.APPLIED] * 6)
+
+        trip.refresh_from_db()
+        rest_break = RestBreak.objects.get(trip=trip)
+        fueling = Fueling.objects.get(trip=trip)
+        self.assertEqual((trip.status, trip.pickup_duration, trip.end_dt),
+                         (TripStatus.ENDED, 90, self.day_start + timedelta(minutes=230)))
+        self.assertEqual((rest_break.duration, fueling.created_dt), (30, self.day_start + timedelta(minutes=150)))
+        self.assertEqual(DutyEvent.objects.filter(trip=trip).count(), 8)
+        hos = DriverHos.objects.get(driver=self.driver)
+        # pickup (10 -> 100) and drop off (200 -> 230) are the on duty part of the trip span
+        self.assertAlmostEqual(hos.total_driving_hours, 110 / 60)
+        self.assertAlmostEqual(hos.total_on_duty_hours, 230 / 60)
+
+        response = client.post("/api/sync/events", {"events": events}, format="json")
+        statuses = [result["status"] for result in response.data["results"]]
+        self.assertEqual(statuses, [SyncEventStatus.DUPLICATE, SyncEventStatus.REJECTED] + [SyncEventStatus.DUPLICATE] * 6)
+        self.assertEqual(DutyEvent.objects.filter(trip=trip).count(), 8)
+
+
+class BreadcrumbTest(LogSheetFixtureMixin, TestCase):
+    def test_parse_samples(self):
+        samples = telemetry_logic.parse_samples([
+            {"ts": "2025-01-01T10:00:05+00:00", "lat": 40.1, "lon": -74.2, "speed": 55},
+            {"ts": 1735725600, "lat": "40", "lon": -74, "speed": 0, "odometer": 1200.5},
+        ])
+        self.assertEqual(samples, [[1735725600.0, 40.0, -74.0, 0.0, 1200.5],
+                                   [1735725605.0, 40.1, -74.2, 55.0, None]])
+
+        for raw in ([], [{"ts": "2025-01-01T10:00:00", "lat": 0, "lon": 0, "speed": 0}],
+                    [{"ts": 0, "lat": 91, "lon": 0, "speed": 0}], [{"ts": 0, "lat": 0, "lon": 0}]):
+            with self.assertRaises(ValueError):
+                telemetry_logic.parse_samples(raw)
+
+    def test_duty_status_detection(self):
+        minute = 60
+        samples = [[t * minute, 0, 0, speed, None] for t, speed in [
+            (0, 0), (1, 30), (2, 4), (3, 50), (4, 2), (6, 1), (9, 0), (10, 20), (50, 0),
+        ]]
+        state = duty_status_logic.get_initial_state()
+
+        transitions = [(ts / minute, status) for ts, status, _ in duty_status_logic.detect(state, samples)]
+
+        # a stop shorter than 5 minutes stays Driving, 5 stopped minutes are On Duty from the stop, a 40 minute gap
+        # is Off Duty from the last sample
+        self.assertEqual(transitions, [(1, DutyStatus.DRIVING), (4, DutyStatus.ON_DUTY), (10, DutyStatus.DRIVING),
+                                       (10, DutyStatus.OFF_DUTY)])
+        self.assertEqual(duty_status_logic.detect(state, samples), [])
+
+    def test_detected_statuses_replace_the_tapped_phases(self):
+        trip = Trip.objects.create(
+            driver=self.driver, vehicle=self.vehicle, start_location=self.start_location,
+            end_location=self.end_location, start_dt=self.day_start + timedelta(hours=1),
+            end_dt=self.day_start + timedelta(hours=5), status=TripStatus.ENDED, distance=10,
+        )
+        for hour, status in [(2, DutyStatus.DRIVING), (3, DutyStatus.ON_DUTY), (4, DutyStatus.OFF_DUTY)]:
+            DutyEvent.objects.create(driver=self.driver, trip=trip, type=DutyEventType.DUTY_STATUS,
+                                     ts=self.day_start + timedelta(hours=hour), data={"status": status})
+
+        total_hours = log_sheet_logic.build_driver_log_sheet(
+            self.driver, self.log_date, now=self.day_start + timedelta(days=2)
+        )["total_hours"]
+
+        # driving from the tapped start until the first detected status
+        self.assertEqual(total_hours[DutyStatus.DRIVING], 2)
+        self.assertEqual(total_hours[DutyStatus.ON_DUTY], 1)
+        self.assertEqual(total_hours[DutyStatus.OFF_DUTY], 21)
+
+    def _start_telemetry_trip(self):
+        if not _redis_is_up():
+            self.skipTest("No redis server")
+
+        key = redis_keys.get_vehicle_duty_status_key(self.vehicle.id)
+        duty_status_dao.redis_con.delete(key)
+        self.addCleanup(duty_status_dao.redis_con.delete, key)
+        Trip.objects.create(
+            driver=self.driver, vehicle=self.vehicle, start_location=self.start_location,
+            end_location=self.end_location, start_dt=self.day_start, distance=10,
+        )
+
+    def _batch(self, *samples):
+        start = self.day_start.timestamp()
+        return [("0-1", self.vehicle.id, self.driver.id, [[start + t, 0, 0, speed, None] for t, speed in samples])]
+
+    def _recorded(self):
+        return [
+            ((event.ts - self.day_start).total_seconds(), event.data["status"])
+            for event in DutyEvent.objects.filter(type=DutyEventType.DUTY_STATUS).order_by("ts")
+        ]
+
+    def test_concurrent_batches_of_a_vehicle(self):
+        self._start_telemetry_trip()
+        first = self._batch((0, 30), (60, 30))
+        second = self._batch((30, 40), (700, 0), (1100, 0))
+        save_states = duty_status_dao.save_states
+        interleaved = []
+
+        def _save_after_first(states):
+            # the first batch saves its state while the second one runs on the state both read
+            if not interleaved:
+                interleaved.append(first)
+                duty_status_logic.process(first)
+            return save_states(states)
+
+        with mock.patch.object(duty_status_dao, "save_states", side_effect=_save_after_first):
+            duty_status_logic.process(second)
+
+        # the Driving at 30s detected by the second batch on the stale state is not recorded
+        self.assertEqual(self._recorded(), [(0, DutyStatus.DRIVING), (700, DutyStatus.ON_DUTY)])
+
+    def test_transitions_saved_but_not_recorded(self):
+        self._start_telemetry_trip()
+        batch = self._batch((0, 30))
+
+        with mock.patch.object(DutyEvent.objects, "bulk_create", side_effect=IntegrityError("stopped")):
+            with self.assertRaises(IntegrityError):
+                duty_status_logic.process(batch)
+        self.assertEqual(self._recorded(), [])
+
+        # drained again, its samples are skipped but the transitions of the saved state are recorded
+        duty_status_logic.process(batch)
+        self.assertEqual(self._recorded(), [(0, DutyStatus.DRIVING)])
+
+
+class AuthenticationTest(LogSheetFixtureMixin, TestCase):
+    def _authenticate(self, access):
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {access}")
+        return DriverTokenAuthentication().authenticate(request)[0]
+
+    def test_driver_identity_comes_from_the_token(self):
+        response = APIClient().post("/api/token/", {"username": "driver", "password": "pass"}, format="json")
+
+        with self.assertNumQueries(0):
+            user = self._authenticate(response.data["access"])
+            driver = user.driver_profile
+        self.assertEqual((user.id, driver.id, driver.license_number), (self.driver.user_id, self.driver.id, "LIC-1"))
+
+        # the fields that are not claims are read when needed
+        with self.assertNumQueries(1):
+            self.assertEqual(driver.current_cycle_used, 0)
+
+        response = APIClient().post("/api/token/refresh/", {"refresh": response.data["refresh"]}, format="json")
+        self.assertEqual(self._authenticate(response.data["access"]).driver_profile.id, self.driver.id)
+
+    def test_user_without_driver_profile(self):
+        User.objects.create_user(username="dispatch", password="pass", is_staff=True)
+        access = APIClient().post("/api/token/", {"username": "dispatch", "password": "pass"}, format="json").data["access"]
+
+        with self.assertNumQueries(0):
+            user = self._authenticate(access)
+            self.assertFalse(hasattr(user, "driver_profile"))
+        self.assertTrue(user.is_staff)
+
+    def test_driver_tokens_revoked_on_claim_changes(self):
+        with mock.patch.object(token_dao, "revoke_user_tokens") as revoke_user_tokens:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.driver.current_cycle_used = 12
+                self.driver.save()
+                with self.assertNumQueries(1):
+                    self.driver.save(update_fields=["cycle_computed_on"])
+            revoke_user_tokens.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.driver.license_number = "LIC-9"
+                self.driver.save(update_fields=["license_number"])
+            revoke_user_tokens.assert_called_once_with(self.driver.user_id)
+
+            other = User.objects.create_user(username="other", password="pass")
+            revoke_user_tokens.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.driver.user = other
+                self.driver.save()
+            self.assertEqual({call.args[0] for call in revoke_user_tokens.call_args_list},
+                             {self.driver.user_id, User.objects.get(username="driver").id})
+
+            revoke_user_tokens.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                created = Driver.objects.create(user=User.objects.get(username="driver"), name="New",
+                                                license_number="LIC-3")
+                created.delete()
+            self.assertEqual([call.args[0] for call in revoke_user_tokens.call_args_list], [created.user_id] * 2)
+
+
+class TokenRefreshTest(LogSheetFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.refresh = self.client.post(
+            "/api/token/", {"username": "driver", "password": "pass"}, format="json"
+        ).data["refresh"]
+
+    def _refresh(self, refresh):
+        return self.client.post("/api/token/refresh/", {"refresh": refresh}, format="json")
+
+    def _skip_without_redis(self):
+        if not _redis_is_up():
+            self.skipTest("No redis server")
+        token_dao.redis_con.delete(redis_keys.get_token_log_key())
+        self.addCleanup(token_dao.redis_con.delete, redis_keys.get_token_log_key(),
+                        redis_keys.get_user_tokens_revoked_key(self.driver.user_id))
+
+    def test_rotation(self):
+        self._skip_without_redis()
+
+        with self.assertNumQueries(0):
+            response = self._refresh(self.refresh)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data["refresh"], self.refresh)
+
+        # the durable record is queued for persist_token_blacklist
+        entry, = token_dao.get_token_log(10)
+        self.assertEqual(entry["blacklisted"], RefreshToken(self.refresh, verify=False)["jti"])
+        self.assertEqual(entry["outstanding"]["token"], response.data["refresh"])
+        self.assertEqual(self._refresh(response.data["refresh"]).status_code, 200)
+
+    def test_rotated_token_reused(self):
+        self._skip_without_redis()
+
+        self.assertEqual(self._refresh(self.refresh).status_code, 200)
+        response = self._refresh(self.refresh)
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data["detail"], "Token is blacklisted")
+
+    def test_revoked_tokens(self):
+        self._skip_without_redis()
+
+        token_dao.revoke_user_tokens(self.driver.user_id)
+        response = self._refresh(self.refresh)
+
+        self.assertEqual((response.status_code, response.data["code"]), (401, "token_revoked"))
+        self.assertEqual(token_dao.get_token_log(10), [])
+
+    def test_database_fallback_when_redis_is_down(self):
+        with mock.patch.object(token_dao, "rotate_refresh_token", side_effect=RedisError("down")):
+            response = self._refresh(self.refresh)
+            self.assertEqual(response.status_code, 200)
+
+            # blacklisted in the tables instead
+            jti = RefreshToken(self.refresh, verify=False)["jti"]
+            self.assertTrue(BlacklistedToken.objects.filter(token__jti=jti).exists())
+            self.assertEqual(self._refresh(self.refresh).status_code, 401)
+            self.assertEqual(self._refresh(response.data["refresh"]).status_code, 200)
+
+    def test_persist_token_blacklist(self):
+        login = RefreshToken(self.refresh, verify=False)
+        rotated = RefreshToken.for_user(User.objects.get(username="driver"))
+        deleted_user_token = {
+            "jti": "deleted", "user_id": 999, "iat": rotated["iat"], "exp": rotated["exp"], "token": "deleted-token",
+        }
+        entries = [
+            {"blacklisted": login["jti"], "outstanding": {
+                "jti": "second", "user_id": self.driver.user_id, "iat": rotated["iat"], "exp": rotated["exp"],
+                "token": "second-token",
+            }},
+            {"blacklisted": "second", "outstanding": {
+                "jti": "third", "user_id": self.driver.user_id, "iat": rotated["iat"], "exp": rotated["exp"],
+                "token": "third-token",
+            }},
+            {"blacklisted": "unknown", "outstanding": deleted_user_token},
+        ]
+
+        command = persist_token_blacklist.Command()
+        command._persist(entries)
+        # a batch written again after a crash before the trim
+        command._persist(entries)
+
+        self.assertEqual(set(OutstandingToken.objects.filter(jti__in=["second", "third", "deleted"])
+                             .values_list("jti", flat=True)), {"second", "third"})
+        self.assertEqual(set(BlacklistedToken.objects.values_list("token__jti", flat=True)), {login["jti"], "second"})
+
+
+class TripEventsTest(LogSheetFixtureMixin, TestCase):
+    def _get_channels(self, username, query):
+        access = APIClient().post("/api/token/", {"username": username, "password": "pass"}, format="json").data["access"]
+        return events._get_channels(RequestFactory().get("/", {"access_token": access, **query}))
+
+    def test_stream_channels(self):
+        User.objects.create_user(username="dispatch", password="pass", is_staff=True)
+
+        self.assertEqual(self._get_channels("driver", {})[0], [f"events:driver:{self.driver.id}"])
+        self.assertEqual(self._get_channels("driver", {"fleet": "1"})[1].status_code, 403)
+        self.assertEqual(self._get_channels("dispatch", {"fleet": "1"})[0], ["events:fleet"])
+        self.assertEqual(
+            self._get_channels("dispatch", {"driver_ids": "1", "vehicle_ids": "2,3"})[0],
+            ["events:driver:1", "events:vehicle:2", "events:vehicle:3"]
+        )
+        self.assertEqual(self._get_channels("dispatch", {"vehicle_ids": "2,x"})[1].status_code, 400)
+        self.assertEqual(self._get_channels("dispatch", {})[1].status_code, 403)
+
+        response = events._get_channels(RequestFactory().get("/", {"access_token": "invalid"}))[1]
+        self.assertEqual(response.status_code, 401)
+
+    async def test_stream_only_served_over_asgi(self):
+        # a WSGI worker would be held by the stream
+        response = await sync_to_async(self.client.get)("/api/events/trips")
+        self.assertEqual(response.status_code, 503)
+
+        response = await self.async_client.get("/api/events/trips", {"access_token": "invalid"})
+        self.assertEqual(response.status_code, 401)
+
+
+class AsyncReadTest(LogSheetFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self._add_trip(1)
+        self._add_trip(3)
+        self.trip = Trip.objects.filter(driver=self.driver).first()
+        DutyEvent.objects.create(driver=self.driver, trip=self.trip, type=DutyEventType.TRIP_START, ts=self.trip.start_dt)
+        access = APIClient().post("/api/token/", {"username": "driver", "password": "pass"}, format="json").data["access"]
+        self.headers = {"Authorization": f"Bearer {access}"}
+
+    async def test_bodies_match_the_sync_endpoints(self):
+        for path in [
+            "get_trips?page_size=1", f"get_trip_trace?id={self.trip.id}", f"get_driver_log_sheet?date={self.log_date}",
+            "get_trip_form_data", "get_driver_log_sheet?date=03-20",
+        ]:
+            sync_response = await sync_to_async(self.client.get)(f"/api/trips/{path}", headers=self.headers)
+            async_response = await self.async_client.get(f"/api/async/trips/{path}", headers=self.headers)
+
+            self.assertEqual(async_response.status_code, sync_response.status_code, path)
+            self.assertEqual(async_response.json(), sync_response.json(), path)
+            self.assertEqual(async_response.headers.get("X-Next-Cursor"), sync_response.headers.get("X-Next-Cursor"))
+
+        response = await self.async_client.get("/api/async/trips/get_trips")
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(METRICS_TOKEN="secret")
+class MetricsTest(LogSheetFixtureMixin, TestCase):
+    def _get_value(self, metric, view):
+        response = self.client.get("/metrics", headers={"Authorization": "Bearer secret"})
+        self.assertEqual(response.status_code, 200)
+        match = re.search(rf'^{metric}{{view="{re.escape(view)}"}} (\S+)$', response.content.decode(), re.MULTILINE)
+        return float(match.group(1)) if match else 0
+
+    def test_records_the_view(self):
+        self._add_trip(1)
+        access = APIClient().post("/api/token/", {"username": "driver", "password": "pass"}, format="json").data["access"]
+        view = "spotter_eld_api.views.trip.get_trips"
+        count = self._get_value("spotter_http_request_db_queries_count", view)
+        queries = self._get_value("spotter_http_request_db_queries_sum", view)
+
+        response = self.client.get("/api/trips/get_trips", headers={"Authorization": f"Bearer {access}"})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self._get_value("spotter_http_request_db_queries_count", view), count + 1)
+        self.assertGreater(self._get_value("spotter_http_request_db_queries_sum", view), queries)
+        self.assertGreaterEqual(
+            self._get_value("spotter_http_response_size_bytes_sum", view), len(response.content)
+        )
+
+    def test_scrape_access(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", headers={"Authorization": "Bearer other"}).status_code, 401)
+
+        # no token configured: closed unless DEBUG
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics").status_code, 404)
+            with override_settings(DEBUG=True):
+                self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+
+class ProfilerTest(LogSheetFixtureMixin, TestCase):
+    def _get_profile_id(self, username, **headers):
+        access = APIClient().post("/api/token/", {"username": username, "password": "pass"}, format="json").data["access"]
+        response = self.client.get(
+            "/api/trips/get_trips?profile=1", headers={"Authorization": f"Bearer {access}", **headers}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.headers.get("X-Profile-Id")
+
+    def test_profiles_on_demand(self):
+        self.assertIsNone(self._get_profile_id("driver"))
+        self.assertIsNone(self._get_profile_id("driver", **{"X-Profile-Token": "invalid"}))
+        self.assertIsNotNone(self._get_profile_id("driver", **{"X-Profile-Token": profiler_middleware.make_profile_token()}))
+
+        User.objects.filter(username="driver").update(is_staff=True)
+        self.assertRegex(self._get_profile_id("driver"), r"^[0-9a-f]{32}$")
+
+        self.assertEqual(self.client.get("/admin/profiles/").status_code, 302)
+        self.client.force_login(User.objects.get(username="driver"))
+        self.assertEqual(self.client.get("/admin/profiles/").status_code, 200)
+
+
+class GenerateFleetTest(TestCase):
+    def test_generates_hos_shaped_trips(self):
+        call_command("generate_fleet", drivers=2, locations=20, months=1, seed=7, stdout=StringIO())
+
+        drivers = Driver.objects.filter(name__startswith="Driver 7-")
+        self.assertEqual(drivers.count(), 2)
+        for driver in drivers:
+            trips = list(Trip.objects.filter(driver=driver).order_by("start_dt"))
+            self.assertGreater(len(trips), 10)
+            for trip, next_trip in zip(trips, trips[1:]):
+                self.assertLessEqual(trip.end_dt, next_trip.start_dt)
+            self.assertLess(trips[-1].end_dt, timezone.now())
+
+            mileages = list(
+                Fueling.objects.filter(trip__driver=driver).order_by("created_dt").values_list("mileage_at_fueling", flat=True)
+            )
+            self.assertTrue(all(0 < b - a <= sync_logic.MAX_FUELING_MILES for a, b in zip(mileages, mileages[1:])))
+
+        self.assertEqual(
+            DutyEvent.objects.filter(type=DutyEventType.TRIP_END, driver__in=drivers).count(),
+            Trip.objects.filter(driver__in=drivers).count()
+        )
+        self.assertTrue(DriverHos.objects.filter(driver__in=drivers).exists())
+
+        with self.assertRaises(CommandError):
+            call_command("generate_fleet", drivers=1, seed=7, stdout=StringIO())
@@ -27,7 +27,7 @@
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from .views import trip, fueling, rest_break, location
+from .views import trip, fueling, rest_break, location, hos, sync, telemetry, events, async_trip
 from .views.auth import login_user, register_user
 from .views.eld import (
     driver_list, driver_detail, vehicle_list, vehicle_detail,
@@ -45,6 +45,11 @@ urlpatterns = [
     path('fueling/', include(fueling.urls)),
     path('rest_breaks/', include(rest_break.urls)),
     path('locations/', include(location.urls)),
+    path('hos/', include(hos.urls)),
+    path('sync/', include(sync.urls)),
+    path('telemetry/', include(telemetry.urls)),
+    path('events/', include(events.urls)),
+    path('async/trips/', include(async_trip.urls)),
 
     # path('', include(router.urls)),
     path('login/', login_user, name="login"),
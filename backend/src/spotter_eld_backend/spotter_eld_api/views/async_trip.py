@@ -0,0 +1,137 @@
+"""
+Async variants of the hot read endpoints of spotter_eld_api.views.trip and views.eld, for the ASGI deployment
+(spotter_eld.asgi): the database is read with the async ORM and redis with the asyncio client, a request waiting on
+MySQL or redis does not hold a worker thread. Same parameters and same bodies as the sync endpoints.
+
+The async ORM still runs the queries of a request in a thread of its own: serve them with conn_max_age 0 in the local
+settings, a persistent connection would not be reused by the next request.
+"""
+from django.urls import path
+from django.utils.dateparse import parse_date
+from rest_framework import status
+
+from helper.common import http_cache, pagination
+from helper.common.constants import RequestTypes
+from helper.decorators.api_decorators import async_api_view, json_response
+from helper.redis import redis_dao
+from spotter_eld.models import Trip
+from spotter_eld_api.logic import cycle_logic, duty_event_logic, form_data_logic, log_sheet_logic, trip_list_logic
+from .trip import serialize_location
+
+
+@async_api_view([RequestTypes.GET])
+async def get_trips(request):
+    driver = request.driver
+    queryset = Trip.objects.filter(driver=driver)
+
+    trip_id = request.GET.get("trip_id")
+    if trip_id:
+        queryset = queryset.filter(pk=trip_id)
+
+    page, next_cursor = await pagination.apaginate(request, queryset)
+    rows = await trip_list_logic.aget_trip_rows(
+        page,
+        fields=trip_list_logic.parse_list_param(request.GET.get("fields")),
+        expand=trip_list_logic.parse_list_param(request.GET.get("expand")),
+    )
+    return pagination.set_next_cursor(request, json_response(rows), next_cursor)
+
+
+@async_api_view([RequestTypes.GET])
+async def get_trip_form_data(request):
+    """
+    Vehicles not assigned to an ongoing trip, trip locations and the cycle hours of the driver, see
+    views.trip.get_trip_form_data
+    """
+    try:
+        # the driver of the token only holds the claims
+        driver = request.driver
+        await driver.arefresh_from_db(fields=['current_cycle_used', 'cycle_computed_on'])
+        total_hours_worked = await cycle_logic.aget_cycle_used(driver)
+
+        if total_hours_worked >= cycle_logic.CYCLE_LIMIT_HOURS:
+            return json_response(
+                {"error": "Driver has reached the 70-hour limit for the last 8 days. Cannot start a new trip."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        locations = await form_data_logic.aget_locations(form_data_logic.TRIP_LOCATION_TYPES)
+        unallocated_vehicles = await form_data_logic.aget_unallocated_vehicles()
+
+        last_modified = max(locations["last_modified"], unallocated_vehicles["last_modified"], cycle_logic.get_cycle_rolled_at(driver))
+        etag = http_cache.build_etag(locations["last_modified"], unallocated_vehicles["last_modified"], total_hours_worked)
+
+        not_modified = http_cache.get_not_modified_response(request, etag, last_modified)
+        if not_modified:
+            return not_modified
+
+        response = json_response({
+            "vehicles": unallocated_vehicles["data"],
+            "locations": locations["data"],
+            "current_cycle_used": total_hours_worked
+        })
+        return http_cache.set_validators(response, etag, last_modified)
+
+    except Exception as e:
+        return json_response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_api_view([RequestTypes.GET], require_driver=False)
+async def trip_form_data(request):
+    """
+    Unallocated vehicles and locations of every type, see views.eld.trip_form_data
+    """
+    locations = await form_data_logic.aget_locations(form_data_logic.ALL_LOCATION_TYPES)
+    unallocated_vehicles = await form_data_logic.aget_unallocated_vehicles()
+
+    return json_response({
+        "vehicles": unallocated_vehicles["data"],
+        "locations": locations["data"],
+    })
+
+
+@async_api_view([RequestTypes.GET])
+async def get_trip_trace(request):
+    trip = await redis_dao.aget_trip(request.GET.get("id"))
+    if trip is None:
+        return json_response({"detail": "No Trip matches the given query."}, status=status.HTTP_404_NOT_FOUND)
+
+    actions = duty_event_logic.get_trace(trip, await duty_event_logic.aget_trip_events(trip.id))
+    for action in actions:
+        action["location"] = serialize_location(await redis_dao.aget_location(action.pop("location_id")))
+
+    return json_response({
+        "trip_id": trip.id,
+        "driver": trip.driver_id,
+        "actions": actions
+    })
+
+
+@async_api_view([RequestTypes.GET])
+async def get_driver_log_sheet(request):
+    log_date = request.GET.get("date")
+    if not log_date:
+        return json_response({"error": "date is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        log_date = parse_date(log_date)
+    except ValueError:
+        log_date = None
+
+    if not log_date:
+        return json_response({"error": "date must be formatted as YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        return json_response(await log_sheet_logic.aget_driver_log_sheet(request.driver, log_date))
+
+    except Exception as e:
+        return json_response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+urls = [
+    path('get_trips', get_trips, name='async_get_trips'),
+    path('get_trip_form_data', get_trip_form_data, name='async_get_trip_form_data'),
+    path('trip_form_data', trip_form_data, name='async_trip_form_data'),
+    path('get_trip_trace', get_trip_trace, name='async_get_trip_trace'),
+    path('get_driver_log_sheet', get_driver_log_sheet, name='async_get_driver_log_sheet'),
+]
@@ -47,9 +47,7 @@
 # class FuelingViewSet(viewsets.ModelViewSet):
 #     queryset = Fueling.objects.all()
 #     serializer_class = FuelingSerializer
-from datetime import timedelta
-
-from django.db.models import F, Sum, ExpressionWrapper, fields
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
 from django.urls import path
 from django.utils.timezone import now
@@ -58,11 +56,13 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from helper.common import pagination
 from helper.common.constants import RequestTypes, TripStatus
 from spotter_eld.models import Driver, Vehicle, Location, Trip, RestBreak, Fueling
+from spotter_eld_api.logic import cycle_logic, duty_event_logic, trip_list_logic
 from .serializers import (
     DriverSerializer, VehicleSerializer, LocationSerializer,
-    TripSerializer, DriverLogSerializer, RestBreakSerializer, TripListSerializer
+    TripSerializer, DriverLogSerializer, RestBreakSerializer
 )
 
 
@@ -71,9 +71,9 @@ from .serializers import (
 @permission_classes([IsAuthenticated])
 def driver_list(request):
     if request.method in RequestTypes.GET:
-        drivers = Driver.objects.all()
+        drivers, next_cursor = pagination.paginate(request, Driver.objects.all())
         serializer = DriverSerializer(drivers, many=True)
-        return Response(serializer.data)
+        return pagination.set_next_cursor(request, Response(serializer.data), next_cursor)
 
     if request.method in RequestTypes.POST:
         serializer = DriverSerializer(data=request.data)
@@ -109,9 +109,9 @@ def driver_detail(request, pk):
 @permission_classes([IsAuthenticated])
 def vehicle_list(request):
     if request.method in RequestTypes.GET:
-        vehicles = Vehicle.objects.all()
+        vehicles, next_cursor = pagination.paginate(request, Vehicle.objects.all())
         serializer = VehicleSerializer(vehicles, many=True)
-        return Response(serializer.data)
+        return pagination.set_next_cursor(request, Response(serializer.data), next_cursor)
 
     if request.method in RequestTypes.POST:
         serializer = VehicleSerializer(data=request.data)
@@ -147,9 +147,9 @@ def vehicle_detail(request, pk):
 @permission_classes([IsAuthenticated])
 def location_list(request):
     if request.method in RequestTypes.GET:
-        locations = Location.objects.all()
+        locations, next_cursor = pagination.paginate(request, Location.objects.all())
         serializer = LocationSerializer(locations, many=True)
-        return Response(serializer.data)
+        return pagination.set_next_cursor(request, Response(serializer.data), next_cursor)
 
     if request.method in RequestTypes.POST:
         serializer = LocationSerializer(data=request.data)
@@ -234,7 +234,9 @@ def restbreak_list(request):
     if request.method in RequestTypes.POST:
         serializer = RestBreakSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                restbreak = serializer.save()
+                duty_event_logic.record_rest_break_start(restbreak.trip.driver_id, restbreak)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -309,9 +311,13 @@ def trip_list(request):
 
     if request.method in RequestTypes.GET:
         # Filter trips for the current authenticated driver only
-        trips = Trip.objects.filter(driver=driver).select_related('driver', 'vehicle')
-        serializer = TripListSerializer(trips, many=True)
-        return Response(serializer.data)
+        page, next_cursor = pagination.paginate(request, Trip.objects.filter(driver=driver))
+        rows = trip_list_logic.get_trip_rows(
+            page,
+            fields=trip_list_logic.parse_list_param(request.GET.get("fields")),
+            expand=trip_list_logic.parse_list_param(request.GET.get("expand")),
+        )
+        return pagination.set_next_cursor(request, Response(rows), next_cursor)
 
     if request.method in RequestTypes.POST:
         vehicle_id = request.data.get("vehicle")
@@ -339,17 +345,7 @@ def trip_list(request):
             )
 
         # Validate the 70-hour/8-day limit
-        last_8_days = now() - timedelta(days=8)
-
-        # Calculate total hours worked
-        total_hours_worked = (
-                Trip.objects.filter(driver=driver, end_dt__isnull=False, start_dt__gte=last_8_days)
-                .annotate(work_duration=ExpressionWrapper(F('end_dt') - F('start_dt'), output_field=fields.DurationField()))
-                .aggregate(total_hours=Sum(ExpressionWrapper(F('work_duration') / timedelta(hours=1), output_field=fields.FloatField())))
-                ['total_hours'] or 0
-        )
-
-        if total_hours_worked >= 70:
+        if cycle_logic.has_reached_cycle_limit(driver):
             return Response(
                 {"error": "Driver has reached the 70-hour limit for the last 8 days. Cannot start a new trip."},
                 status=status.HTTP_400_BAD_REQUEST
@@ -361,7 +357,16 @@ def trip_list(request):
 
         serializer = TripSerializer(data=data)
         if serializer.is_valid():
-            serializer.save()
+            try:
+                with transaction.atomic():
+                    trip = serializer.save()
+                    duty_event_logic.record_trip_start(trip)
+            except IntegrityError:
+                # a concurrent request started a trip for this driver or vehicle, see Trip.Meta.constraints
+                return Response(
+                    {"error": "Driver or vehicle already has an ongoing trip."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,143 @@
+"""
+Server-sent event stream of the trip activity for the dispatch screens (see helper.redis.trip_events).
+
+The view is a plain async Django view, DRF has no async views: the streams stay open, they must be served through
+spotter_eld.asgi (e.g. gunicorn -k uvicorn.workers.UvicornWorker spotter_eld.asgi) where an idle stream only costs
+a queue, not a worker thread. Under WSGI a stream would hold a worker until the client leaves, the view answers 503.
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import path
+from django.views.decorators.http import require_GET
+from redis import RedisError
+from rest_framework import exceptions, status
+
+from helper.redis import redis_keys, trip_events
+from spotter_eld_api.authentication import DriverTokenAuthentication
+
+log = logging.getLogger(__name__)
+
+# comment line sent on an idle stream so that the proxies keep it open
+KEEPALIVE_SECONDS = 15
+# delay before the browser reconnects a dropped stream
+RETRY_MS = 3000
+
+
+class _AccessTokenAuthentication(DriverTokenAuthentication):
+    """
+    EventSource can not set headers, the access token may be passed as the access_token query parameter
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is None and request.GET.get('access_token'):
+            validated_token = self.get_validated_token(request.GET['access_token'].encode('utf-8'))
+            result = self.get_user(validated_token), validated_token
+        return result
+
+
+def _parse_ids(value):
+    """
+    @param value: comma separated ids or None
+    @raise ValueError
+    """
+    ids = [int(id_) for id_ in value.split(',')] if value else []
+    if any(id_ <= 0 for id_ in ids):
+        raise ValueError
+    return ids
+
+
+def _get_channels(request):
+    """
+    Drivers follow their own activity, staff users choose the drivers, the vehicles or the whole fleet
+    @return: (channels, None) or (None, JsonResponse)
+    """
+    try:
+        result = _AccessTokenAuthentication().authenticate(request)
+    except exceptions.AuthenticationFailed as e:
+        return None, JsonResponse({"error": str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+    if result is None:
+        return None, JsonResponse({"error": "Authentication credentials were not provided."},
+                                  status=status.HTTP_401_UNAUTHORIZED)
+    user = result[0]
+
+    driver_ids, vehicle_ids = request.GET.get('driver_ids'), request.GET.get('vehicle_ids')
+    fleet = request.GET.get('fleet') in ('1', 'true')
+    if driver_ids or vehicle_ids or fleet:
+        if not user.is_staff:
+            return None, JsonResponse({"error": "Only staff users can follow other drivers or vehicles."},
+                                      status=status.HTTP_403_FORBIDDEN)
+        if fleet:
+            return [redis_keys.get_fleet_events_channel()], None
+
+        try:
+            channels = [redis_keys.get_driver_events_channel(id_) for id_ in _parse_ids(driver_ids)]
+            channels += [redis_keys.get_vehicle_events_channel(id_) for id_ in _parse_ids(vehicle_ids)]
+        except ValueError:
+            return None, JsonResponse({"error": "driver_ids and vehicle_ids must be comma separated ids."},
+                                      status=status.HTTP_400_BAD_REQUEST)
+        return channels, None
+
+    if not hasattr(user, 'driver_profile'):
+        return None, JsonResponse({"error": "Authenticated user is not associated with a driver profile"},
+                                  status=status.HTTP_403_FORBIDDEN)
+    return [redis_keys.get_driver_events_channel(user.driver_profile.id)], None
+
+
+async def _stream(hub, channels, queue):
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+
+            if message == trip_events.RESYNC:
+                # the client reloads the trips and reconnects
+                yield f"event: resync\ndata: {json.dumps({'reason': 'missed events'})}\n\n"
+                return
+            yield f"data: {message.decode('utf-8')}\n\n"
+    finally:
+        await hub.unsubscribe(channels, queue)
+
+
+@require_GET
+async def trip_events_stream(request):
+    """
+    text/event-stream of the duty events of the driver of the user, or for staff users of
+    ?driver_ids=1,2 / ?vehicle_ids=3,4 / ?fleet=1
+    The access token is read from the Authorization header or the access_token query parameter.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "Trip events are only served over ASGI."},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    channels, error = await sync_to_async(_get_channels)(request)
+    if error is not None:
+        return error
+
+    hub = trip_events.get_hub()
+    try:
+        queue = await hub.subscribe(channels)
+    except RedisError:
+        log.error("Could not subscribe to %s", channels, exc_info=True)
+        return JsonResponse({"error": "Trip events are not available now, retry later."},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    response = StreamingHttpResponse(_stream(hub, channels, queue), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # nginx must not buffer the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+urls = [
+    path('trips', trip_events_stream, name='trip_events_stream'),
+]
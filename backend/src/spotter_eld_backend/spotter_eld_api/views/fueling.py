@@ -1,3 +1,4 @@
+from django.db import transaction
 from django.db.models import Q, Max
 from django.urls import path
 from rest_framework import status
@@ -5,11 +6,13 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from helper.common import http_cache, pagination
 from helper.common.constants import RequestTypes, TripStatus, LocationType
-from helper.decorators.api_decorators import driver_profile_required
-from spotter_eld.models import Location, Fueling, Trip
+from helper.decorators.api_decorators import driver_profile_required, idempotent
+from helper.redis import trip_state_dao
+from spotter_eld.models import Fueling, Trip
+from spotter_eld_api.logic import duty_event_logic, form_data_logic
 from .serializers import (
-    LocationSerializer,
     FuelingSerializer, FuelingListSerializer, TripListSerializer
 )
 
@@ -26,11 +29,11 @@ def get_fueling(request):
     if fueling_id:
         q_set &= Q(pk=fueling_id)
 
-    fueling = Fueling.objects.filter(q_set).select_related('trip', 'location')
+    fueling, next_cursor = pagination.paginate(request, Fueling.objects.filter(q_set).select_related('trip', 'location'))
 
     serializer = FuelingListSerializer(fueling, many=True)
 
-    return Response(serializer.data)
+    return pagination.set_next_cursor(request, Response(serializer.data), next_cursor)
 
 
 @api_view([RequestTypes.GET])
@@ -46,20 +49,28 @@ def get_fueling_form_data(request):
 
     driver = request.user.driver_profile
     try:
-        # drivers = Driver.objects.all()
-        locations = Location.objects.filter(type=LocationType.FUELING)
-        trip_obj = Trip.objects.filter(driver=driver, status=TripStatus.ONGOING)
+        # locations are cached and invalidated on Location changes
+        locations = form_data_logic.get_locations([LocationType.FUELING])
+        trips = list(
+            Trip.objects.filter(driver=driver, status=TripStatus.ONGOING)
+            .select_related('driver', 'vehicle', 'start_location', 'end_location')
+        )
+
+        etag, last_modified = form_data_logic.get_trips_validators(locations, trips)
 
-        # driver_serializer = DriverSerializer(drivers, many=True)
-        trip_serializer = TripListSerializer(trip_obj, many=True)
-        location_serializer = LocationSerializer(locations, many=True)
+        not_modified = http_cache.get_not_modified_response(request, etag, last_modified)
+        if not_modified:
+            return not_modified
 
-        return Response({
-            # "drivers": driver_serializer.data,_form_
+        trip_serializer = TripListSerializer(trips, many=True)
+
+        response = Response({
             "trips": trip_serializer.data,
-            "locations": location_serializer.data
+            "locations": locations["data"]
         }, status=status.HTTP_200_OK)
 
+        return http_cache.set_validators(response, etag, last_modified)
+
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -67,17 +78,20 @@ def get_fueling_form_data(request):
 @api_view([RequestTypes.POST])
 @permission_classes([IsAuthenticated])  # Require authentication
 @driver_profile_required
+@idempotent
 def create_fueling(request):
     driver = request.user.driver_profile
     data = request.data.copy()
 
     trip_id = data.get('trip')
     current_mileage = int(data.get('mileage_at_fueling'))
-    trip = Trip.objects.get(id=trip_id, driver=driver)
+    # the ongoing trip of the driver is validated from its cached state
+    if not trip_state_dao.get_driver_trip(driver.id, trip_id):
+        Trip.objects.get(id=trip_id, driver=driver)
 
     # Get the maximum mileage from previous fuelings for the same trip
     last_fueling_mileage = (
-        Fueling.objects.filter(trip=trip)
+        Fueling.objects.filter(trip_id=trip_id)
         .aggregate(max_mileage=Max('mileage_at_fueling'))
         .get('max_mileage')
     )
@@ -91,7 +105,9 @@ def create_fueling(request):
 
     serializer = FuelingSerializer(data=data)
     if serializer.is_valid():
-        serializer.save()
+        with transaction.atomic():
+            fueling = serializer.save()
+            duty_event_logic.record_fueling(driver.id, fueling)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,46 @@
+from django.urls import path
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from helper.common.constants import RequestTypes
+from spotter_eld_api.logic import hos_engine
+
+
+@api_view([RequestTypes.GET])
+@permission_classes([IsAuthenticated])
+def get_fleet_availability(request):
+    """
+    Hours of service of the whole fleet (or of the comma separated 'driver_ids') evaluated in one pass:
+    - driving / 14-hour window / cycle hours used
+    - remaining hours available
+    - compliance with the 11-hour, 14-hour and 70-hour/8-day rules
+    'available_only=1' only returns the drivers that can take a load now.
+    Restricted to staff users.
+    """
+    if not request.user.is_staff:
+        return Response({"error": "Only staff users can read the availability of the fleet."}, status=status.HTTP_403_FORBIDDEN)
+
+    driver_ids = request.GET.get("driver_ids")
+    available_only = request.GET.get("available_only") in ("1", "true", "True")
+
+    try:
+        if driver_ids:
+            driver_ids = [int(driver_id) for driver_id in driver_ids.split(",") if driver_id]
+    except ValueError:
+        return Response({"error": "driver_ids must be a comma separated list of ids."}, status=status.HTTP_400_BAD_REQUEST)
+
+    fleet_status = hos_engine.evaluate(driver_ids or None)
+    rows = fleet_status.to_rows(available_only=available_only)
+    rows.sort(key=lambda row: row["remaining_hours"], reverse=True)
+
+    return Response({
+        "evaluated_at": fleet_status.now,
+        "drivers": rows,
+    }, status=status.HTTP_200_OK)
+
+
+urls = [
+    path('get_fleet_availability', get_fleet_availability, name='get_fleet_availability'),
+]
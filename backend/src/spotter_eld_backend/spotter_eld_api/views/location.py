@@ -5,6 +5,7 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from helper.common import pagination
 from helper.common.constants import RequestTypes
 from helper.decorators.api_decorators import driver_profile_required
 from spotter_eld.models import Location
@@ -17,9 +18,9 @@ from .serializers import (
 @permission_classes([IsAuthenticated])
 @driver_profile_required
 def get_locations(request):
-    locations = Location.objects.all()
+    locations, next_cursor = pagination.paginate(request, Location.objects.all())
     serializer = LocationSerializer(locations, many=True)
-    return Response(serializer.data)
+    return pagination.set_next_cursor(request, Response(serializer.data), next_cursor)
 
 
 @api_view([RequestTypes.GET, RequestTypes.POST])
@@ -0,0 +1,38 @@
+"""
+Prometheus scrape endpoint of the request metrics recorded by helper.middleware.metrics_middleware
+"""
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import path
+from django.views.decorators.http import require_GET
+
+from helper.common import metrics as request_metrics
+from helper.redis import metrics_dao
+
+
+@require_GET
+def metrics(request):
+    """
+    Histograms of every live process in the Prometheus text format. The scraper sends METRICS_TOKEN as a bearer
+    token, without a token the endpoint is only served with DEBUG on.
+    """
+    if not settings.METRICS_TOKEN:
+        if not settings.DEBUG:
+            return HttpResponse("Not Found\n", status=404, content_type="text/plain")
+    else:
+        authorization = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization.encode("utf-8"), f"Bearer {settings.METRICS_TOKEN}".encode("utf-8")):
+            return HttpResponse("Unauthorized\n", status=401, content_type="text/plain")
+
+    snapshots = [request_metrics.snapshot()] + metrics_dao.get_other_snapshots()
+    return HttpResponse(
+        request_metrics.render(snapshots, settings.METRICS_SAMPLE_RATE),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+urls = [
+    path('metrics', metrics, name='metrics'),
+]
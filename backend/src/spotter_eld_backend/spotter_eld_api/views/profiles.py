@@ -0,0 +1,76 @@
+"""
+Admin pages of the request profiles captured by helper.middleware.profiler_middleware
+"""
+import re
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib import admin
+from django.http import Http404, HttpResponse
+from django.shortcuts import render
+from django.urls import path
+from redis import RedisError
+
+from helper.middleware import profiler_middleware
+from helper.redis import profile_dao
+
+REQUEST_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def list_profiles(request):
+    try:
+        profiles = profile_dao.get_profiles()
+        error = None
+    except RedisError:
+        profiles, error = [], "The profiles are not available now, redis is not reachable."
+
+    for profile in profiles:
+        profile["captured_at"] = datetime.fromtimestamp(profile["ts"], tz=timezone.utc)
+
+    return render(request, "admin/profiles.html", {
+        **admin.site.each_context(request),
+        "title": "Request profiles",
+        "profiles": profiles,
+        "error": error,
+        "profile_token": profiler_middleware.make_profile_token(),
+        "profile_token_hours": settings.PROFILER_TOKEN_MAX_AGE // 3600,
+    })
+
+
+def _get_profile(request_id, field):
+    """
+    @raise Http404, RedisError
+    """
+    data = profile_dao.get_profile(request_id, field) if REQUEST_ID_PATTERN.match(request_id) else None
+    if data is None:
+        raise Http404
+    return data
+
+
+def get_profile_summary(request, request_id):
+    try:
+        data = _get_profile(request_id, "summary")
+    except RedisError:
+        return HttpResponse("Redis is not reachable.", status=503, content_type="text/plain")
+    return HttpResponse(data, content_type="text/plain; charset=utf-8")
+
+
+def download_profile(request, request_id):
+    """
+    pstats dump, to open with python -m pstats, snakeviz or flameprof
+    """
+    try:
+        data = _get_profile(request_id, "stats")
+    except RedisError:
+        return HttpResponse("Redis is not reachable.", status=503, content_type="text/plain")
+
+    response = HttpResponse(data, content_type="application/octet-stream")
+    response["Content-Disposition"] = f'attachment; filename="{request_id}.prof"'
+    return response
+
+
+urls = [
+    path('', admin.site.admin_view(list_profiles), name='list_profiles'),
+    path('<str:request_id>/summary', admin.site.admin_view(get_profile_summary), name='get_profile_summary'),
+    path('<str:request_id>/download', admin.site.admin_view(download_profile), name='download_profile'),
+]
@@ -49,6 +49,7 @@
 #     serializer_class = FuelingSerializer
 from datetime import timedelta
 
+from django.db import transaction
 from django.db.models import Q
 from django.urls import path
 from django.utils.timezone import now
@@ -57,11 +58,14 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from helper.common import http_cache, pagination
 from helper.common.constants import RequestTypes, LocationType, TripStatus
-from helper.decorators.api_decorators import driver_profile_required
-from spotter_eld.models import RestBreak, Location, Trip
+from helper.decorators.api_decorators import driver_profile_required, idempotent
+from helper.redis import trip_state_dao
+from spotter_eld.models import RestBreak, Trip
+from spotter_eld_api.logic import duty_event_logic, form_data_logic, log_sheet_logic
 from .serializers import (
-    RestBreakSerializer, TripListSerializer, LocationSerializer, RestBreakListSerializer
+    RestBreakSerializer, TripListSerializer, RestBreakListSerializer
 )
 
 
@@ -77,11 +81,11 @@ def get_rest_break(request):
     if fueling_id:
         q_set &= Q(pk=fueling_id)
 
-    fueling = RestBreak.objects.filter(q_set).select_related('trip', 'location')
+    fueling, next_cursor = pagination.paginate(request, RestBreak.objects.filter(q_set).select_related('trip', 'location'))
 
     serializer = RestBreakListSerializer(fueling, many=True)
 
-    return Response(serializer.data)
+    return pagination.set_next_cursor(request, Response(serializer.data), next_cursor)
 
 
 @api_view([RequestTypes.GET])
@@ -97,19 +101,28 @@ def get_rest_break_form_data(request):
 
     driver = request.user.driver_profile
     try:
-        # drivers = Driver.objects.all()
-        locations = Location.objects.filter(type=LocationType.BREAK_REST)
-        trip_obj = Trip.objects.filter(driver=driver, status=TripStatus.ONGOING)
+        # locations are cached and invalidated on Location changes
+        locations = form_data_logic.get_locations([LocationType.BREAK_REST])
+        trips = list(
+            Trip.objects.filter(driver=driver, status=TripStatus.ONGOING)
+            .select_related('driver', 'vehicle', 'start_location', 'end_location')
+        )
+
+        etag, last_modified = form_data_logic.get_trips_validators(locations, trips)
 
-        # driver_serializer = DriverSerializer(drivers, many=True)
-        trip_serializer = TripListSerializer(trip_obj, many=True)
-        location_serializer = LocationSerializer(locations, many=True)
+        not_modified = http_cache.get_not_modified_response(request, etag, last_modified)
+        if not_modified:
+            return not_modified
 
-        return Response({
+        trip_serializer = TripListSerializer(trips, many=True)
+
+        response = Response({
             "trips": trip_serializer.data,
-            "locations": location_serializer.data
+            "locations": locations["data"]
         }, status=status.HTTP_200_OK)
 
+        return http_cache.set_validators(response, etag, last_modified)
+
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -117,16 +130,26 @@ def get_rest_break_form_data(request):
 @api_view([RequestTypes.POST])
 @permission_classes([IsAuthenticated])  # Require authentication
 @driver_profile_required
+@idempotent
 def create_rest_break(request):
     data = request.data.copy()
     driver = request.user.driver_profile
 
+    # the ongoing trip of the driver is validated from its cached state
+    if not trip_state_dao.get_driver_trip(driver.id, data.get('trip')):
+        return Response(
+            {"error": "Rest breaks can only be taken during the ongoing trip of the driver."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
     data['start_dt'] = now()  # Set start time as the current timestamp
     data['driver'] = driver.id  # Use the driver's ID directly
 
     serializer = RestBreakSerializer(data=data)
     if serializer.is_valid():
-        serializer.save()
+        with transaction.atomic():
+            rest_break = serializer.save()
+            duty_event_logic.record_rest_break_start(driver.id, rest_break)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -134,13 +157,14 @@ def create_rest_break(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def end_rest_break(request):
     try:
         _now = now()
 
         data = request.data.copy()
 
-        rest_break = RestBreak.objects.get(id=data.get('id'))
+        rest_break = RestBreak.objects.select_related('trip__driver').get(id=data.get('id'))
         # Ensure the trip is ongoing and pickup is not yet completed
         if rest_break.end_dt:
             return Response(
@@ -151,8 +175,15 @@ def end_rest_break(request):
 
         # Calculate rest_break duration
         rest_break.end_dt = _now
-        rest_break.duration = (_now - rest_break.end_dt).total_seconds() / 60  # Convert to hours
-        rest_break.save()
+        rest_break.duration = (_now - rest_break.start_dt).total_seconds() / 60  # Convert to minutes
+        with transaction.atomic():
+            rest_break.save()
+            duty_event_logic.record_rest_break_end(rest_break.trip.driver_id, rest_break)
+
+        # A rest break running over midnight changes the materialized log sheets of the closed days
+        transaction.on_commit(lambda: log_sheet_logic.refresh_log_sheets(
+            rest_break.trip.driver, rest_break.start_dt, rest_break.end_dt
+        ))
 
         return Response(
             {"message": "Rest Break ended successfully.", "rest_break": rest_break.duration},
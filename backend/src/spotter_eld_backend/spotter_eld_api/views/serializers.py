@@ -1,6 +1,19 @@
+import logging
+
+from redis import RedisError
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from helper.common.constants import SyncEventType
+from helper.redis import token_dao
 
 from spotter_eld.models import Driver, Vehicle, Location, Trip, DriverHos, RestBreak, Fueling
+from spotter_eld_api.authentication import RedisBlacklistRefreshToken, get_driver_claims
+
+log = logging.getLogger(__name__)
 
 
 # Driver Serializer
@@ -119,6 +132,101 @@ class TripActionSerializer(serializers.Serializer):
     duration = serializers.IntegerField(required=False, allow_null=True)
 
 
+class SyncEventSerializer(serializers.Serializer):
+    """
+    Event recorded by the app while offline, see spotter_eld_api.logic.sync_logic
+    """
+    REQUIRED_FIELDS = {
+        SyncEventType.START_PICKUP: ['trip'],
+        SyncEventType.END_PICKUP: ['trip'],
+        SyncEventType.START_DROP_OFF: ['trip'],
+        SyncEventType.END_DROP_OFF: ['trip'],
+        SyncEventType.START_REST_BREAK: ['trip', 'location'],
+        SyncEventType.END_REST_BREAK: [],
+        SyncEventType.FUELING: ['trip', 'location', 'amount', 'cost', 'mileage_at_fueling'],
+    }
+
+    key = serializers.CharField(max_length=64)
+    type = serializers.ChoiceField(choices=list(REQUIRED_FIELDS))
+    ts = serializers.DateTimeField()
+    trip = serializers.IntegerField(required=False)
+    location = serializers.IntegerField(required=False)
+    rest_break = serializers.IntegerField(required=False)
+    rest_break_key = serializers.CharField(max_length=64, required=False)
+    amount = serializers.FloatField(required=False)
+    cost = serializers.FloatField(required=False)
+    mileage_at_fueling = serializers.IntegerField(required=False)
+    duration = serializers.FloatField(required=False, allow_null=True)
+
+    def validate(self, attrs):
+        missing = [field for field in self.REQUIRED_FIELDS[attrs['type']] if field not in attrs]
+        if attrs['type'] == SyncEventType.END_REST_BREAK and 'rest_break' not in attrs and 'rest_break_key' not in attrs:
+            missing.append('rest_break')
+        if missing:
+            raise serializers.ValidationError({field: "This field is required." for field in missing})
+        return attrs
+
+
+class DriverTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Embeds the identity read by spotter_eld_api.authentication in the tokens, the access tokens refreshed from them
+    inherit the claims
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.username
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        # time of the login, checked against the revocations of the user (iat is rounded down to the second)
+        token['auth_time'] = token.current_time.timestamp()
+        for claim, value in get_driver_claims(user).items():
+            token[claim] = value
+
+        return token
+
+
+class DriverTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Rotates the refresh token with its blacklist and revocation checked in redis (see helper.redis.token_dao), the
+    user is not read: deactivating a user revokes its tokens. When redis is not reachable the rotation falls back to
+    the blacklist tables.
+    """
+    token_class = RedisBlacklistRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh[api_settings.USER_ID_CLAIM]
+        jti, exp = refresh[api_settings.JTI_CLAIM], refresh['exp']
+        auth_time = refresh.get('auth_time', refresh.get('iat', 0))
+
+        data = {'access': str(refresh.access_token)}
+
+        refresh.set_jti()
+        refresh.set_exp()
+        refresh.set_iat()
+        data['refresh'] = str(refresh)
+
+        try:
+            outcome = token_dao.rotate_refresh_token(user_id, auth_time, jti, exp, {
+                'jti': refresh[api_settings.JTI_CLAIM], 'user_id': user_id, 'iat': refresh['iat'],
+                'exp': refresh['exp'], 'token': data['refresh'],
+            })
+        except RedisError:
+            log.error("Could not rotate the refresh token of user %s in redis", user_id, exc_info=True)
+            self.token_class = RefreshToken
+            return super().validate(attrs)
+
+        if outcome == token_dao.REVOKED:
+            raise AuthenticationFailed("Token has been revoked.", code="token_revoked")
+        if outcome == token_dao.BLACKLISTED:
+            # same error as the blacklist check of simplejwt
+            raise TokenError("Token is blacklisted")
+
+        return data
+
+
 # class TripSerializer(serializers.ModelSerializer):
 #     actions = serializers.SerializerMethodField()
 #
@@ -0,0 +1,48 @@
+from django.db import IntegrityError
+from django.urls import path
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from helper.common.constants import RequestTypes
+from helper.decorators.api_decorators import driver_profile_required
+from spotter_eld_api.logic import sync_logic
+from .serializers import SyncEventSerializer
+
+
+@api_view([RequestTypes.POST])
+@permission_classes([IsAuthenticated])
+@driver_profile_required
+def sync_events(request):
+    """
+    Applies the events recorded by the app while offline, {"events": [{key, type, ts, ...}, ...]} in the order they
+    happened, in one transaction.
+    Returns the result of each event; an event whose key was already applied is reported as DUPLICATE, so a failed
+    upload can be sent again as is.
+    """
+    driver = request.user.driver_profile
+
+    events = request.data.get("events") if isinstance(request.data, dict) else None
+    if not isinstance(events, list):
+        return Response({"error": "events must be a list."}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = SyncEventSerializer(data=events, many=True, max_length=sync_logic.SYNC_MAX_EVENTS)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        results = sync_logic.apply_events(driver, serializer.validated_data)
+    except IntegrityError:
+        # the unique key of the duty events: the same events are being uploaded by another request
+        return Response(
+            {"error": "These events are being uploaded by another request, retry later."},
+            status=status.HTTP_409_CONFLICT
+        )
+
+    return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+urls = [
+    path('events', sync_events, name='sync_events'),
+]
@@ -0,0 +1,55 @@
+import logging
+
+from django.urls import path
+from redis import RedisError
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from helper.common.constants import RequestTypes
+from helper.decorators.api_decorators import driver_profile_required
+from helper.redis import breadcrumb_stream, trip_state_dao
+from spotter_eld_api.logic import telemetry_logic
+
+log = logging.getLogger(__name__)
+
+
+@api_view([RequestTypes.POST])
+@permission_classes([IsAuthenticated])
+@driver_profile_required
+def upload_breadcrumbs(request):
+    """
+    Queues GPS samples of the vehicle of the driver's ongoing trip:
+    {"vehicle": id, "samples": [{"lat", "lon", "speed" (mph), "odometer" (miles, optional), "ts"}, ...]}
+    The samples are written to the database asynchronously by the drain_breadcrumbs workers.
+    """
+    driver = request.user.driver_profile
+    data = request.data if isinstance(request.data, dict) else {}
+
+    # the vehicle is checked against the cached trip state, the request does not query the trips
+    state = trip_state_dao.get_active_trip(driver.id)
+    if not state or str(state["vehicle_id"]) != str(data.get("vehicle")):
+        return Response(
+            {"error": "Breadcrumbs can only be uploaded for the vehicle of the ongoing trip."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        samples = telemetry_logic.parse_samples(data.get("samples"))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        breadcrumb_stream.publish(state["vehicle_id"], driver.id, samples)
+    except RedisError:
+        log.error("Could not queue the breadcrumbs of vehicle %s", state["vehicle_id"], exc_info=True)
+        return Response({"error": "Breadcrumbs can not be accepted now, retry later."},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    return Response({"accepted": len(samples)}, status=status.HTTP_202_ACCEPTED)
+
+
+urls = [
+    path('breadcrumbs', upload_breadcrumbs, name='upload_breadcrumbs'),
+]
@@ -1,20 +1,28 @@
-from datetime import timedelta
+import json
 
-from django.db.models import F, Sum, ExpressionWrapper, fields, Q
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.urls import path
+from django.utils.dateparse import parse_date
 from django.utils.timezone import now
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from helper.common.constants import RequestTypes, TripStatus, LocationType
-from helper.decorators.api_decorators import driver_profile_required
-from spotter_eld.models import Vehicle, Location, Trip, Driver, DriverHos, RestBreak, Fueling
+from helper.common import http_cache, pagination
+from helper.common.constants import RequestTypes, TransitionOutcome, TripStatus
+from helper.decorators.api_decorators import driver_profile_required, idempotent
+from helper.redis import redis_dao, trip_state_dao
+from spotter_eld.models import Driver, Trip
+from spotter_eld_api.logic import (
+    cycle_logic, duty_event_logic, form_data_logic, log_sheet_logic, trip_list_logic, trip_logic
+)
 from .serializers import (
-    VehicleSerializer, LocationSerializer,
-    TripSerializer, TripListSerializer
+    TripSerializer
 )
 
 
@@ -32,9 +40,14 @@ def get_trips(request):
     if trip_id:
         q_set &= Q(pk=trip_id)
 
-    trips = Trip.objects.filter(q_set).select_related('driver', 'vehicle')
-    serializer = TripListSerializer(trips, many=True)
-    return Response(serializer.data)
+    # 'fields' and 'expand' (comma separated) trim the rows, e.g. expand= returns the related objects as ids
+    page, next_cursor = pagination.paginate(request, Trip.objects.filter(q_set))
+    rows = trip_list_logic.get_trip_rows(
+        page,
+        fields=trip_list_logic.parse_list_param(request.GET.get("fields")),
+        expand=trip_list_logic.parse_list_param(request.GET.get("expand")),
+    )
+    return pagination.set_next_cursor(request, Response(rows), next_cursor)
 
 
 @api_view([RequestTypes.GET])
@@ -48,37 +61,36 @@ def get_trip_form_data(request):
     - Locations
     """
     try:
-        # drivers = Driver.objects.all()
-        locations = Location.objects.filter(type__in=[LocationType.TRIP_START, LocationType.TRIP_END])
-        unallocated_vehicles = Vehicle.objects.exclude(trips__status=TripStatus.ONGOING)
-
-        # driver_serializer = DriverSerializer(drivers, many=True)
-        vehicle_serializer = VehicleSerializer(unallocated_vehicles, many=True)
-        location_serializer = LocationSerializer(locations, many=True)
-
         # Validate the 70-hour/8-day limit
-        last_8_days = now() - timedelta(days=8)
         driver = request.user.driver_profile
-        # Calculate total hours worked
-        total_hours_worked = (
-                Trip.objects.filter(driver=driver, end_dt__isnull=False, start_dt__gte=last_8_days)
-                .annotate(work_duration=ExpressionWrapper(F('end_dt') - F('start_dt'), output_field=fields.DurationField()))
-                .aggregate(total_hours=Sum(ExpressionWrapper(F('work_duration') / timedelta(hours=1), output_field=fields.FloatField())))
-                ['total_hours'] or 0
-        )
+        total_hours_worked = cycle_logic.get_cycle_used(driver)
 
-        if total_hours_worked >= 70:
+        if total_hours_worked >= cycle_logic.CYCLE_LIMIT_HOURS:
             return Response(
                 {"error": "Driver has reached the 70-hour limit for the last 8 days. Cannot start a new trip."},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        return Response({
-            # "drivers": driver_serializer.data,
-            "vehicles": vehicle_serializer.data,
-            "locations": location_serializer.data,
+
+        # locations and unallocated vehicles are cached and invalidated on Location/Vehicle/Trip changes
+        locations = form_data_logic.get_locations(form_data_logic.TRIP_LOCATION_TYPES)
+        unallocated_vehicles = form_data_logic.get_unallocated_vehicles()
+
+        # the cycle is rolled daily, so the data can't be older than today's midnight
+        last_modified = max(locations["last_modified"], unallocated_vehicles["last_modified"], cycle_logic.get_cycle_rolled_at(driver))
+        etag = http_cache.build_etag(locations["last_modified"], unallocated_vehicles["last_modified"], total_hours_worked)
+
+        not_modified = http_cache.get_not_modified_response(request, etag, last_modified)
+        if not_modified:
+            return not_modified
+
+        response = Response({
+            "vehicles": unallocated_vehicles["data"],
+            "locations": locations["data"],
             "current_cycle_used": total_hours_worked
         }, status=status.HTTP_200_OK)
 
+        return http_cache.set_validators(response, etag, last_modified)
+
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -86,6 +98,7 @@ def get_trip_form_data(request):
 @api_view([RequestTypes.POST])
 @permission_classes([IsAuthenticated])  # Require authentication
 @driver_profile_required
+@idempotent
 def create_trip(request):
     # Ensure the authenticated user has a driver profile
 
@@ -101,7 +114,7 @@ def create_trip(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     # Check if the driver already has an ongoing trip
-    if Trip.objects.filter(driver=driver, status=TripStatus.ONGOING).exists():
+    if trip_state_dao.get_active_trip(driver.id):
         return Response(
             {"error": "Driver already has an ongoing trip. Cannot create another one."},
             status=status.HTTP_400_BAD_REQUEST
@@ -115,17 +128,7 @@ def create_trip(request):
         )
 
     # Validate the 70-hour/8-day limit
-    last_8_days = now() - timedelta(days=8)
-
-    # Calculate total hours worked
-    total_hours_worked = (
-            Trip.objects.filter(driver=driver, end_dt__isnull=False, start_dt__gte=last_8_days)
-            .annotate(work_duration=ExpressionWrapper(F('end_dt') - F('start_dt'), output_field=fields.DurationField()))
-            .aggregate(total_hours=Sum(ExpressionWrapper(F('work_duration') / timedelta(hours=1), output_field=fields.FloatField())))
-            ['total_hours'] or 0
-    )
-
-    if total_hours_worked >= 70:
+    if cycle_logic.has_reached_cycle_limit(driver):
         return Response(
             {"error": "Driver has reached the 70-hour limit for the last 8 days. Cannot start a new trip."},
             status=status.HTTP_400_BAD_REQUEST
@@ -137,7 +140,16 @@ def create_trip(request):
 
     serializer = TripSerializer(data=data)
     if serializer.is_valid():
-        serializer.save()
+        try:
+            with transaction.atomic():
+                trip = serializer.save()
+                duty_event_logic.record_trip_start(trip)
+        except IntegrityError:
+            # a concurrent request started a trip for this driver or vehicle, see Trip.Meta.constraints
+            return Response(
+                {"error": "Driver or vehicle already has an ongoing trip."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -146,6 +158,7 @@ def create_trip(request):
 @api_view([RequestTypes.PUT])
 @permission_classes([IsAuthenticated])
 @driver_profile_required
+@idempotent
 def update_trip(request, pk):
     trip = get_object_or_404(Trip, pk=pk)
     serializer = TripSerializer(trip, data=request.data)
@@ -155,196 +168,102 @@ def update_trip(request, pk):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _get_rejection_response(outcome, errors):
+    """
+    @param errors: dict {TransitionOutcome: error message} of the rejections specific to the phase
+    """
+    if outcome == TransitionOutcome.NOT_FOUND:
+        return Response({"error": "Trip not found."}, status=status.HTTP_404_NOT_FOUND)
+    return Response({"error": errors[outcome]}, status=status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @driver_profile_required
+@idempotent
 def start_pickup(request):
-    try:
-
-        data = request.data.copy()
-
-        trip = Trip.objects.get(id=data.get('id'))
-        # Ensure the trip is ongoing and pickup is not yet completed
-        if trip.pickup_start_dt:
-            return Response(
-                {"error": "Pickup already ended for this trip."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        if trip.status != TripStatus.ONGOING:
-            return Response(
-                {"error": "Cannot end pickup for a non-ongoing trip."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Calculate pickup duration
-        trip.pickup_start_dt = now()
-        trip.save()
+    driver = request.user.driver_profile
 
-        return Response(
-            {"message": "Pickup ended successfully.", "pickup_duration": trip.pickup_duration},
-            status=status.HTTP_200_OK
-        )
+    # one conditional update, double taps are rejected by the database
+    outcome, trip = trip_logic.start_pickup(driver, request.data.get('id'))
+    if outcome != TransitionOutcome.DONE:
+        return _get_rejection_response(outcome, {
+            TransitionOutcome.ALREADY_DONE: "Pickup already started for this trip.",
+            TransitionOutcome.NOT_ONGOING: "Cannot start pickup for a non-ongoing trip.",
+        })
 
-    except Trip.DoesNotExist:
-        return Response(
-            {"error": "Trip not found."},
-            status=status.HTTP_404_NOT_FOUND
-        )
+    return Response(
+        {"message": "Pickup started successfully.", "pickup_duration": trip.pickup_duration},
+        status=status.HTTP_200_OK
+    )
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @driver_profile_required
+@idempotent
 def end_pickup(request):
-    try:
-        data = request.data.copy()
-
-        trip = Trip.objects.get(id=data.get('id'))
-
-        # Ensure the trip is ongoing and pickup is not yet completed
-        if trip.pickup_end_dt:
-            return Response(
-                {"error": "Pickup already ended for this trip."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        if trip.status != TripStatus.ONGOING:
-            return Response(
-                {"error": "Cannot end pickup for a non-ongoing trip."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Calculate pickup duration in minutes
-        trip.pickup_end_dt = now()
-        pickup_duration_minutes = (trip.pickup_end_dt - trip.pickup_start_dt).total_seconds() / 60  # Convert to minutes
-        trip.pickup_duration = max(60, round(pickup_duration_minutes, 2))  # Minimum 60 minutes
-
-        # Check for violations
-        violations = []
-        if trip.pickup_duration > 60:
-            violations.append(f"Pickup duration exceeded: {trip.pickup_duration} minutes")
-
-        # Save violations
-        trip.violations = ", ".join(violations) if violations else ""  # Store as a comma-separated string
-        trip.save()
+    driver = request.user.driver_profile
 
-        return Response(
-            {
-                "message": "Pickup ended successfully.",
-                "pickup_duration": trip.pickup_duration,
-                "violations": trip.violations
-            },
-            status=status.HTTP_200_OK
-        )
+    outcome, trip = trip_logic.end_pickup(driver, request.data.get('id'))
+    if outcome != TransitionOutcome.DONE:
+        return _get_rejection_response(outcome, {
+            TransitionOutcome.ALREADY_DONE: "Pickup already ended for this trip.",
+            TransitionOutcome.NOT_ONGOING: "Cannot end pickup for a non-ongoing trip.",
+            TransitionOutcome.OUT_OF_ORDER: "Pickup has not started for this trip.",
+        })
 
-    except Trip.DoesNotExist:
-        return Response(
-            {"error": "Trip not found."},
-            status=status.HTTP_404_NOT_FOUND
-        )
+    return Response(
+        {
+            "message": "Pickup ended successfully.",
+            "pickup_duration": trip.pickup_duration,
+            "violations": trip.violations
+        },
+        status=status.HTTP_200_OK
+    )
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @driver_profile_required
+@idempotent
 def start_drop_off(request):
-    try:
-        data = request.data.copy()
-
-        trip = Trip.objects.get(id=data.get('id'))
-
-        # Ensure the trip is ongoing and pickup is not yet completed
-        if trip.drop_off_start_dt:
-            return Response(
-                {"error": "Drop Off already started for this trip."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        if trip.status != TripStatus.ONGOING:
-            return Response(
-                {"error": "Cannot end pickup for a non-ongoing trip."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Calculate pickup duration
-        trip.drop_off_start_dt = now()
-        trip.save()
+    driver = request.user.driver_profile
 
-        return Response(
-            {"message": "Drop Off started successfully."},
-            status=status.HTTP_200_OK
-        )
+    outcome, trip = trip_logic.start_drop_off(driver, request.data.get('id'))
+    if outcome != TransitionOutcome.DONE:
+        return _get_rejection_response(outcome, {
+            TransitionOutcome.ALREADY_DONE: "Drop Off already started for this trip.",
+            TransitionOutcome.NOT_ONGOING: "Cannot start Drop Off for a non-ongoing trip.",
+            TransitionOutcome.OUT_OF_ORDER: "Pickup has not ended for this trip.",
+        })
 
-    except Trip.DoesNotExist:
-        return Response(
-            {"error": "Trip not found."},
-            status=status.HTTP_404_NOT_FOUND
-        )
+    return Response(
+        {"message": "Drop Off started successfully."},
+        status=status.HTTP_200_OK
+    )
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @driver_profile_required
+@idempotent
 def end_drop_off(request):
-    try:
-        data = request.data.copy()
-
-        driver = request.user.driver_profile
-
-        trip = Trip.objects.get(id=data.get('id'))
-
-        # Ensure the trip is ongoing and pickup is not yet completed
-        if trip.drop_off_end_dt:
-            return Response(
-                {"error": "Drop Off already ended for this trip."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        if trip.status != TripStatus.ONGOING:
-            return Response(
-                {"error": "Cannot end Drop Off for a non-ongoing trip."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Calculate pickup duration
-        trip.drop_off_end_dt = now()
-        trip.end_dt = now()
-        trip.status = TripStatus.ENDED
-        drop_off_duration = (trip.drop_off_end_dt - trip.drop_off_start_dt).total_seconds() / 60  # Convert to minutes
-        trip.drop_off_duration = max(60, round(drop_off_duration, 2))  # Minimum 1 hour
-        # Check for violations
-        violations = [trip.violations]
-        if trip.drop_off_duration > 60:
-            violations.append(f"Drop off duration exceeded: {trip.drop_off_duration} minutes")
-
-        # Save violations
-        trip.violations = ", ".join(violations) if violations else ""  # Store as a comma-separated string
-        trip.save()
-
-        # Calculate total driving and on-duty hours for the trip
-        total_driving_hours = trip.total_driving_hours()
-        total_on_duty_hours = trip.total_on_duty_hours()
-
-        # Create a DriverHos record for the trip
-        driver_hos = DriverHos.objects.create(
-            driver=driver,
-            date=trip.start_dt.date(),
-            total_driving_hours=total_driving_hours,
-            total_on_duty_hours=total_on_duty_hours
-        )
+    driver = request.user.driver_profile
 
-        if trip and driver_hos:
-            return Response(
-                {"message": "Drop Off ended successfully.", "Drop Off": trip.drop_off_duration},
-                status=status.HTTP_200_OK
-            )
+    outcome, trip = trip_logic.end_drop_off(driver, request.data.get('id'))
+    if outcome != TransitionOutcome.DONE:
+        return _get_rejection_response(outcome, {
+            TransitionOutcome.ALREADY_DONE: "Drop Off already ended for this trip.",
+            TransitionOutcome.NOT_ONGOING: "Cannot end Drop Off for a non-ongoing trip.",
+            TransitionOutcome.OUT_OF_ORDER: "Drop Off has not started for this trip.",
+        })
 
-    except Trip.DoesNotExist:
-        return Response(
-            {"error": "Trip not found."},
-            status=status.HTTP_404_NOT_FOUND
-        )
+    # the trip hours were booked with the transition
+    return Response(
+        {"message": "Drop Off ended successfully.", "Drop Off": trip.drop_off_duration},
+        status=status.HTTP_200_OK
+    )
 
 
 @api_view(['POST'])
@@ -354,30 +273,14 @@ def can_create_trip(request):
     driver = request.user.driver_profile
 
     # Check if the driver already has an ongoing trip
-    if Trip.objects.filter(driver=driver, status=TripStatus.ONGOING).exists():
+    if trip_state_dao.get_active_trip(driver.id):
         return Response(
             {"error": "Driver already has an ongoing trip. Cannot create another one."},
             status=status.HTTP_400_BAD_REQUEST
         )
 
     # Validate the 70-hour/8-day limit
-    last_8_days = now() - timedelta(days=8)
-
-    driver_obj = Driver.objects.filter(pk=driver.id).first()
-
-    # Calculate total hours worked
-    total_hours_worked = (
-            Trip.objects.filter(driver=driver, end_dt__isnull=False, start_dt__gte=last_8_days)
-            .annotate(work_duration=ExpressionWrapper(F('end_dt') - F('start_dt'), output_field=fields.DurationField()))
-            .aggregate(total_hours=Sum(ExpressionWrapper(F('work_duration') / timedelta(hours=1), output_field=fields.FloatField())))
-            ['total_hours'] or 0
-    )
-
-    driver_obj.current_cycle_used = total_hours_worked
-    driver_obj.save()
-    driver_obj.refresh_from_db()
-
-    if driver_obj.current_cycle_used >= 70:
+    if cycle_logic.has_reached_cycle_limit(driver):
         return Response(
             {"error": "Driver has reached the 70-hour limit for the last 8 days. Cannot start a new trip."},
             status=status.HTTP_400_BAD_REQUEST
@@ -393,52 +296,19 @@ def can_create_trip(request):
 def get_trip_trace(request):
     # Fetch the trip
 
-    trip_id = request.GET.get("id")
-    trip = get_object_or_404(Trip.objects.prefetch_related('restbreaks', 'fuelings'), id=trip_id)
-
-    actions = []
-
-    # Trip Start
-    actions.append({
-        "type": "Trip Start",
-        "_dt": trip.start_dt,
-        "location": serialize_location(trip.start_location),
-        "duration": None
-    })
-
-    # Rest Breaks
-    for rest in trip.restbreaks.all():
-        actions.append({
-            "type": "Rest Break",
-            "_dt": rest.start_dt,
-            "location": serialize_location(rest.location),
-            "duration": rest.duration
-        })
+    trip = redis_dao.get_trip(request.GET.get("id"))
+    if trip is None:
+        return Response({"detail": "No Trip matches the given query."}, status=status.HTTP_404_NOT_FOUND)
 
-    # Fueling
-    for fuel in trip.fuelings.all():
-        actions.append({
-            "type": "Fueling",
-            "_dt": fuel.created_dt,
-            "location": serialize_location(fuel.location),
-            "duration": fuel.duration
-        })
-
-    # Trip End
-    if trip.end_dt:
-        actions.append({
-            "type": "Trip End",
-            "_dt": trip.end_dt,
-            "location": serialize_location(trip.end_location),
-            "duration": None
-        })
-
-    # Sort all actions by datetime (_dt)
-    actions = sorted(actions, key=lambda x: x["_dt"])
+    # the actions are projected from the duty event log, already ordered by time, and the trip and its locations are
+    # read from the model cache instead of one query each
+    actions = duty_event_logic.get_trace(trip, duty_event_logic.get_trip_events(trip.id))
+    for action in actions:
+        action["location"] = serialize_location(redis_dao.get_location(action.pop("location_id")))
 
     return Response({
         "trip_id": trip.id,
-        "driver": trip.driver.id,
+        "driver": trip.driver_id,
         "actions": actions
     })
 
@@ -454,185 +324,69 @@ def get_driver_log_sheet(request):
         return Response({"error": "date is required."}, status=400)
 
     try:
-        # Fetch driver and related data
-        trips = Trip.objects.filter(driver=driver, created_dt__date=log_date)
-        rest_breaks = RestBreak.objects.filter(trip__driver=driver, created_dt__date=log_date)
-        fuelings = Fueling.objects.filter(trip__driver=driver, created_dt__date=log_date)
-
-        # Initialize log data structure
-        log_data = {
-            "driver": {
-                "name": driver.name,
-                "license": driver.license_number,
-            },
-            "date": log_date,
-            "logs": [],
-            "trip_events": [],
-            "daily_recap": {
-                "total_driving_hours": 0,
-                "total_on_duty_hours": 0,
-                "hours_available_tomorrow": 14,  # Default value
-                "miles_driven": 0,
-            },
-            "total_hours": {
-                "Off Duty": 0,
-                "Sleeper Berth": 0,
-                "Driving": 0,
-                "On Duty": 0,
-            },
-            "remarks": [],
-        }
+        log_date = parse_date(log_date)
+    except ValueError:
+        log_date = None
+
+    if not log_date:
+        return Response({"error": "date must be formatted as YYYY-MM-DD."}, status=400)
 
-        # Process trips
-        for trip in trips:
-            # Add trip start event
-            log_data["trip_events"].append({
-                "type": "Trip Start",
-                "timestamp": trip.start_dt.isoformat(),
-                "location": trip.start_location.name,
-                "odometer": trip.vehicle.current_mileage,
-            })
-
-            # Add trip end event
-            if trip.end_dt:
-                log_data["trip_events"].append({
-                    "type": "Trip End",
-                    "timestamp": trip.end_dt.isoformat(),
-                    "location": trip.end_location.name,
-                    "odometer": trip.vehicle.current_mileage,
-                })
-
-            # Add driving hours to daily recap
-            driving_hours = trip.total_driving_hours()
-            log_data["daily_recap"]["total_driving_hours"] += driving_hours
-            log_data["total_hours"]["Driving"] += driving_hours
-
-            # Add on-duty hours to daily recap
-            on_duty_hours = trip.total_on_duty_hours()
-            log_data["daily_recap"]["total_on_duty_hours"] += on_duty_hours
-            log_data["total_hours"]["On Duty"] += on_duty_hours
-
-            # Add miles driven
-            log_data["daily_recap"]["miles_driven"] += trip.distance
-
-            # Add remarks for trip locations
-            log_data["remarks"].append(trip.start_location.name)
-            log_data["remarks"].append(trip.end_location.name)
-
-        # Process rest breaks
-        for rest in rest_breaks:
-            # Add rest break event
-            log_data["trip_events"].append({
-                "type": "Rest Break",
-                "timestamp": rest.start_dt.isoformat(),
-                "location": rest.location.name,
-                "odometer": rest.trip.vehicle.current_mileage,
-            })
-
-            # Add rest break hours to total hours
-            rest_hours = rest.duration / 60 if rest.duration else 0  # Convert minutes to hours
-            log_data["total_hours"]["Sleeper Berth"] += rest_hours
-
-        # Process fuelings
-        for fuel in fuelings:
-            # Add fueling event
-            log_data["trip_events"].append({
-                "type": "Fuel Stop",
-                "timestamp": fuel.created_dt.isoformat(),
-                "location": fuel.location.name,
-                "odometer": fuel.mileage_at_fueling,
-            })
-
-        # Generate logs based on duty status changes
-        log_data["logs"] = generate_duty_status_logs(driver, log_date)
-
-        # Format daily recap hours
-        log_data["daily_recap"]["total_driving_hours"] = f"{log_data['daily_recap']['total_driving_hours']} hrs"
-        log_data["daily_recap"]["total_on_duty_hours"] = f"{log_data['daily_recap']['total_on_duty_hours']} hrs"
-        log_data["daily_recap"]["miles_driven"] = f"{log_data['daily_recap']['miles_driven']} miles"
-
-        return Response(log_data)
+    try:
+        return Response(log_sheet_logic.get_driver_log_sheet(driver, log_date))
 
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-def generate_duty_status_logs(driver, log_date):
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_driver_log_sheets(request):
     """
-    Generate logs based on duty status changes for the driver on the specified date.
+    Log sheets of every day between 'start_date' and 'end_date' (inclusive), streamed as NDJSON:
+    one log sheet per line, ordered by driver then date.
+    Staff users can export several drivers with the comma separated 'driver_ids'.
     """
-    logs = []
-
-    # Fetch all duty status changes for the driver on the specified date
-    trips = Trip.objects.filter(driver=driver, start_dt__date=log_date).order_by('start_dt')
-    rest_breaks = RestBreak.objects.filter(trip__driver=driver, start_dt__date=log_date).order_by('start_dt')
-
-    # Initialize variables to track duty status changes
-    current_status = "Off Duty"
-    current_start_time = None
-
-    # Process trips and rest breaks to generate logs
-    for trip in trips:
-        # Convert start and end times to quarter-hour precision
-        start_hour = trip.start_dt.hour + (trip.start_dt.minute / 60.0)
-        pickup_start_hour = trip.pickup_start_dt.hour + (trip.pickup_start_dt.minute / 60.0) if trip.pickup_start_dt else None
-        pickup_end_hour = trip.pickup_end_dt.hour + (trip.pickup_end_dt.minute / 60.0) if trip.pickup_end_dt else None
-        end_hour = trip.end_dt.hour + (trip.end_dt.minute / 60.0) if trip.end_dt else None
-
-        # Add Off Duty to Driving transition
-        if current_status == "Off Duty":
-            logs.append({
-                "startHour": current_start_time.hour + (current_start_time.minute / 60.0) if current_start_time else 0,
-                "endHour": start_hour,
-                "status": current_status,
-            })
-            current_status = "Driving"
-            current_start_time = trip.start_dt
-
-        # Add Driving to On Duty transition (e.g., after pickup/drop-off)
-        if trip.pickup_start_dt and trip.pickup_end_dt:
-            logs.append({
-                "startHour": start_hour,
-                "endHour": pickup_start_hour,
-                "status": "Driving",
-            })
-            logs.append({
-                "startHour": pickup_start_hour,
-                "endHour": pickup_end_hour,
-                "status": "On Duty",
-            })
-            current_status = "Driving"
-            current_start_time = trip.pickup_end_dt
-
-        # Add Driving to Off Duty transition (e.g., after trip ends)
-        if trip.end_dt:
-            logs.append({
-                "startHour": current_start_time.hour + (current_start_time.minute / 60.0),
-                "endHour": end_hour,
-                "status": current_status,
-            })
-            current_status = "Off Duty"
-            current_start_time = trip.end_dt
-
-    # Process rest breaks to add Sleeper Berth status
-    for rest in rest_breaks:
-        rest_start_hour = rest.start_dt.hour + (rest.start_dt.minute / 60.0)
-        rest_end_hour = rest.end_dt.hour + (rest.end_dt.minute / 60.0) if rest.end_dt else rest_start_hour + 0.25  # Default 15 minutes
-
-        logs.append({
-            "startHour": rest_start_hour,
-            "endHour": rest_end_hour,
-            "status": "Sleeper Berth",
-        })
+    try:
+        start_date = parse_date(request.GET.get("start_date") or "")
+        end_date = parse_date(request.GET.get("end_date") or "")
+    except ValueError:
+        start_date = end_date = None
+
+    if not start_date or not end_date:
+        return Response({"error": "start_date and end_date are required, formatted as YYYY-MM-DD."}, status=400)
+
+    if start_date > end_date:
+        return Response({"error": "start_date must be before end_date."}, status=400)
+
+    if (end_date - start_date).days >= log_sheet_logic.RANGE_MAX_DAYS:
+        return Response({"error": f"The range cannot exceed {log_sheet_logic.RANGE_MAX_DAYS} days."}, status=400)
+
+    driver_ids = request.GET.get("driver_ids")
+    if driver_ids:
+        if not request.user.is_staff:
+            return Response({"error": "Only staff users can export the log sheets of other drivers."}, status=403)
+        try:
+            driver_ids = [int(driver_id) for driver_id in driver_ids.split(",") if driver_id]
+        except ValueError:
+            return Response({"error": "driver_ids must be a comma separated list of ids."}, status=400)
+        drivers = list(Driver.objects.filter(id__in=driver_ids).order_by('id'))
+    elif hasattr(request.user, 'driver_profile'):
+        drivers = [request.user.driver_profile]
+    else:
+        return Response(
+            {"error": "Authenticated user is not associated with a driver profile"},
+            status=status.HTTP_403_FORBIDDEN
+        )
 
-    # Add the final Off Duty status if needed
-    if current_status != "Off Duty":
-        logs.append({
-            "startHour": current_start_time.hour + (current_start_time.minute / 60.0),
-            "endHour": 24.0,  # End of the day
-            "status": current_status,
-        })
+    def _stream():
+        _now = now()
+        for driver in drivers:
+            for _, log_sheet in log_sheet_logic.iter_driver_log_sheets(driver, start_date, end_date, now=_now):
+                yield json.dumps({"driver_id": driver.id, **log_sheet}, cls=DjangoJSONEncoder) + "\n"
 
-    return logs
+    response = StreamingHttpResponse(_stream(), content_type="application/x-ndjson")
+    response["Content-Disposition"] = f'attachment; filename="log_sheets_{start_date}_{end_date}.ndjson"'
+    return response
 
 
 def serialize_location(location):
@@ -657,4 +411,5 @@ urls = [
     path('end_drop_off', end_drop_off, name='end_drop_off'),
     path('get_trip_trace', get_trip_trace, name='get_trip_trace'),
     path('get_driver_log_sheet', get_driver_log_sheet, name='get_driver_log_sheet'),
+    path('get_driver_log_sheets', get_driver_log_sheets, name='get_driver_log_sheets'),
 ]